@@ -1,98 +1,157 @@
-
-"""
-This module:
-1. Identify peak admission times.
-Aggregates admissions by hour and day of week.
-Presenting output by histograms for identifying
-highlights Peak admission times, for staffing optimization
-
-2. Analyze discharge destinations, Groups by discharge_location
-Shows volume and percentage of discharges to each destination.
-
- Requirments, file formats of admissions.csv.
- Demo files are in the README link
-"""
-
-
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime
-from typing import Optional
-
-
-class AdmissionsAnalyzer:
-    def __init__(self, admissions_df: pd.DataFrame):
-        self.df = admissions_df.copy()
-        self._prepare_data()
-
-    def _prepare_data(self):
-        """Convert admittime to datetime and extract hour/day features."""
-        self.df["admittime"] = pd.to_datetime(self.df["admittime"], errors="coerce")
-        self.df.dropna(subset=["admittime"], inplace=True)
-        self.df["hour"] = self.df["admittime"].dt.hour
-        self.df["day_of_week"] = self.df["admittime"].dt.day_name()
-
-    def peak_admission_times(self) -> pd.DataFrame:
-        """Return admission counts by hour and day of week."""
-        hourly = self.df.groupby("hour").size().reset_index(name="admissions")
-        daily = self.df.groupby("day_of_week").size().reset_index(name="admissions")
-
-        # Sort days in calendar order
-        day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        daily["day_of_week"] = pd.Categorical(daily["day_of_week"], categories=day_order, ordered=True)
-        daily = daily.sort_values("day_of_week")
-
-        return hourly, daily
-
-    def plot_peak_admission_times(self):
-        """Generate bar charts for admissions by hour and day of week."""
-        hourly, daily = self.peak_admission_times()
-
-        # Bar chart: Admissions by Hour
-        plt.figure(figsize=(10, 5))
-        plt.bar(hourly["hour"], hourly["admissions"], color="skyblue")
-        plt.title("📈 Admissions by Hour")
-        plt.xlabel("Hour of Day")
-        plt.ylabel("Number of Admissions")
-        plt.xticks(range(0, 24))
-        plt.grid(axis="y", linestyle="--", alpha=0.7)
-        plt.tight_layout()
-        plt.show()
-
-        # Bar chart: Admissions by Day of Week
-        plt.figure(figsize=(10, 5))
-        plt.bar(daily["day_of_week"], daily["admissions"], color="salmon")
-        plt.title("📅 Admissions by Day of Week")
-        plt.xlabel("Day")
-        plt.ylabel("Number of Admissions")
-        plt.grid(axis="y", linestyle="--", alpha=0.7)
-        plt.tight_layout()
-        plt.show()
-
-    def discharge_destination_summary(self) -> pd.DataFrame:
-        """Return discharge location counts and percentages."""
-        discharge_counts = (
-            self.df["discharge_location"]
-            .fillna("UNKNOWN")
-            .value_counts()
-            .reset_index()
-        )
-        discharge_counts.columns = ["discharge_location", "count"]
-        discharge_counts["percent"] = (
-            discharge_counts["count"] / discharge_counts["count"].sum() * 100
-        ).round(2)
-        return discharge_counts
-
-
-# Example usage
-if __name__ == "__main__":
-    path = "enter full path for, admissions.csv"
-    df = pd.read_csv(path)
-    analyzer = AdmissionsAnalyzer(df)
-
-    # Show bar charts for staffing optimization
-    analyzer.plot_peak_admission_times()
-
-    # Optional: print discharge summary
-    discharge_summary = analyzer.discharge_destination_summary()
-    print("\n🏥 Discharge Destination Summary:\n", discharge_summary)
+
+"""
+This module:
+1. Identify peak admission times.
+Aggregates admissions by hour and day of week.
+Presenting output by histograms for identifying
+highlights Peak admission times, for staffing optimization
+
+2. Analyze discharge destinations, Groups by discharge_location
+Shows volume and percentage of discharges to each destination.
+
+3. Time-windowed peaks, count_cube returns a [week, weekday, hour, admission_type]
+count cube for weekly/monthly heatmaps and rolling windows.
+
+4. Approximate discharge summary, discharge_destination_summary(approximate=True)
+answers from a mergeable Space-Saving sketch of the source file (see sketches).
+
+ Requirments, file formats of admissions.csv.
+ Demo files are in the README link
+"""
+
+
+import os
+import pandas as pd
+import matplotlib.pyplot as plt
+from datetime import datetime
+from typing import Dict, Optional
+
+from admissions_engine import AdmissionCountCube, AdmissionsEngine, AdmissionsResults
+from chart_rendering import ChartRenderer
+from instrumentation import Instrumented
+from mimic_cache import read_table
+from sketches import AdmissionsSketchSummary, load_or_build
+
+
+class AdmissionsAnalyzer(Instrumented):
+    def __init__(self, admissions_df: pd.DataFrame, source_path: Optional[str] = None):
+        self.admissions_df = admissions_df
+        self.source_path = source_path
+        self._engine: Optional[AdmissionsEngine] = None
+        # Engine metric -> its results, each computed once
+        self._results: Dict[str, AdmissionsResults] = {}
+
+    @property
+    def engine(self) -> AdmissionsEngine:
+        """
+        The engine, created on first use: the approximate discharge summary never parses admittime.
+        """
+        if self._engine is None:
+            # The engine parses admittime once with the fast MIMIC-format parser, no copy of the input.
+            # With the source file of admissions_df the parsed times are cached next to it for later runs.
+            with self.stage("parse", rows_in=self.admissions_df) as stage:
+                self._engine = AdmissionsEngine(self.admissions_df, source_path=self.source_path)
+                stage.output(self._engine.admit_ns)
+        return self._engine
+
+    def results(self, metric: str) -> AdmissionsResults:
+        """
+        Results of one engine metric ("peaks" or "discharge"), computed once by the
+        shared engine; dischtime and LOS are never parsed or computed here.
+        """
+        if metric not in self._results:
+            with self.stage(f"aggregate_{metric}", rows_in=self.engine.df):
+                self._results[metric] = self.engine.run([metric])
+        return self._results[metric]
+
+    def peak_admission_times(self) -> pd.DataFrame:
+        """Return admission counts by hour and day of week."""
+        results = self.results("peaks")
+        return results.hourly, results.daily
+
+    def count_cube(self, category_column: Optional[str] = "admission_type",
+                   cube: Optional[AdmissionCountCube] = None) -> AdmissionCountCube:
+        """
+        Return a [week, weekday, hour, category] count cube of the admissions, for
+        per-week/month heatmaps, rolling 4-week windows and admission_type breakdowns.
+        Pass a saved cube to add these admissions to it incrementally.
+        """
+        return self.engine.count_cube(category_column, cube)
+
+    def plot_peak_admission_times(self, save_dir: Optional[str] = None, fmt: str = "png"):
+        """
+        Generate bar charts for admissions by hour and day of week.
+
+        With save_dir the charts are rendered headless (Agg) and written to
+        save_dir/admissions_by_hour.<fmt> and admissions_by_day.<fmt> instead
+        of being shown; the written paths are returned.
+        """
+        hourly, daily = self.peak_admission_times()
+        if save_dir is not None:
+            renderer = ChartRenderer()
+            return [
+                renderer.render_hourly(hourly, os.path.join(save_dir, f"admissions_by_hour.{fmt}")),
+                renderer.render_daily(daily, os.path.join(save_dir, f"admissions_by_day.{fmt}")),
+            ]
+
+        # Bar chart: Admissions by Hour
+        plt.figure(figsize=(10, 5))
+        plt.bar(hourly["hour"], hourly["admissions"], color="skyblue")
+        plt.title("📈 Admissions by Hour")
+        plt.xlabel("Hour of Day")
+        plt.ylabel("Number of Admissions")
+        plt.xticks(range(0, 24))
+        plt.grid(axis="y", linestyle="--", alpha=0.7)
+        plt.tight_layout()
+        plt.show()
+
+        # Bar chart: Admissions by Day of Week
+        plt.figure(figsize=(10, 5))
+        plt.bar(daily["day_of_week"], daily["admissions"], color="salmon")
+        plt.title("📅 Admissions by Day of Week")
+        plt.xlabel("Day")
+        plt.ylabel("Number of Admissions")
+        plt.grid(axis="y", linestyle="--", alpha=0.7)
+        plt.tight_layout()
+        plt.show()
+
+    def discharge_destination_summary(self, approximate: bool = False,
+                                      sketch_path: Optional[str] = None) -> pd.DataFrame:
+        """
+        Return discharge location counts and percentages.
+
+        approximate=True sketches the source file in one chunked pass instead
+        (lower_bound and guaranteed columns give the error; error bounds are in
+        AdmissionsSketchSummary.error_bounds). sketch_path keeps the sketch between runs.
+        """
+        if not approximate:
+            return self.results("discharge").discharge
+        if self.source_path is None:
+            raise ValueError("The approximate summary needs the source_path of the admissions.")
+        with self.stage("aggregate_sketch") as stage:
+            summary = load_or_build(AdmissionsSketchSummary, self.source_path, sketch_path)
+            stage.rows_in = summary.rows
+            return stage.output(summary.discharge_destination_summary())
+
+
+# Example usage
+if __name__ == "__main__":
+    path = "enter full path for, admissions.csv"
+    # admittime is parsed once and cached next to the file; later runs skip loading and parsing it
+    df = read_table(path, columns=["discharge_location", "admission_type"])
+    analyzer = AdmissionsAnalyzer(df, source_path=path)
+
+    # Show bar charts for staffing optimization
+    analyzer.plot_peak_admission_times()
+
+    # On servers without a display, write PNG/SVG files instead
+    # analyzer.plot_peak_admission_times(save_dir="charts", fmt="svg")
+
+    # Hour × weekday heatmaps per month and rolling 4-week windows, by admission type
+    # cube = analyzer.count_cube("admission_type")
+    # print(cube.monthly_heatmaps())
+    # print(cube.rolling_heatmaps(window_weeks=4, category="EW EMER."))
+
+    # Optional: print discharge summary
+    discharge_summary = analyzer.discharge_destination_summary()
+    print("\n🏥 Discharge Destination Summary:\n", discharge_summary)
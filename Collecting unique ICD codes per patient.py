@@ -1,84 +1,257 @@
-import pandas as pd
-
-class ICDAnalyzer:
-    """
-    A class to analyze ICD codes from the MIMIC-III diagnoses dataset.
-    Collecting all ICD codes of each patient from a disordered database and export it to a csv file where each patient (subject_id)
-    has a raw listing all of his ICD codes Requirements MIMIC 1. diagnoses_icd.csv database. 2. unique_icd_per_patient.csv database file
-    Demo database files are in the MIMIC link in README
-
-    This class also returns the top N ICD codes and their percentage of total ICD code occurrences in the database.
-    """
-
-    def __init__(self, filepath: str):
-        """
-        Initialize the analyzer with the path to the CSV file.
-        """
-        filepath = "enter here the full path to diagnoses_icd.csv file" 
-        self.filepath = filepath
-        self.df = self._load_data()
-
-    def _load_data(self) -> pd.DataFrame:
-        """
-        Load the CSV file into a pandas DataFrame.
-        """
-        try:
-            df = pd.read_csv(self.filepath)
-            required_cols = {'subject_id', 'icd_code'}
-            if not required_cols.issubset(df.columns):
-                raise ValueError("Missing required columns in dataset.")
-            return df
-        except Exception as e:
-            raise RuntimeError(f"Failed to load data: {e}")
-
-    def get_unique_icd_per_patient(self) -> pd.DataFrame:
-        """
-        Returns a DataFrame with one row per subject_id and a list of unique ICD codes.
-        """
-        unique_icd = self.df.groupby('subject_id')['icd_code'].unique().reset_index()
-        unique_icd['unique_icd_count'] = unique_icd['icd_code'].apply(len)
-        return unique_icd
-
-    def export_unique_icd_to_csv(self, output_path: str):
-        """
-        Exports the unique ICD codes per subject_id to a CSV file.
-        """
-        unique_icd_df = self.get_unique_icd_per_patient()
-
-        # Convert list of ICD codes to a comma-separated string for CSV readability
-        unique_icd_df['icd_code'] = unique_icd_df['icd_code'].apply(lambda codes: ', '.join(codes))
-
-        # Save to CSV
-        output_path = "enter here the full path to the file, unique_icd_per_patient.csv" 
-        unique_icd_df.to_csv(output_path, index=False)
-        print(f"✅ Unique ICD codes per patient exported to: {output_path}")
-
-    def run_analysis(self):
-        """
-        Run all analyses and print results.
-        """
-        print("🔍 Average number of unique ICD codes per patient:")
-        avg_icd = self.get_unique_icd_per_patient()['unique_icd_count'].mean()
-        print(f"→ {round(avg_icd, 2)} ICD codes per patient on average\n")
-
-        print("📁 Exporting unique ICD codes per patient to CSV...")
-        self.export_unique_icd_to_csv("unique_icd_per_patient.csv")
-
-        print("\n🔥 Top 10 ICD codes and their percentage of total:")
-        top_icd_df = self.get_top_icd_codes()
-        print(top_icd_df)
-
-    def get_top_icd_codes(self, top_n: int = 10) -> pd.DataFrame:
-        """
-        Returns the top N ICD codes and their percentage of total ICD code occurrences.
-        """
-        icd_counts = self.df['icd_code'].value_counts().head(top_n).reset_index()
-        icd_counts.columns = ['icd_code', 'count']
-        total_codes = self.df['icd_code'].count()
-        icd_counts['percentage'] = (icd_counts['count'] / total_codes * 100).round(2)
-        return icd_counts
-
-# Example usage:
-if __name__ == "__main__":
-    analyzer = ICDAnalyzer("diagnoses_icd.csv")
-    analyzer.run_analysis()
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from instrumentation import Instrumented
+from mimic_cache import read_table
+import sql_backend
+from sketches import ICDSketchSummary, load_or_build
+from unique_icd_export import EXPORT_CHUNKSIZE, export_unique_icd
+
+class ICDAnalyzer(Instrumented):
+    """
+    A class to analyze ICD codes from the MIMIC-III diagnoses dataset.
+    Collecting all ICD codes of each patient from a disordered database and export it to a csv file where each patient (subject_id)
+    has a raw listing all of his ICD codes Requirements MIMIC 1. diagnoses_icd.csv database. 2. unique_icd_per_patient.csv database file
+    Demo database files are in the MIMIC link in README
+
+    This class also returns the top N ICD codes and their percentage of total ICD code occurrences in the database.
+
+    For modeling, build_incidence_matrix returns the same information as a sparse patient × ICD code
+    matrix (scipy CSR), and export_incidence_npz saves it with its row and column vocabularies
+    and each patient's unique_icd_count (the row nnz).
+
+    Load, aggregate and export stages are recorded in self.instrumentation.
+
+    With backend="duckdb", get_unique_icd_per_patient and get_top_icd_codes run as
+    DuckDB queries over the file (see sql_backend) and the table is only loaded
+    into pandas when another method needs it.
+
+    With approximate=True, get_top_icd_codes and mean_unique_icd_count answer
+    from mergeable sketches of the file (see sketches.ICDSketchSummary) in one
+    chunked pass, with error bounds in self.sketch().error_bounds(). A
+    sketch_path keeps the sketches between runs.
+    """
+
+    def __init__(self, filepath: str, backend: str = "pandas", approximate: bool = False,
+                 sketch_path: Optional[str] = None):
+        """
+        Initialize the analyzer with the path to the CSV file.
+        backend : "pandas" (default) or "duckdb".
+        approximate : answer from sketches instead of exact counts.
+        sketch_path : .npz file to load the sketches from, or save them to.
+        """
+        self.filepath = filepath
+        self.backend = sql_backend.check_backend(backend)
+        self.approximate = approximate
+        self.sketch_path = sketch_path
+        self._sketch: Optional[ICDSketchSummary] = None
+        # Loaded on first use, so methods answered by duckdb or the sketches never read it
+        self._df = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """The diagnoses (subject_id, icd_code), loaded on first use."""
+        if self._df is None:
+            self._df = self._load_data()
+        return self._df
+
+    def _load_data(self) -> pd.DataFrame:
+        """
+        Load the CSV file into a pandas DataFrame.
+        """
+        try:
+            with self.stage("load") as stage:
+                return stage.output(read_table(self.filepath, columns=['subject_id', 'icd_code']))
+        except Exception as e:
+            raise RuntimeError(f"Failed to load data: {e}")
+
+    def get_unique_icd_per_patient(self) -> pd.DataFrame:
+        """
+        Returns a DataFrame with one row per subject_id and a list of unique ICD codes.
+        """
+        if self.backend == "duckdb":
+            with self.stage("aggregate_unique_icd_duckdb") as stage:
+                return stage.output(sql_backend.unique_icd_per_patient(self.filepath))
+        with self.stage("aggregate_unique_icd", rows_in=self.df) as stage:
+            grouped = self.df.groupby('subject_id')['icd_code']
+            unique_icd = grouped.unique().reset_index()
+            # Counted by the groupby (Cython) instead of len() of every list; missing codes are not counted
+            unique_icd['unique_icd_count'] = grouped.nunique().to_numpy()
+            return stage.output(unique_icd)
+
+    def sketch(self) -> ICDSketchSummary:
+        """Sketches of the diagnoses, built once per analyzer."""
+        if self._sketch is None:
+            with self.stage("sketch") as stage:
+                self._sketch = load_or_build(ICDSketchSummary, self.filepath, self.sketch_path)
+                stage.rows_in = self._sketch.rows
+        return self._sketch
+
+    def mean_unique_icd_count(self) -> float:
+        """Average number of unique ICD codes per patient."""
+        if self.approximate:
+            return self.sketch().mean_unique_icd_per_patient()
+        return self.get_unique_icd_per_patient()['unique_icd_count'].mean()
+
+    def export_unique_icd_to_csv(self, output_path: str):
+        """
+        Exports the unique ICD codes per subject_id to a CSV file.
+        """
+        unique_icd_df = self.get_unique_icd_per_patient()
+
+        # Convert list of ICD codes to a comma-separated string for CSV readability
+        with self.stage("format", rows_in=unique_icd_df) as stage:
+            unique_icd_df['icd_code'] = unique_icd_df['icd_code'].apply(lambda codes: ', '.join(codes))
+            stage.output(unique_icd_df)
+
+        # Save to CSV
+        with self.stage("export", rows_in=unique_icd_df) as stage:
+            unique_icd_df.to_csv(output_path, index=False)
+            stage.output(unique_icd_df)
+        print(f"✅ Unique ICD codes per patient exported to: {output_path}")
+
+    def export_unique_icd(self, output_path: str, chunksize: int = EXPORT_CHUNKSIZE,
+                          partitions: Optional[int] = None) -> int:
+        """
+        Streaming version of export_unique_icd_to_csv with flat peak memory.
+
+        Reads the diagnoses file in chunks and writes each patient's row as soon as
+        the patient is complete. output_path may end in .csv, .csv.gz, .csv.zst or
+        .parquet (icd_code as a list column). See unique_icd_export for details.
+        Returns the number of patients written.
+        """
+        with self.stage("export_streaming") as stage:
+            patients = export_unique_icd(self.filepath, output_path, chunksize=chunksize, partitions=partitions)
+            stage.rows_out = patients
+        print(f"✅ Unique ICD codes of {patients} patients exported to: {output_path}")
+        return patients
+
+    def build_incidence_matrix(self) -> tuple[sp.csr_matrix, np.ndarray, np.ndarray]:
+        """
+        Build a binary patient × ICD code incidence matrix.
+
+        subject_id and icd_code are factorized into integer codes, duplicate
+        (patient, code) pairs are removed, and the CSR arrays are built directly.
+
+        Returns
+        -------
+        tuple
+            (matrix, subject_ids, icd_codes) where row i of matrix belongs to
+            subject_ids[i] and column j to icd_codes[j]. The number of unique ICD
+            codes of each patient is the row nnz, np.diff(matrix.indptr).
+        """
+        with self.stage("factorize", rows_in=self.df):
+            row_codes, subject_ids = pd.factorize(self.df['subject_id'], sort=True)
+            col_codes, icd_codes = pd.factorize(self.df['icd_code'], sort=True)
+
+        # factorize marks missing values with -1
+        valid = (row_codes >= 0) & (col_codes >= 0)
+        n_rows, n_cols = len(subject_ids), len(icd_codes)
+
+        # One int64 key per (patient, code) pair; np.unique both deduplicates and sorts by row then column
+        pair_keys = np.unique(row_codes[valid].astype(np.int64) * n_cols + col_codes[valid])
+        rows = pair_keys // n_cols
+        indices = (pair_keys % n_cols).astype(np.int32)
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+
+        matrix = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.uint8), indices, indptr),
+            shape=(n_rows, n_cols)
+        )
+        return matrix, np.asarray(subject_ids), np.asarray(icd_codes).astype(str)
+
+    def export_incidence_npz(self, output_path: str) -> str:
+        """
+        Save the incidence matrix to output_path (.npz) and its vocabularies
+        (subject_ids, icd_codes) next to it as <name>_vocab.npz. The vocabulary
+        file also holds unique_icd_count, the row nnz np.diff(matrix.indptr),
+        aligned with subject_ids (see load_unique_icd_counts).
+        Returns the vocabulary file path.
+        """
+        matrix, subject_ids, icd_codes = self.build_incidence_matrix()
+        sp.save_npz(output_path, matrix)
+
+        vocab_path = f"{os.path.splitext(output_path)[0]}_vocab.npz"
+        np.savez(vocab_path, subject_ids=subject_ids, icd_codes=icd_codes,
+                 unique_icd_count=np.diff(matrix.indptr))
+
+        print(f"✅ Incidence matrix ({matrix.shape[0]} patients × {matrix.shape[1]} ICD codes) exported to: {output_path}")
+        return vocab_path
+
+    @staticmethod
+    def load_incidence_npz(output_path: str) -> tuple[sp.csr_matrix, np.ndarray, np.ndarray]:
+        """
+        Load a matrix saved by export_incidence_npz with its vocabularies.
+        """
+        matrix = sp.load_npz(output_path)
+        with np.load(f"{os.path.splitext(output_path)[0]}_vocab.npz") as vocab:
+            return matrix, vocab['subject_ids'], vocab['icd_codes']
+
+    @staticmethod
+    def load_unique_icd_counts(output_path: str) -> pd.DataFrame:
+        """
+        subject_id and unique_icd_count of an export_incidence_npz export, without loading the matrix.
+        """
+        with np.load(f"{os.path.splitext(output_path)[0]}_vocab.npz") as vocab:
+            return pd.DataFrame({'subject_id': vocab['subject_ids'], 'unique_icd_count': vocab['unique_icd_count']})
+
+    def run_analysis(self):
+        """
+        Run all analyses and print results.
+        """
+        print("🔍 Average number of unique ICD codes per patient:")
+        avg_icd = self.mean_unique_icd_count()
+        print(f"→ {round(avg_icd, 2)} ICD codes per patient on average\n")
+
+        print("📁 Exporting unique ICD codes per patient to CSV...")
+        self.export_unique_icd_to_csv("unique_icd_per_patient.csv")
+
+        print("\n🔥 Top 10 ICD codes and their percentage of total:")
+        top_icd_df = self.get_top_icd_codes()
+        print(top_icd_df)
+
+    def get_top_icd_codes(self, top_n: int = 10) -> pd.DataFrame:
+        """
+        Returns the top N ICD codes and their percentage of total ICD code occurrences.
+        In approximate mode the counts are upper bounds, with lower_bound,
+        distinct_patients and guaranteed columns (see ICDSketchSummary.top_icd_codes).
+        """
+        if self.approximate:
+            with self.stage("aggregate_top_icd_sketch") as stage:
+                return stage.output(self.sketch().top_icd_codes(top_n))
+        if self.backend == "duckdb":
+            with self.stage("aggregate_top_icd_duckdb") as stage:
+                return stage.output(sql_backend.top_icd_codes(self.filepath, top_n))
+        with self.stage("aggregate_top_icd", rows_in=self.df) as stage:
+            icd_counts = self.df['icd_code'].value_counts()
+            icd_counts = icd_counts[icd_counts > 0].head(top_n).reset_index()
+            icd_counts.columns = ['icd_code', 'count']
+            total_codes = self.df['icd_code'].count()
+            icd_counts['percentage'] = (icd_counts['count'] / total_codes * 100).round(2)
+            return stage.output(icd_counts)
+
+# Example usage:
+if __name__ == "__main__":
+    analyzer = ICDAnalyzer("diagnoses_icd.csv")
+    analyzer.run_analysis()
+
+    # For multi-GB files, stream the export with flat peak memory (.csv, .csv.gz, .csv.zst or .parquet)
+    # analyzer.export_unique_icd("unique_icd_per_patient.csv.gz")
+
+    # Sparse patient × ICD code matrix for comorbidity models
+    analyzer.export_incidence_npz("icd_incidence.npz")
+
+    # Where the time went: load, aggregate, format and export stages
+    analyzer.instrumentation.print_summary()
+
+    # Run the aggregations in DuckDB directly over the file (pip install duckdb)
+    # analyzer = ICDAnalyzer("diagnoses_icd.csv", backend="duckdb")
+
+    # Approximate answers in one pass from sketches, kept for later runs and mergeable across sites
+    # analyzer = ICDAnalyzer("diagnoses_icd.csv", approximate=True, sketch_path="diagnoses_icd.sketch.npz")
+    # print(analyzer.get_top_icd_codes(10), analyzer.sketch().error_bounds())
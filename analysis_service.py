@@ -0,0 +1,327 @@
+"""
+Long-running local service that keeps the MIMIC tables resident and answers analyzer queries.
+
+Every analysis script is a one-shot program that pays for interpreter start-up,
+the pandas import and a table load to print one result. This service loads
+each table once, through the analyzer classes (see analyzers.py), keeps the
+analyzers in memory and answers their methods as parameterized HTTP queries on
+localhost:
+
+    python analysis_service.py --data-dir /data/mimic-iv/hosp --port 8765
+
+    GET /queries                                  available queries and their tables
+    GET /query/gender_distribution
+    GET /query/top_icd_codes?top_n=20
+    GET /query/top_icd?top_n=10
+    GET /query/peak_admission_times
+    GET /query/approx_top_icd_codes?top_n=20     answered from sketches (see sketches.py)
+    GET /health
+
+Results are JSON ({"query", "params", "result", "cached", "elapsed_ms"}) and are
+kept in an LRU cache. Before answering, the service compares the size and
+mtime of every source file the query uses with the version it loaded. A
+changed file evicts the resident analyzer, and all cached results computed
+from older versions are dropped, so the next answer is computed from the new
+file.
+
+The service binds to 127.0.0.1 only and has no authentication; do not expose it.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import analyzers
+from admissions_engine import AdmissionsEngine
+from instrumentation import Instrumented
+from sketches import AdmissionsSketchSummary, ICDSketchSummary
+
+DEFAULT_PORT = 8765
+RESULT_CACHE_SIZE = 256
+# Stage records kept per resident analyzer; every uncached query adds some
+RESIDENT_STAGE_RECORDS = 100
+
+# Table name -> default file name in --data-dir
+TABLE_FILES = {
+    "patients": "patients.csv",
+    "admissions": "admissions.csv",
+    "diagnoses_icd": "diagnoses_icd.csv",
+    "d_icd_diagnoses": "d_icd_diagnoses.csv",
+    "labevents": "labevents.csv",
+    "d_labitems": "d_labitems.csv",
+}
+# Tables a query also runs without (top_icd without descriptions); their version is None when not configured
+OPTIONAL_TABLES = ("d_icd_diagnoses",)
+
+
+def _source_version(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def to_json_ready(result: Any) -> Any:
+    """DataFrames, Series and numpy values as plain JSON values."""
+    if isinstance(result, pd.DataFrame):
+        frame = result.astype(object).where(result.notna(), None)
+        return {"columns": [str(col) for col in frame.columns], "rows": frame.to_dict(orient="records")}
+    if isinstance(result, pd.Series):
+        return {str(key): to_json_ready(value) for key, value in result.items()}
+    if isinstance(result, dict):
+        return {str(key): to_json_ready(value) for key, value in result.items()}
+    if isinstance(result, (list, tuple)):
+        return [to_json_ready(value) for value in result]
+    if isinstance(result, np.ndarray):
+        return [to_json_ready(value) for value in result.tolist()]
+    if isinstance(result, np.generic):
+        return result.item()
+    if isinstance(result, float) and np.isnan(result):
+        return None
+    if result is pd.NA or result is pd.NaT:
+        return None
+    return result
+
+
+class AnalysisService:
+    """
+    Resident analyzers, invalidated by source file version, and an LRU cache of query results.
+    """
+
+    def __init__(self, paths: Dict[str, str], cache_size: int = RESULT_CACHE_SIZE):
+        """
+        paths : table name (see TABLE_FILES) -> source file. Queries on missing tables fail.
+        """
+        self.paths = dict(paths)
+        self.cache_size = cache_size
+        self._resident: Dict[str, Tuple[Tuple, Any]] = {}
+        self._resident_locks: Dict[str, threading.Lock] = {}
+        self._results: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _versions(self, tables: Tuple[str, ...]) -> Tuple:
+        missing = [table for table in tables if table not in self.paths and table not in OPTIONAL_TABLES]
+        if missing:
+            raise KeyError(f"No source file configured for tables: {missing}")
+        return tuple(_source_version(self.paths[table]) if table in self.paths else None for table in tables)
+
+    def resident(self, key: str, tables: Tuple[str, ...], factory: Callable[[], Any]) -> Any:
+        """
+        The resident object `key` built by factory() from `tables`, rebuilt when one of the files changed.
+
+        Concurrent first requests for the same key wait on the key's lock and
+        share one build instead of each loading a copy of the tables. Resident
+        analyzers keep only their latest RESIDENT_STAGE_RECORDS stage records,
+        so a long-running service does not grow with every query.
+        """
+        with self._lock:
+            lock = self._resident_locks.setdefault(key, threading.Lock())
+        # One build per key at a time; other keys keep loading and answering in parallel
+        with lock:
+            versions = self._versions(tables)
+            entry = self._resident.get(key)
+            if entry is None or entry[0] != versions:
+                self._resident.pop(key, None)
+                built = factory()
+                for part in built if isinstance(built, tuple) else (built,):
+                    if isinstance(part, Instrumented):
+                        part.instrumentation.limit(RESIDENT_STAGE_RECORDS)
+                self._resident[key] = (versions, built)
+            return self._resident[key][1]
+
+    def query(self, name: str, params: Dict[str, str]) -> Tuple[Any, bool]:
+        """
+        Answer a query; returns (JSON-ready result, whether it came from the result cache).
+        """
+        if name not in QUERIES:
+            raise KeyError(f"Unknown query: {name}")
+        tables, run = QUERIES[name]
+        cache_key = (name, tuple(sorted(params.items())), self._versions(tables))
+        with self._lock:
+            if cache_key in self._results:
+                self._results.move_to_end(cache_key)
+                return self._results[cache_key], True
+
+        result = to_json_ready(run(self, params))
+
+        with self._lock:
+            # Results of older versions of these tables can never be served again
+            for stale in [key for key in self._results if key[0] == name and key[2] != cache_key[2]]:
+                del self._results[stale]
+            self._results[cache_key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return result, False
+
+    # Resident analyzers, each loading its tables once per file version
+
+    def patients(self):
+        return self.resident("patients", ("patients",),
+                             lambda: analyzers.PatientDataAnalyzer(self.paths["patients"]))
+
+    def unique_icd(self):
+        return self.resident("unique_icd", ("diagnoses_icd",),
+                             lambda: analyzers.UniqueICDAnalyzer(self.paths["diagnoses_icd"]))
+
+    def top_icd(self):
+        def build():
+            analyzer = analyzers.TopICDAnalyzer(self.paths["diagnoses_icd"], self.paths.get("d_icd_diagnoses"))
+            return analyzer, analyzer.load_diagnoses()
+        return self.resident("top_icd", ("diagnoses_icd", "d_icd_diagnoses"), build)
+
+    def admissions(self):
+        path = self.paths.get("admissions")
+        return self.resident("admissions", ("admissions",),
+                             lambda: analyzers.PeakAdmissionsAnalyzer(
+                                 AdmissionsEngine.read_columns(path, times=False), source_path=path))
+
+    def los(self):
+        return self.resident("los", ("admissions",),
+                             lambda: analyzers.LOSAdmissionsAnalyzer(self.paths["admissions"]))
+
+    def icd_sketch(self):
+        return self.resident("icd_sketch", ("diagnoses_icd",),
+                             lambda: ICDSketchSummary.from_file(self.paths["diagnoses_icd"]))
+
+    def admissions_sketch(self):
+        return self.resident("admissions_sketch", ("admissions",),
+                             lambda: AdmissionsSketchSummary.from_file(self.paths["admissions"]))
+
+    def labs(self):
+        return self.resident("labs", ("d_labitems", "labevents"),
+                             lambda: analyzers.LabStatsAnalyzer(self.paths["d_labitems"], self.paths["labevents"]))
+
+
+def _int_param(params: Dict[str, str], name: str, default: int) -> int:
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise ValueError(f"Query parameter {name} must be an integer")
+
+
+def _top_icd(service: AnalysisService, params: Dict[str, str]):
+    analyzer, diagnoses = service.top_icd()
+    # compute_top_icd reads top_n from the analyzer; keep the shared analyzer unchanged
+    top = analyzers.TopICDAnalyzer(analyzer.diagnoses_path, analyzer.dictionary_path,
+                                   top_n=_int_param(params, "top_n", 10)).compute_top_icd(diagnoses)
+    return analyzer.enrich_with_descriptions(top)
+
+
+def _los_percentiles(service: AnalysisService, params: Dict[str, str]):
+    percentiles = [float(q) for q in params.get("percentiles", "25,50,75,90,95").split(",")]
+    return service.los().los_percentiles(percentiles)
+
+
+# Query name -> (tables it reads, function(service, params))
+QUERIES: Dict[str, Tuple[Tuple[str, ...], Callable[[AnalysisService, Dict[str, str]], Any]]] = {
+    "gender_distribution": (("patients",), lambda s, p: s.patients().gender_distribution()),
+    "top_icd_codes": (("diagnoses_icd",),
+                      lambda s, p: s.unique_icd().get_top_icd_codes(_int_param(p, "top_n", 10))),
+    "unique_icd_mean": (("diagnoses_icd",),
+                        lambda s, p: s.unique_icd().get_unique_icd_per_patient()["unique_icd_count"].mean()),
+    "top_icd": (("diagnoses_icd", "d_icd_diagnoses"), _top_icd),
+    "peak_admission_times": (("admissions",),
+                             lambda s, p: dict(zip(("hourly", "daily"), s.admissions().peak_admission_times()))),
+    "discharge_destinations": (("admissions",), lambda s, p: s.admissions().discharge_destination_summary()),
+    "los_statistics": (("admissions",), lambda s, p: s.los().average_and_median_los()),
+    "los_percentiles": (("admissions",), _los_percentiles),
+    "lab_statistics": (("d_labitems", "labevents"), lambda s, p: s.labs().compute_statistics()),
+    # Approximate answers from sketches, with their error bounds
+    "approx_top_icd_codes": (("diagnoses_icd",),
+                             lambda s, p: s.icd_sketch().top_icd_codes(_int_param(p, "top_n", 10))),
+    "approx_top_icd": (("diagnoses_icd",), lambda s, p: s.icd_sketch().top_icd(_int_param(p, "top_n", 10))),
+    "approx_unique_icd_mean": (("diagnoses_icd",), lambda s, p: s.icd_sketch().mean_unique_icd_per_patient()),
+    "approx_discharge_destinations": (("admissions",),
+                                      lambda s, p: s.admissions_sketch().discharge_destination_summary()),
+    "approx_error_bounds": (("diagnoses_icd",), lambda s, p: s.icd_sketch().error_bounds()),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: Optional[AnalysisService] = None
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send(200, {"status": "ok"})
+        if url.path == "/queries":
+            return self._send(200, {name: list(tables) for name, (tables, _) in QUERIES.items()})
+        if not url.path.startswith("/query/"):
+            return self._send(404, {"error": f"Unknown path: {url.path}"})
+
+        name = url.path[len("/query/"):]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        start = time.perf_counter()
+        try:
+            result, cached = self.service.query(name, params)
+        except KeyError as e:
+            return self._send(404, {"error": str(e.args[0])})
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        except Exception as e:
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        self._send(200, {
+            "query": name,
+            "params": params,
+            "result": result,
+            "cached": cached,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+        })
+
+    def log_message(self, format, *args):
+        # Dashboards poll often; keep the console for errors
+        pass
+
+
+def serve(paths: Dict[str, str], port: int = DEFAULT_PORT, cache_size: int = RESULT_CACHE_SIZE) -> ThreadingHTTPServer:
+    """
+    Create the HTTP server on 127.0.0.1:port; call serve_forever() on the result.
+    """
+    handler = type("Handler", (_Handler,), {"service": AnalysisService(paths, cache_size)})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=".", help="directory with the MIMIC CSV files")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-size", type=int, default=RESULT_CACHE_SIZE, help="cached query results")
+    for table, file_name in TABLE_FILES.items():
+        parser.add_argument(f"--{table.replace('_', '-')}", dest=table, default=None,
+                            help=f"path of {file_name} (default: in --data-dir)")
+    args = parser.parse_args(argv)
+
+    paths = {}
+    for table, file_name in TABLE_FILES.items():
+        path = getattr(args, table) or os.path.join(args.data_dir, file_name)
+        if os.path.exists(path):
+            paths[table] = path
+
+    server = serve(paths, args.port, args.cache_size)
+    print(f"🩺 Serving MIMIC analyzer queries on http://127.0.0.1:{args.port} "
+          f"(tables: {', '.join(sorted(paths)) or 'none'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
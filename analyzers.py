@@ -0,0 +1,55 @@
+"""
+Importable access to the analyzer classes of the analysis scripts.
+
+The analysis scripts have descriptive file names with spaces, and two of them
+define a class with the same name (ICDAnalyzer, AdmissionsAnalyzer), so they
+cannot be imported with a plain import statement. This module loads a script
+by its file name on first access and exposes its class under a unique name:
+
+    from analyzers import TopICDAnalyzer
+    result = TopICDAnalyzer("diagnoses_icd.csv", "d_icd_diagnoses.csv").run()
+"""
+
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Exported name -> (script file name, class name in the script)
+ANALYZERS = {
+    "LabStatsAnalyzer": ("Lab tests mean values.py", "LabStatsAnalyzer"),
+    "UniqueICDAnalyzer": ("Collecting unique ICD codes per patient.py", "ICDAnalyzer"),
+    "TopICDAnalyzer": ("most frequent health diagnoses appear on clinical database.py", "ICDAnalyzer"),
+    "PeakAdmissionsAnalyzer": ("Admission peek times and leaving destinations.py", "AdmissionsAnalyzer"),
+    "LOSAdmissionsAnalyzer": ("average and median Length of Stay and an histogram.py", "AdmissionsAnalyzer"),
+    "PatientDataAnalyzer": ("gender distribution.py", "PatientDataAnalyzer"),
+    "PatientDataProcessor": ("spilt  file and  age analysis.py", "PatientDataProcessor"),
+}
+
+__all__ = sorted(ANALYZERS) + ["load_script"]
+
+
+def load_script(file_name: str) -> ModuleType:
+    """
+    Import an analysis script by its file name, once per process.
+    """
+    module_name = "mimic_script_" + "".join(ch if ch.isalnum() else "_" for ch in os.path.splitext(file_name)[0])
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(_ROOT, file_name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            del sys.modules[module_name]
+            raise
+    return sys.modules[module_name]
+
+
+def __getattr__(name: str):
+    if name not in ANALYZERS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    file_name, class_name = ANALYZERS[name]
+    return getattr(load_script(file_name), class_name)
@@ -1,109 +1,155 @@
-import pandas as pd
-
-class AdmissionsAnalyzer:
-    """
-    A class to analyze hospital admissions data, specifically focusing
-    on Length of Stay (LOS) calculations.
-    """
-
-    def __init__(self, file_path: str):
-        """
-        Initialize the analyzer by reading the admissions dataset.
-
-        Parameters
-        ----------
-        file_path : str
-            Path to the CSV file containing admissions data.
-            Use the format of MIMIC, admissions.csv database file. Link to demo database files in this format is in README 
-        """
-        file_path = "write full path to admissions.csv database file here"
-
-
-        # Load dataset into a DataFrame
-        self.df = pd.read_csv(file_path)
-
-        # Convert datetime columns to pandas datetime objects for calculations
-        if "admittime" in self.df.columns and "dischtime" in self.df.columns:
-            self.df["admittime"] = pd.to_datetime(self.df["admittime"])
-            self.df["dischtime"] = pd.to_datetime(self.df["dischtime"])
-        else:
-            raise ValueError("Dataset must contain 'admittime' and 'dischtime' columns.")
-
-    def calculate_length_of_stay(self) -> pd.Series:
-        """
-        Compute the Length of Stay (LOS) in days for each admission.
-
-        Returns
-        -------
-        pd.Series
-            A Series of LOS values in days (float), excluding invalid values.
-        """
-        # Calculate LOS in days: (discharge time - admit time)
-        los = (self.df["dischtime"] - self.df["admittime"]).dt.total_seconds() / (24 * 3600)
-
-        # Filter out invalid stays: negative or zero LOS
-        los_clean = los[los > 0]
-
-        return los_clean
-
-    def average_and_median_los(self) -> dict:
-        """
-        Calculate the average and median Length of Stay across all admissions,
-        using only valid LOS values.
-
-        Returns
-        -------
-        dict
-            A dictionary with keys 'average' and 'median' (in days).
-        """
-        los = self.calculate_length_of_stay()
-
-        return {
-            "average": los.mean(),
-            "median": los.median(),
-            "count_used": len(los)  # number of valid admissions included
-        }
-
-# ---------------------- print results----------------------
- 
-
-if __name__ == "__main__":
-    # path to admissions.csv file
-    file_path = "write full path here"
-
-    # Create an analyzer object
-    analyzer = AdmissionsAnalyzer(file_path)
-
-    # Compute average and median LOS
-    los_stats = analyzer.average_and_median_los()
-
-    print("📊 Length of Stay Statistics (valid records only):")
-    print(f"Average Length of Stay  (days): {los_stats['average']:.2f}")
-    print(f"Median Length of Stay  (days): {los_stats['median']:.2f}")
-    print(f"Valid admissions included: {los_stats['count_used']}")
-
-
- def plot_los_histogram(self, bins=None):
-        """
-        Plot a histogram of Length of Stay values.
-
-        Parameters
-        ----------
-        bins : list, optional
-            Custom bin edges for the histogram.
-        """
-        los = self.calculate_length_of_stay()
-
-        if bins is None:
-            bins = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
-
-        plt.figure(figsize=(8, 5))
-        plt.hist(los, bins=bins, edgecolor="black", alpha=0.7)
-        plt.title("Histogram of Length of Stay (Days)")
-        plt.xlabel("Length of Stay (days)")
-        plt.ylabel("Number of Admissions")
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
-        plt.show()
-
-    # Plot histogram with custom bins
-    analyzer.plot_los_histogram(bins=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14])
\ No newline at end of file
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from admissions_engine import AdmissionsEngine
+from chart_rendering import ChartRenderer
+from instrumentation import Instrumented
+
+
+class AdmissionsAnalyzer(Instrumented):
+    """
+    A class to analyze hospital admissions data, specifically focusing
+    on Length of Stay (LOS) calculations.
+
+    Parsing and the LOS computations are done by the shared AdmissionsEngine,
+    so admissions.csv is read and its timestamps parsed only once.
+
+    With streaming=True the file is read in chunks into a StreamingLOS
+    accumulator instead, for admissions extracts that do not fit in memory.
+
+    Load, parse and aggregate stages are recorded in self.instrumentation.
+    """
+
+    def __init__(self, file_path: str, streaming: bool = False, chunksize: int = 1_000_000):
+        """
+        Initialize the analyzer by reading the admissions dataset.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the CSV file containing admissions data.
+            Use the format of MIMIC, admissions.csv database file. Link to demo database files in this format is in README 
+        streaming : bool
+            Compute LOS statistics chunk by chunk without loading the table.
+        chunksize : int
+            Number of rows per chunk in streaming mode.
+        """
+        self.streaming = streaming
+        if streaming:
+            self.engine = None
+            self.df = None
+            with self.stage("aggregate_streaming") as stage:
+                self.los_stream = AdmissionsEngine.stream_los(file_path, chunksize=chunksize)
+                stage.rows_out = self.los_stream.count
+            return
+
+        # Load dataset; admittime/dischtime are parsed once per file version and cached
+        with self.stage("load") as stage:
+            df = stage.output(AdmissionsEngine.read_columns(file_path, times=False))
+        with self.stage("parse") as stage:
+            self.engine = AdmissionsEngine(df, source_path=file_path)
+            if "dischtime" not in self.engine.time_columns:
+                raise ValueError("Dataset must contain 'admittime' and 'dischtime' columns.")
+            stage.output(self.engine.disch_ns)
+        self.df = self.engine.df
+
+    def calculate_length_of_stay(self) -> pd.Series:
+        """
+        Compute the Length of Stay (LOS) in days for each admission.
+
+        Returns
+        -------
+        pd.Series
+            A Series of LOS values in days (float), excluding invalid values.
+        """
+        if self.streaming:
+            raise ValueError("Per-admission LOS values are not kept in streaming mode.")
+        return pd.Series(self.engine.length_of_stay(), name="los_days")
+
+    def average_and_median_los(self) -> dict:
+        """
+        Calculate the average and median Length of Stay across all admissions,
+        using only valid LOS values.
+
+        Returns
+        -------
+        dict
+            A dictionary with keys 'average' and 'median' (in days).
+        """
+        if self.streaming:
+            return {
+                "average": self.los_stream.mean,
+                "median": self.los_stream.median,
+                "count_used": self.los_stream.count
+            }
+
+        with self.stage("aggregate", rows_in=self.df) as stage:
+            results = self.engine.run(["los"])
+            stage.rows_out = results.los_count
+
+        return {
+            "average": results.los_average,
+            "median": results.los_median,
+            "count_used": results.los_count  # number of valid admissions included
+        }
+
+    def los_percentiles(self, percentiles=(25, 50, 75, 90, 95)) -> dict:
+        """
+        Return the requested LOS percentiles (0-100) in days.
+        """
+        if self.streaming:
+            return {q: self.los_stream.percentile(q) for q in percentiles}
+        los = self.engine.length_of_stay()
+        return {q: float(np.percentile(los, q)) if len(los) else float("nan") for q in percentiles}
+
+    def plot_los_histogram(self, bins=None, save_path=None):
+        """
+        Plot a histogram of Length of Stay values.
+
+        Parameters
+        ----------
+        bins : list, optional
+            Custom bin edges for the histogram.
+        save_path : str, optional
+            Render headless (Agg) to this PNG/SVG file instead of showing the plot.
+        """
+        if self.streaming:
+            counts, edges = self.los_stream.histogram(bins)
+        else:
+            counts, edges = self.engine.los_histogram(bins)
+
+        if save_path is not None:
+            return ChartRenderer(figsize=(8, 5)).render_los_histogram(counts, edges, save_path)
+
+        plt.figure(figsize=(8, 5))
+        plt.hist(edges[:-1], bins=edges, weights=counts, edgecolor="black", alpha=0.7)
+        plt.title("Histogram of Length of Stay (Days)")
+        plt.xlabel("Length of Stay (days)")
+        plt.ylabel("Number of Admissions")
+        plt.grid(axis='y', linestyle='--', alpha=0.7)
+        plt.show()
+
+# ---------------------- print results----------------------
+ 
+
+if __name__ == "__main__":
+    # path to admissions.csv file
+    file_path = "write full path here"
+
+    # Create an analyzer object
+    analyzer = AdmissionsAnalyzer(file_path)
+
+    # Compute average and median LOS
+    los_stats = analyzer.average_and_median_los()
+
+    print("📊 Length of Stay Statistics (valid records only):")
+    print(f"Average Length of Stay  (days): {los_stats['average']:.2f}")
+    print(f"Median Length of Stay  (days): {los_stats['median']:.2f}")
+    print(f"Valid admissions included: {los_stats['count_used']}")
+
+    # For multi-year, multi-site extracts, stream the file instead:
+    # analyzer = AdmissionsAnalyzer(file_path, streaming=True, chunksize=2_000_000)
+
+    # Plot histogram with custom bins
+    analyzer.plot_los_histogram(bins=[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14])
@@ -0,0 +1,128 @@
+"""
+Parity check of the pandas and DuckDB analyzer backends.
+
+Runs get_top_icd_codes, get_unique_icd_per_patient, compute_top_icd and
+LabStatsAnalyzer.compute_statistics with backend="pandas" (the reference)
+and backend="duckdb" on the same tables and compares the results: counts
+exactly, floats to the rounding of the reports. The pandas lab percentiles
+come from a bucketed sketch, so they are compared within the sketch's
+relative accuracy (LAB_PERCENTILE_RTOL) of DuckDB's exact ones. Ties at the top-N cut may
+be broken differently by the two backends, so codes sharing the smallest
+reported count are compared by count only.
+
+Usage:
+    python benchmarks/check_backend_parity.py --rows 100000
+    python benchmarks/run_benchmarks.py --rows 100000 --check-parity
+
+Exits with status 1 when a result differs.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+_BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_BENCHMARKS_DIR))
+sys.path.insert(0, _BENCHMARKS_DIR)
+
+import synthetic_mimic  # noqa: E402
+
+# The pandas percentiles are within PERCENTILE_ACCURACY of the exact value,
+# before rounding; allow twice that for the rounding of both reports
+LAB_PERCENTILE_RTOL = 0.02
+
+
+def _compare_top(name: str, reference: pd.DataFrame, candidate: pd.DataFrame, keys: list) -> list:
+    """Compare two top-N frames; rows tied at the cut are compared by count only."""
+    problems = []
+    if reference["count"].tolist() != candidate["count"].tolist():
+        return [f"{name}: counts differ: {reference['count'].tolist()} != {candidate['count'].tolist()}"]
+    cut = reference["count"].min() if len(reference) else 0
+    ref_rows = reference[reference["count"] > cut]
+    cand_rows = candidate[candidate["count"] > cut]
+    ref_keys = set(map(tuple, ref_rows[keys].astype(str).to_numpy()))
+    cand_keys = set(map(tuple, cand_rows[keys].astype(str).to_numpy()))
+    if ref_keys != cand_keys:
+        problems.append(f"{name}: top codes differ: {sorted(ref_keys ^ cand_keys)}")
+    return problems
+
+
+def _compare_unique_icd(reference: pd.DataFrame, candidate: pd.DataFrame) -> list:
+    ref = reference.set_index("subject_id").sort_index()
+    cand = candidate.set_index("subject_id").sort_index()
+    if not ref.index.equals(cand.index.astype(ref.index.dtype)):
+        return ["unique_icd_per_patient: subject_ids differ"]
+    if not np.array_equal(ref["unique_icd_count"].to_numpy(), cand["unique_icd_count"].to_numpy()):
+        return ["unique_icd_per_patient: unique_icd_count differs"]
+    for subject_id, codes in ref["icd_code"].items():
+        if sorted(map(str, codes)) != sorted(map(str, cand.at[subject_id, "icd_code"])):
+            return [f"unique_icd_per_patient: codes of subject {subject_id} differ"]
+    return []
+
+
+def _compare_lab_statistics(reference: pd.DataFrame, candidate: pd.DataFrame) -> list:
+    ref = reference.assign(label=reference["label"].astype(str)).set_index("label").sort_index()
+    cand = candidate.assign(label=candidate["label"].astype(str)).set_index("label").sort_index()
+    if not ref.index.equals(cand.index):
+        return [f"lab_statistics: labels differ: {sorted(set(ref.index) ^ set(cand.index))[:10]}"]
+    problems = []
+    for column in ref.columns:
+        # Results are rounded to 2 decimals; allow one unit of rounding difference
+        rtol = LAB_PERCENTILE_RTOL if column.startswith("p") else 0
+        if not np.allclose(ref[column].astype(float), cand[column].astype(float),
+                           rtol=rtol, atol=0.011, equal_nan=True):
+            problems.append(f"lab_statistics: column {column} differs")
+    return problems
+
+
+def check_parity(paths: dict, top_n: int = 10) -> list:
+    """
+    Run every aggregation on both backends and return a list of differences (empty on parity).
+    """
+    from analyzers import LabStatsAnalyzer, TopICDAnalyzer, UniqueICDAnalyzer
+
+    problems = []
+    pandas_icd = UniqueICDAnalyzer(paths["diagnoses_icd"])
+    duckdb_icd = UniqueICDAnalyzer(paths["diagnoses_icd"], backend="duckdb")
+    problems += _compare_top("get_top_icd_codes", pandas_icd.get_top_icd_codes(top_n),
+                             duckdb_icd.get_top_icd_codes(top_n), ["icd_code"])
+    problems += _compare_unique_icd(pandas_icd.get_unique_icd_per_patient(),
+                                    duckdb_icd.get_unique_icd_per_patient())
+
+    pandas_top = TopICDAnalyzer(paths["diagnoses_icd"], top_n=top_n)
+    duckdb_top = TopICDAnalyzer(paths["diagnoses_icd"], top_n=top_n, backend="duckdb")
+    problems += _compare_top("compute_top_icd", pandas_top.run(), duckdb_top.run(), ["icd_code", "icd_version"])
+
+    problems += _compare_lab_statistics(
+        LabStatsAnalyzer(paths["d_labitems"], paths["labevents"]).compute_statistics(),
+        LabStatsAnalyzer(paths["d_labitems"], paths["labevents"], backend="duckdb").compute_statistics()
+    )
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="labevents rows; other tables scale from it")
+    parser.add_argument("--data-dir", default=None, help="directory for the synthetic tables")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or os.path.join(_BENCHMARKS_DIR, "data", f"rows_{args.rows}")
+    if not os.path.exists(os.path.join(data_dir, "labevents.csv")):
+        print(f"🧪 Generating synthetic MIMIC tables in {data_dir} ...")
+        synthetic_mimic.generate(data_dir, args.rows, seed=args.seed)
+    paths = synthetic_mimic.table_paths(data_dir)
+
+    problems = check_parity(paths)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ pandas and duckdb backends agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Benchmark harness for all analyzers on synthetic MIMIC-shaped data.
+
+Generates the six MIMIC tables at the requested scale (see synthetic_mimic.py),
+then runs every benchmark case in a fresh process and records wall time,
+peak RSS and rows/sec to a JSON file, so results can be compared between
+versions. Runs offline, without real MIMIC data.
+
+Peak RSS is measured for the case alone: the child resets its RSS high-water
+mark (/proc/self/clear_refs, Linux) after the imports and reads VmHWM when
+the case is done. Elsewhere RSS is sampled with psutil when it is installed.
+peak_rss_mb is the peak during the case and peak_rss_delta_mb its increase
+over the RSS before the case (interpreter, pandas and the analyzers imported).
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 1000000 --output results.json
+    python benchmarks/run_benchmarks.py --rows 100000 --cases lab_statistics top_icd --repeat 3
+    python benchmarks/run_benchmarks.py --rows 100000 --check-parity
+
+The *_duckdb cases need the duckdb package. --check-parity first compares the
+pandas and DuckDB backends (check_backend_parity.py) and stops on a difference.
+
+The first run of a case on freshly generated data includes building the
+columnar cache (mimic_cache); later repeats measure cached loads.
+"""
+
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+_BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_BENCHMARKS_DIR))
+sys.path.insert(0, _BENCHMARKS_DIR)
+
+import synthetic_mimic  # noqa: E402
+from check_backend_parity import check_parity  # noqa: E402
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - depends on the environment
+    psutil = None
+
+# Seconds between RSS samples where the kernel high-water mark cannot be reset
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def _lab_statistics(paths):
+    from analyzers import LabStatsAnalyzer
+    LabStatsAnalyzer(paths["d_labitems"], paths["labevents"]).compute_statistics()
+    return "labevents"
+
+
+def _lab_statistics_streaming(paths):
+    from analyzers import LabStatsAnalyzer
+    LabStatsAnalyzer(paths["d_labitems"], paths["labevents"], streaming=True).compute_statistics()
+    return "labevents"
+
+
+def _lab_statistics_duckdb(paths):
+    from analyzers import LabStatsAnalyzer
+    LabStatsAnalyzer(paths["d_labitems"], paths["labevents"], backend="duckdb").compute_statistics()
+    return "labevents"
+
+
+def _unique_icd(paths):
+    from analyzers import UniqueICDAnalyzer
+    analyzer = UniqueICDAnalyzer(paths["diagnoses_icd"])
+    analyzer.get_unique_icd_per_patient()
+    analyzer.get_top_icd_codes()
+    return "diagnoses_icd"
+
+
+def _unique_icd_duckdb(paths):
+    from analyzers import UniqueICDAnalyzer
+    analyzer = UniqueICDAnalyzer(paths["diagnoses_icd"], backend="duckdb")
+    analyzer.get_unique_icd_per_patient()
+    analyzer.get_top_icd_codes()
+    return "diagnoses_icd"
+
+
+def _incidence_matrix(paths):
+    from analyzers import UniqueICDAnalyzer
+    UniqueICDAnalyzer(paths["diagnoses_icd"]).build_incidence_matrix()
+    return "diagnoses_icd"
+
+
+def _top_icd(paths):
+    from analyzers import TopICDAnalyzer
+    TopICDAnalyzer(paths["diagnoses_icd"], paths["d_icd_diagnoses"], top_n=10).run()
+    return "diagnoses_icd"
+
+
+def _top_icd_duckdb(paths):
+    from analyzers import TopICDAnalyzer
+    TopICDAnalyzer(paths["diagnoses_icd"], paths["d_icd_diagnoses"], top_n=10, backend="duckdb").run()
+    return "diagnoses_icd"
+
+
+def _peak_admissions(paths):
+    from analyzers import PeakAdmissionsAnalyzer
+    from mimic_cache import read_table
+    analyzer = PeakAdmissionsAnalyzer(read_table(paths["admissions"], columns=["admittime", "discharge_location"]))
+    analyzer.peak_admission_times()
+    analyzer.discharge_destination_summary()
+    return "admissions"
+
+
+def _los(paths):
+    from analyzers import LOSAdmissionsAnalyzer
+    LOSAdmissionsAnalyzer(paths["admissions"]).average_and_median_los()
+    return "admissions"
+
+
+def _los_streaming(paths):
+    from analyzers import LOSAdmissionsAnalyzer
+    LOSAdmissionsAnalyzer(paths["admissions"], streaming=True).average_and_median_los()
+    return "admissions"
+
+
+def _gender_distribution(paths):
+    from analyzers import PatientDataAnalyzer
+    PatientDataAnalyzer(paths["patients"]).gender_distribution()
+    return "patients"
+
+
+def _patient_partitions(paths):
+    from analyzers import PatientDataProcessor
+    PatientDataProcessor(paths["patients"], num_partitions=4, partition_by="subject_id").compute_partition_aggregates()
+    return "patients"
+
+
+# Case name -> function(paths) that runs the analysis and returns the table its row count is based on
+CASES = {
+    "lab_statistics": _lab_statistics,
+    "lab_statistics_streaming": _lab_statistics_streaming,
+    "lab_statistics_duckdb": _lab_statistics_duckdb,
+    "unique_icd": _unique_icd,
+    "unique_icd_duckdb": _unique_icd_duckdb,
+    "incidence_matrix": _incidence_matrix,
+    "top_icd": _top_icd,
+    "top_icd_duckdb": _top_icd_duckdb,
+    "peak_admissions": _peak_admissions,
+    "los": _los,
+    "los_streaming": _los_streaming,
+    "gender_distribution": _gender_distribution,
+    "patient_partitions": _patient_partitions,
+}
+
+
+def default_cases() -> list:
+    """All cases; the *_duckdb cases only when duckdb is installed."""
+    has_duckdb = importlib.util.find_spec("duckdb") is not None
+    return [case for case in CASES if has_duckdb or not case.endswith("_duckdb")]
+
+
+def _proc_status_mb(field: str) -> Optional[float]:
+    """A memory field of /proc/self/status (VmRSS, VmHWM) in MB, None where unavailable."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class PeakRSS:
+    """
+    Peak RSS of this process between start() and stop(), in MB.
+
+    On Linux the kernel high-water mark is reset by writing 5 to
+    /proc/self/clear_refs, so VmHWM covers only the measured block. Otherwise
+    a psutil thread samples the RSS every RSS_SAMPLE_INTERVAL seconds (short
+    spikes between samples are missed). Without either, ru_maxrss is used,
+    which includes everything the process did before.
+    """
+
+    def __init__(self):
+        self.baseline_mb = self.peak_mb = 0.0
+        self.method = None
+        self._done = threading.Event()
+        self._sampler = None
+
+    @staticmethod
+    def _current_mb() -> float:
+        current = _proc_status_mb("VmRSS")
+        if current is None and psutil is not None:
+            current = psutil.Process().memory_info().rss / 1024 ** 2
+        return current or 0.0
+
+    def _sample(self):
+        process = psutil.Process()
+        while not self._done.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_mb = max(self.peak_mb, process.memory_info().rss / 1024 ** 2)
+
+    def start(self) -> "PeakRSS":
+        self.baseline_mb = self.peak_mb = self._current_mb()
+        try:
+            with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+                f.write("5")
+            self.method = "vmhwm"
+        except OSError:
+            if psutil is not None:
+                self.method = "psutil"
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+            else:
+                self.method = "ru_maxrss"
+        return self
+
+    def stop(self) -> float:
+        if self.method == "vmhwm":
+            self.peak_mb = max(_proc_status_mb("VmHWM") or 0.0, self.baseline_mb)
+        elif self.method == "psutil":
+            self._done.set()
+            self._sampler.join()
+            self.peak_mb = max(self.peak_mb, self._current_mb())
+        else:
+            # ru_maxrss is in KiB on Linux and bytes on macOS
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_mb = peak_rss / 1024 ** 2 if sys.platform == "darwin" else peak_rss / 1024
+        return self.peak_mb
+
+
+def _run_case(case: str, paths: dict, queue) -> None:
+    """Child process: run one case and report wall time and its peak RSS."""
+    # Import the analyzers before the baseline, so the memory reported is the case's work
+    import analyzers  # noqa: F401
+
+    memory = PeakRSS().start()
+    start = time.perf_counter()
+    table = CASES[case](paths)
+    wall = time.perf_counter() - start
+    memory.stop()
+    queue.put({"table": table, "wall_seconds": wall, "peak_rss_mb": memory.peak_mb,
+               "peak_rss_delta_mb": memory.peak_mb - memory.baseline_mb, "memory_method": memory.method})
+
+
+def run_case(case: str, paths: dict) -> dict:
+    """Run one case in a fresh process so peak RSS is measured per case."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(case, paths, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Benchmark case {case} failed with exit code {process.exitcode}")
+    return queue.get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="labevents rows; other tables scale from it")
+    parser.add_argument("--data-dir", default=None, help="directory for the synthetic tables")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=default_cases())
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check-parity", action="store_true", help="compare the pandas and duckdb backends first")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or os.path.join(_BENCHMARKS_DIR, "data", f"rows_{args.rows}")
+    sizes = synthetic_mimic.table_sizes(args.rows)
+    if not os.path.exists(os.path.join(data_dir, "labevents.csv")):
+        print(f"🧪 Generating synthetic MIMIC tables in {data_dir} ...")
+        synthetic_mimic.generate(data_dir, args.rows, seed=args.seed)
+    paths = synthetic_mimic.table_paths(data_dir)
+
+    if args.check_parity:
+        problems = check_parity(paths)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ pandas and duckdb backends agree")
+
+    results = []
+    for case in args.cases:
+        for run in range(1, args.repeat + 1):
+            measured = run_case(case, paths)
+            rows = sizes[measured["table"]]
+            results.append({
+                "case": case,
+                "run": run,
+                "table": measured["table"],
+                "rows": rows,
+                "wall_seconds": round(measured["wall_seconds"], 4),
+                "rows_per_second": round(rows / measured["wall_seconds"], 1) if measured["wall_seconds"] else None,
+                "peak_rss_mb": round(measured["peak_rss_mb"], 1),
+                "peak_rss_delta_mb": round(measured["peak_rss_delta_mb"], 1),
+                "memory_method": measured["memory_method"],
+            })
+            print(f"→ {case} (run {run}): {measured['wall_seconds']:.3f}s, "
+                  f"{results[-1]['rows_per_second']} rows/s, peak RSS {measured['peak_rss_mb']:.0f} MB "
+                  f"(+{measured['peak_rss_delta_mb']:.0f} MB)")
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "labevents_rows": args.rows,
+        "table_sizes": sizes,
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Benchmark results written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
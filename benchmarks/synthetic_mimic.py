@@ -0,0 +1,196 @@
+"""
+Synthetic MIMIC-shaped tables for benchmarking, no MIMIC access needed.
+
+Generates patients, admissions, diagnoses_icd, d_icd_diagnoses, labevents and
+d_labitems CSV files with the MIMIC-IV column names and formats and a
+realistic skew: a few ICD codes and lab items account for most rows (Zipf),
+admissions peak in the afternoon and Length of Stay is log-normal.
+
+Large tables are written in chunks, so 1e8 rows can be generated with bounded
+memory.
+"""
+
+import os
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1_000_000
+NS_PER_MINUTE = 60 * 10**9
+
+# Rows per table relative to labevents, roughly as in MIMIC-IV, with a floor for small scales
+TABLE_RATIOS = {
+    "patients": 1 / 400,
+    "admissions": 1 / 275,
+    "diagnoses_icd": 1 / 25,
+    "labevents": 1.0,
+}
+MIN_ROWS = 100
+TABLES = ["patients", "admissions", "diagnoses_icd", "d_icd_diagnoses", "labevents", "d_labitems"]
+N_ICD_CODES = 20_000
+N_LAB_ITEMS = 1_000
+
+GENDERS = np.array(["F", "M"])
+DISCHARGE_LOCATIONS = np.array([
+    "HOME", "HOME HEALTH CARE", "SKILLED NURSING FACILITY", "REHAB", "DIED",
+    "CHRONIC/LONG TERM ACUTE CARE", "HOSPICE", "AGAINST ADVICE", "OTHER FACILITY",
+], dtype=object)
+DISCHARGE_WEIGHTS = np.array([0.45, 0.2, 0.12, 0.06, 0.04, 0.03, 0.03, 0.02, 0.05])
+ADMISSION_TYPES = np.array(["EW EMER.", "EU OBSERVATION", "ELECTIVE", "URGENT", "DIRECT EMER."], dtype=object)
+ADMISSION_TYPE_WEIGHTS = np.array([0.45, 0.2, 0.15, 0.12, 0.08])
+# Admissions by hour of day, peaking in the afternoon
+HOUR_WEIGHTS = np.array([3, 2, 2, 1, 1, 1, 2, 4, 6, 7, 8, 8, 8, 8, 9, 9, 9, 8, 7, 6, 5, 5, 4, 3], dtype=float)
+
+FIRST_SUBJECT_ID = 10_000_000
+FIRST_HADM_ID = 20_000_000
+FIRST_ITEMID = 50_800
+# Shifted MIMIC-style dates
+START = np.datetime64("2110-01-01T00:00", "ns").astype(np.int64)
+SPAN_NS = 100 * 365 * 24 * 3600 * 10**9
+
+
+def table_sizes(labevents_rows: int) -> Dict[str, int]:
+    """Return the number of rows of every fact table for a labevents size."""
+    return {table: max(MIN_ROWS, int(labevents_rows * ratio)) for table, ratio in TABLE_RATIOS.items()}
+
+
+def _zipf_choice(rng: np.random.Generator, n_values: int, size: int, exponent: float = 1.1) -> np.ndarray:
+    """Draw indices in [0, n_values) with a Zipf-like (power law) skew."""
+    weights = 1.0 / np.arange(1, n_values + 1) ** exponent
+    return rng.choice(n_values, size=size, p=weights / weights.sum())
+
+
+def _format_times(ns: np.ndarray) -> np.ndarray:
+    """Format int64 nanoseconds as MIMIC timestamps, %Y-%m-%d %H:%M:%S."""
+    text = np.datetime_as_string(ns.astype("datetime64[ns]").astype("datetime64[s]"), unit="s")
+    return np.char.replace(text, "T", " ")
+
+
+def _write_chunks(path: str, n_rows: int, make_chunk) -> None:
+    """Write make_chunk(start, stop) frames to one CSV file."""
+    for start in range(0, n_rows, CHUNK_ROWS):
+        stop = min(n_rows, start + CHUNK_ROWS)
+        make_chunk(start, stop).to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+
+
+def _icd_codes(n_codes: int) -> pd.DataFrame:
+    """ICD-9 style numeric codes (with leading zeros) and ICD-10 style alphanumeric codes."""
+    n_icd9 = n_codes // 2
+    icd9 = [f"{i:04d}" for i in range(n_icd9)]
+    icd10 = [f"{chr(ord('A') + i % 26)}{i // 26 % 100:02d}{i // 2600}" for i in range(n_codes - n_icd9)]
+    return pd.DataFrame({
+        "icd_code": icd9 + icd10,
+        "icd_version": [9] * n_icd9 + [10] * (n_codes - n_icd9),
+    })
+
+
+def table_paths(out_dir: str) -> Dict[str, str]:
+    """Table name -> CSV path of the tables in out_dir."""
+    return {name: os.path.join(out_dir, f"{name}.csv") for name in TABLES}
+
+
+def generate(out_dir: str, labevents_rows: int, seed: int = 0) -> Dict[str, str]:
+    """
+    Write all six tables to out_dir and return table name -> CSV path.
+
+    labevents_rows sets the scale; the other tables follow TABLE_RATIOS.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    sizes = table_sizes(labevents_rows)
+    paths = table_paths(out_dir)
+
+    n_patients = sizes["patients"]
+    n_admissions = sizes["admissions"]
+
+    # patients
+    def patients_chunk(start, stop):
+        n = stop - start
+        ages = np.clip(rng.normal(58, 19, n).round(), 18, 91).astype(int)
+        return pd.DataFrame({
+            "subject_id": FIRST_SUBJECT_ID + np.arange(start, stop),
+            "gender": GENDERS[(rng.random(n) < 0.48).astype(int)],
+            "anchor_age": ages,
+            "anchor_year": rng.integers(2110, 2210, n),
+            "anchor_year_group": "2008 - 2010",
+            "dod": np.where(rng.random(n) < 0.1, "2180-01-01", None),
+        })
+    _write_chunks(paths["patients"], n_patients, patients_chunk)
+
+    # Subject of every admission, shared by all tables; some patients have many admissions
+    admission_subjects = FIRST_SUBJECT_ID + _zipf_choice(rng, n_patients, n_admissions, exponent=0.5)
+
+    # admissions
+    def admissions_chunk(start, stop):
+        n = stop - start
+        days = rng.integers(0, SPAN_NS // (24 * 3600 * 10**9), n)
+        hours = rng.choice(24, size=n, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+        minutes = rng.integers(0, 60, n)
+        admit_ns = START + (days * 1440 + hours * 60 + minutes) * NS_PER_MINUTE
+        los_minutes = np.maximum(1, rng.lognormal(np.log(3.5 * 1440), 0.9, n)).astype(np.int64)
+        disch_ns = admit_ns + los_minutes * NS_PER_MINUTE
+        discharge = DISCHARGE_LOCATIONS[rng.choice(len(DISCHARGE_LOCATIONS), size=n, p=DISCHARGE_WEIGHTS)]
+        discharge[rng.random(n) < 0.05] = None
+        return pd.DataFrame({
+            "subject_id": admission_subjects[start:stop],
+            "hadm_id": FIRST_HADM_ID + np.arange(start, stop),
+            "admittime": _format_times(admit_ns),
+            "dischtime": _format_times(disch_ns),
+            "admission_type": ADMISSION_TYPES[rng.choice(len(ADMISSION_TYPES), size=n, p=ADMISSION_TYPE_WEIGHTS)],
+            "discharge_location": discharge,
+        })
+    _write_chunks(paths["admissions"], n_admissions, admissions_chunk)
+
+    # d_icd_diagnoses and diagnoses_icd
+    codes = _icd_codes(N_ICD_CODES)
+    codes.assign(long_title=[f"Synthetic diagnosis {c} (ICD-{v})" for c, v in zip(codes["icd_code"], codes["icd_version"])]) \
+        .to_csv(paths["d_icd_diagnoses"], index=False)
+
+    def diagnoses_chunk(start, stop):
+        n = stop - start
+        admission = rng.integers(0, n_admissions, n)
+        code_index = _zipf_choice(rng, N_ICD_CODES, n)
+        return pd.DataFrame({
+            "subject_id": admission_subjects[admission],
+            "hadm_id": FIRST_HADM_ID + admission,
+            "seq_num": rng.integers(1, 30, n),
+            "icd_code": codes["icd_code"].to_numpy()[code_index],
+            "icd_version": codes["icd_version"].to_numpy()[code_index],
+        })
+    _write_chunks(paths["diagnoses_icd"], sizes["diagnoses_icd"], diagnoses_chunk)
+
+    # d_labitems and labevents
+    itemids = FIRST_ITEMID + np.arange(N_LAB_ITEMS)
+    pd.DataFrame({
+        "itemid": itemids,
+        "label": [f"Lab test {i}" for i in range(N_LAB_ITEMS)],
+        "fluid": "Blood",
+        "category": "Chemistry",
+    }).to_csv(paths["d_labitems"], index=False)
+    item_means = rng.lognormal(2, 1.2, N_LAB_ITEMS)
+
+    def labevents_chunk(start, stop):
+        n = stop - start
+        item_index = _zipf_choice(rng, N_LAB_ITEMS, n)
+        admission = rng.integers(0, n_admissions, n)
+        valuenum = np.round(rng.normal(item_means[item_index], item_means[item_index] * 0.2), 2)
+        value = valuenum.astype(str).astype(object)
+        missing = rng.random(n)
+        value[missing < 0.03] = None
+        value[(missing >= 0.03) & (missing < 0.04)] = "___"
+        chart_ns = START + rng.integers(0, SPAN_NS // NS_PER_MINUTE, n) * NS_PER_MINUTE
+        return pd.DataFrame({
+            "labevent_id": np.arange(start, stop) + 1,
+            "subject_id": admission_subjects[admission],
+            "hadm_id": FIRST_HADM_ID + admission,
+            "itemid": itemids[item_index],
+            "charttime": _format_times(chart_ns),
+            "value": value,
+            "valuenum": np.where(missing < 0.04, np.nan, valuenum),
+            "valueuom": "mg/dL",
+            "flag": np.where(rng.random(n) < 0.15, "abnormal", None),
+        })
+    _write_chunks(paths["labevents"], sizes["labevents"], labevents_chunk)
+
+    return paths
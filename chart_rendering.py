@@ -0,0 +1,161 @@
+"""
+Headless, batched chart rendering for the admissions charts.
+
+plot_peak_admission_times and plot_los_histogram draw with pyplot and call
+plt.show(), which blocks or fails on report servers. ChartRenderer draws the
+same charts on a matplotlib Figure with the Agg canvas, without pyplot and
+without changing the process-wide backend. It reuses one figure and axes for
+every chart it renders and writes PNG or SVG (by file extension).
+
+Charts are drawn from already computed aggregates (AdmissionsResults, LOS
+histogram counts), never from the raw rows. render_jobs fans a batch of charts,
+e.g. one set per hospital unit, out over a process pool; each worker process
+renders its share with a single ChartRenderer.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+@dataclass
+class ChartJob:
+    """
+    One chart to render: kind is "hourly", "daily" or "los_histogram".
+
+    data holds the aggregates of the chart:
+    hourly        -> {"hour": [...], "admissions": [...]}
+    daily         -> {"day_of_week": [...], "admissions": [...]}
+    los_histogram -> {"counts": [...], "edges": [...]}
+    """
+    kind: str
+    path: str
+    data: Dict[str, Sequence]
+    title: Optional[str] = None
+
+
+class ChartRenderer:
+    """
+    Renders charts on one reused Agg figure and axes.
+    """
+
+    def __init__(self, figsize=(10, 5), dpi: int = 100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+
+    def _save(self, path: str) -> str:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.figure.tight_layout()
+        self.figure.savefig(path)
+        return path
+
+    def render_hourly(self, hourly: pd.DataFrame, path: str, title: Optional[str] = None) -> str:
+        """Bar chart of admissions by hour of day."""
+        self.ax.clear()
+        self.ax.bar(hourly["hour"], hourly["admissions"], color="skyblue")
+        self.ax.set_title(title or "Admissions by Hour")
+        self.ax.set_xlabel("Hour of Day")
+        self.ax.set_ylabel("Number of Admissions")
+        self.ax.set_xticks(range(0, 24))
+        self.ax.grid(axis="y", linestyle="--", alpha=0.7)
+        return self._save(path)
+
+    def render_daily(self, daily: pd.DataFrame, path: str, title: Optional[str] = None) -> str:
+        """Bar chart of admissions by day of week."""
+        self.ax.clear()
+        self.ax.bar([str(day) for day in daily["day_of_week"]], daily["admissions"], color="salmon")
+        self.ax.set_title(title or "Admissions by Day of Week")
+        self.ax.set_xlabel("Day")
+        self.ax.set_ylabel("Number of Admissions")
+        self.ax.grid(axis="y", linestyle="--", alpha=0.7)
+        return self._save(path)
+
+    def render_los_histogram(self, counts: Sequence[int], edges: Sequence[float], path: str,
+                             title: Optional[str] = None) -> str:
+        """Histogram of Length of Stay from precomputed bin counts."""
+        edges = np.asarray(edges, dtype=float)
+        self.ax.clear()
+        self.ax.hist(edges[:-1], bins=edges, weights=np.asarray(counts), edgecolor="black", alpha=0.7)
+        self.ax.set_title(title or "Histogram of Length of Stay (Days)")
+        self.ax.set_xlabel("Length of Stay (days)")
+        self.ax.set_ylabel("Number of Admissions")
+        self.ax.grid(axis="y", linestyle="--", alpha=0.7)
+        return self._save(path)
+
+    def render(self, job: ChartJob) -> str:
+        """Render one ChartJob and return its path."""
+        if job.kind == "hourly":
+            return self.render_hourly(pd.DataFrame(job.data), job.path, job.title)
+        if job.kind == "daily":
+            return self.render_daily(pd.DataFrame(job.data), job.path, job.title)
+        if job.kind == "los_histogram":
+            return self.render_los_histogram(job.data["counts"], job.data["edges"], job.path, job.title)
+        raise ValueError(f"Unknown chart kind: {job.kind}")
+
+
+def _render_batch(jobs: List[ChartJob]) -> List[str]:
+    """Worker: render a share of the jobs with one renderer."""
+    renderer = ChartRenderer()
+    return [renderer.render(job) for job in jobs]
+
+
+def render_jobs(jobs: Sequence[ChartJob], processes: Optional[int] = None) -> List[str]:
+    """
+    Render a batch of charts, in-process when processes is 1, otherwise split
+    evenly over a process pool. Returns the written paths in job order.
+    """
+    jobs = list(jobs)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(jobs) <= 1:
+        return _render_batch(jobs)
+
+    shares = [jobs[i::processes] for i in range(processes) if jobs[i::processes]]
+    with ProcessPoolExecutor(max_workers=len(shares)) as pool:
+        rendered = list(pool.map(_render_batch, shares))
+
+    # Undo the round-robin split so paths come back in job order
+    paths = [None] * len(jobs)
+    for i, share_paths in enumerate(rendered):
+        paths[i::len(shares)] = share_paths
+    return paths
+
+
+def admissions_chart_jobs(results, out_dir: str, prefix: str = "", fmt: str = "png") -> List[ChartJob]:
+    """
+    ChartJobs for the peak-times and LOS charts of one AdmissionsResults
+    (only of the metrics it was computed with).
+    """
+    jobs = []
+    if results.hourly is not None:
+        jobs += [
+            ChartJob("hourly", os.path.join(out_dir, f"{prefix}admissions_by_hour.{fmt}"),
+                     {"hour": results.hourly["hour"].tolist(), "admissions": results.hourly["admissions"].tolist()}),
+            ChartJob("daily", os.path.join(out_dir, f"{prefix}admissions_by_day.{fmt}"),
+                     {"day_of_week": [str(d) for d in results.daily["day_of_week"]],
+                      "admissions": results.daily["admissions"].tolist()}),
+        ]
+    if results.los_histogram is not None:
+        jobs.append(ChartJob("los_histogram", os.path.join(out_dir, f"{prefix}los_histogram.{fmt}"),
+                             {"counts": results.los_histogram.tolist(), "edges": results.los_bin_edges.tolist()}))
+    return jobs
+
+
+def render_unit_charts(results_by_unit: Mapping[str, object], out_dir: str, fmt: str = "png",
+                       processes: Optional[int] = None) -> List[str]:
+    """
+    Render the admissions charts of many units (unit name -> AdmissionsResults)
+    into out_dir/<unit>/ over a process pool.
+    """
+    jobs = []
+    for unit, results in results_by_unit.items():
+        jobs.extend(admissions_chart_jobs(results, os.path.join(out_dir, str(unit)), fmt=fmt))
+    return render_jobs(jobs, processes=processes)
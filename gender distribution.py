@@ -1,53 +1,171 @@
-import pandas as pd
-
-class PatientDataAnalyzer:
-    """
-    A class to encapsulate analysis methods for patient data from the MIMIC dataset.
-     
-    Use the format of MIMIC, patients.csv database file. Link to demo database files in this format is in README.
-   
-    """
-    
-    def __init__(self, file_path: str):
-        """
-        Initialize the analyzer by reading the dataset.
-        
-        Parameters
-        ----------
-        file_path : str
-            Path to the CSV file containing patient data.
-        """
-        self.df = pd.read_csv(file_path)
-    
-    def gender_distribution(self) -> pd.Series:
-        """
-        Calculate the gender distribution of patients in the dataset.
-        
-        Returns
-        -------
-        pd.Series
-            A series where the index is gender categories and the values 
-            are counts of patients in each category.
-        """
-        # Ensure gender column exists
-        if 'gender' not in self.df.columns:
-            raise ValueError("The dataset does not contain a 'gender' column.")
-        
-        # Count occurrences of each gender
-        distribution = self.df['gender'].value_counts()
-    
-        return distribution
-
-
-# --- Running the code on the attached dataset ---
-
-# Path to the attached dataset
-file_path = "write full path here"
-
-# Create analyzer instance
-analyzer = PatientDataAnalyzer(file_path)
-
-# Get gender distribution
-gender_dist = analyzer.gender_distribution()
-
-print(gender_dist)
+from typing import Iterable, Mapping
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Instrumented
+from mimic_cache import read_table, table_columns
+
+
+def deidentified_age(anchor_age: pd.Series) -> pd.Series:
+    """
+    Apply the de-identification rule of the age analysis: ages of 89 and above are reported as 91.
+    """
+    return anchor_age.clip(upper=89).replace(89, 91)
+
+
+class PatientDataAnalyzer(Instrumented):
+    """
+    A class to encapsulate analysis methods for patient data from the MIMIC dataset.
+
+    cohort_statistics computes gender counts and age statistics for many cohorts
+    (lists of subject_ids) in one vectorized pass over the loaded patients.
+     
+    Use the format of MIMIC, patients.csv database file. Link to demo database files in this format is in README.
+   
+    """
+    
+    def __init__(self, file_path: str):
+        """
+        Initialize the analyzer by reading the dataset.
+        
+        Parameters
+        ----------
+        file_path : str
+            Path to the CSV file containing patient data.
+
+        Nothing is read here: each method reads only the columns it needs,
+        and df loads the whole table on first access.
+        """
+        self.file_path = file_path
+        self._df = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """All columns of the patients table, loaded on first use."""
+        if self._df is None:
+            with self.stage("load") as stage:
+                self._df = stage.output(read_table(self.file_path))
+        return self._df
+
+    def _columns(self, columns: list) -> pd.DataFrame:
+        """
+        The given columns of the patients; read from the file alone unless the
+        whole table is already loaded. Raises ValueError if one is missing.
+        """
+        available = self._df.columns if self._df is not None else table_columns(self.file_path)
+        if not set(columns).issubset(available):
+            raise ValueError(f"The dataset must contain the columns {sorted(columns)}.")
+        if self._df is not None:
+            return self._df[columns]
+        with self.stage("load_columns") as stage:
+            return stage.output(read_table(self.file_path, columns=columns))
+    
+    def gender_distribution(self) -> pd.Series:
+        """
+        Calculate the gender distribution of patients in the dataset.
+        
+        Returns
+        -------
+        pd.Series
+            A series where the index is gender categories and the values 
+            are counts of patients in each category.
+        """
+        # Ensure gender column exists
+        try:
+            df = self._columns(['gender'])
+        except ValueError:
+            raise ValueError("The dataset does not contain a 'gender' column.")
+        
+        # Count occurrences of each gender
+        with self.stage("aggregate_gender", rows_in=df) as stage:
+            distribution = df['gender'].value_counts()
+            # A categorical gender column also lists categories without patients
+            distribution = distribution[distribution > 0]
+    
+            return stage.output(distribution)
+
+    def cohort_statistics(self, cohorts: Mapping[str, Iterable[int]]) -> pd.DataFrame:
+        """
+        Calculate gender counts and de-identified age statistics for many cohorts at once.
+
+        All cohorts are flattened into one (cohort, subject_id) membership table, which
+        is matched against the patients once and aggregated in a single grouped pass.
+        A subject_id listed twice in a cohort is counted once. Patients without an
+        anchor_age are left out of mean_age and median_age alike.
+
+        Parameters
+        ----------
+        cohorts : Mapping[str, Iterable[int]]
+            Cohort name -> subject_ids of the cohort.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per cohort (index) with the columns patients, unmatched_subjects
+            (subject_ids not found in the dataset), mean_age, median_age and one
+            count column per gender.
+        """
+        df = self._columns(['subject_id', 'gender', 'anchor_age'])
+
+        names = list(cohorts)
+        n_cohorts = len(names)
+        members = [np.asarray(list(cohorts[name]), dtype=np.int64) for name in names]
+        membership = np.repeat(np.arange(n_cohorts), [len(m) for m in members])
+        subject_ids = np.concatenate(members) if members else np.array([], dtype=np.int64)
+        pairs = pd.DataFrame({'cohort': membership, 'subject_id': subject_ids}).drop_duplicates()
+        membership, subject_ids = pairs['cohort'].to_numpy(), pairs['subject_id'].to_numpy()
+
+        # Match every membership row to its patient row once
+        with self.stage("join_cohorts", rows_in=len(subject_ids)) as stage:
+            patients = df.drop_duplicates('subject_id')
+            positions = pd.Index(patients['subject_id'].astype(np.int64)).get_indexer(subject_ids)
+            matched = positions >= 0
+            cohort_ids, positions = membership[matched], positions[matched]
+            stage.rows_out = len(positions)
+
+        ages = deidentified_age(patients['anchor_age']).to_numpy(dtype=np.float64, na_value=np.nan)[positions]
+        gender_codes, genders = pd.factorize(patients['gender'])
+        gender_codes = gender_codes[positions]
+
+        has_age = ~np.isnan(ages)
+        age_counts = np.bincount(cohort_ids[has_age], minlength=n_cohorts)
+        age_sums = np.bincount(cohort_ids[has_age], weights=ages[has_age], minlength=n_cohorts)
+        stats = pd.DataFrame({
+            'patients': np.bincount(cohort_ids, minlength=n_cohorts),
+            'unmatched_subjects': np.bincount(membership[~matched], minlength=n_cohorts),
+            'mean_age': age_sums / np.where(age_counts > 0, age_counts, np.nan),
+            'median_age': pd.Series(ages).groupby(cohort_ids).median().reindex(range(n_cohorts)).to_numpy(),
+        }, index=pd.Index(names, name='cohort'))
+
+        # Gender counts from one bincount over (cohort, gender) pairs; missing genders are not counted
+        known = gender_codes >= 0
+        gender_counts = np.bincount(
+            cohort_ids[known] * len(genders) + gender_codes[known],
+            minlength=n_cohorts * len(genders)
+        ).reshape(n_cohorts, len(genders))
+        for j, gender in enumerate(genders):
+            stats[str(gender)] = gender_counts[:, j]
+
+        stats['mean_age'] = stats['mean_age'].round(2)
+        return stats
+
+
+# --- Running the code on the attached dataset ---
+
+if __name__ == "__main__":
+    # Path to the attached dataset
+    file_path = "write full path here"
+
+    # Create analyzer instance
+    analyzer = PatientDataAnalyzer(file_path)
+
+    # Get gender distribution
+    gender_dist = analyzer.gender_distribution()
+
+    print(gender_dist)
+    analyzer.instrumentation.print_summary()
+
+    # Gender and age breakdowns of many cohorts in one pass
+    # cohorts = {"cohort_a": [10000032, 10000048], "cohort_b": [10000068]}
+    # print(analyzer.cohort_statistics(cohorts))
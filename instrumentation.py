@@ -0,0 +1,220 @@
+"""
+Per-stage instrumentation shared by all analyzers.
+
+Every analyzer class mixes in Instrumented and wraps its load, parse, join,
+aggregate and export stages in a stage context manager:
+
+    with self.stage("aggregate", rows_in=df) as stage:
+        result = df.groupby(...).size()
+        stage.rows_out = len(result)
+
+Each stage records wall time, rows in and out and the change in resident
+memory. The records of an analyzer are available as
+analyzer.instrumentation.records, as JSON via to_json()/write_json(), and
+are appended as JSON lines to the file named by MIMIC_INSTRUMENT_LOG, when set.
+Long-lived analyzers (see analysis_service) keep only their latest records,
+set with Instrumentation.limit.
+
+Setting MIMIC_PROFILE to "cprofile", "tracemalloc" or "cprofile,tracemalloc"
+additionally captures, per stage, the top functions by cumulative time and
+the Python allocation peak. Both are off by default, since they slow the
+stages down.
+
+rss_delta_mb is the change in the RSS of the whole process, not of the stage
+alone. Stages running at the same time, e.g. loads started with
+mimic_cache.load_async, include each other's allocations (and frees), as
+does traced_peak_mb, since tracemalloc traces every thread. Their numbers
+are only exact for stages that run alone.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+PROFILE_ENV = "MIMIC_PROFILE"
+LOG_ENV = "MIMIC_INSTRUMENT_LOG"
+# Functions kept per stage in the cProfile summary
+PROFILE_TOP_FUNCTIONS = 15
+
+_log_lock = threading.Lock()
+
+
+def profile_modes() -> set:
+    """Profilers switched on by MIMIC_PROFILE."""
+    value = os.environ.get(PROFILE_ENV, "")
+    return {mode.strip().lower() for mode in value.split(",") if mode.strip()}
+
+
+def _rss_bytes() -> int:
+    """Current resident set size; peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def row_count(obj: Any) -> Optional[int]:
+    """Rows of a DataFrame, Series, array or sized collection; None for anything else."""
+    if obj is None or isinstance(obj, int):
+        return obj
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+@dataclass
+class StageRecord:
+    """Measurements of one stage run."""
+    analyzer: str
+    stage: str
+    started_at: str
+    wall_seconds: float = 0.0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    rss_delta_mb: float = 0.0                   # whole process, concurrent stages included
+    traced_peak_mb: Optional[float] = None      # with MIMIC_PROFILE=tracemalloc
+    profile: Optional[List[Dict[str, Any]]] = None  # with MIMIC_PROFILE=cprofile
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def output(self, result):
+        """Set rows_out from result and return it, for `return stage.output(df)`."""
+        self.rows_out = row_count(result)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _profile_summary(profiler: cProfile.Profile) -> List[Dict[str, Any]]:
+    """Top functions of a profile by cumulative time."""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({function})",
+            "calls": ncalls,
+            "total_seconds": round(tottime, 6),
+            "cumulative_seconds": round(cumtime, 6),
+        })
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:PROFILE_TOP_FUNCTIONS]
+
+
+class Instrumentation:
+    """
+    Collects the StageRecords of one analyzer, all of them or only the
+    latest max_records.
+    """
+
+    def __init__(self, owner: str, max_records: Optional[int] = None):
+        self.owner = owner
+        self.records: Deque[StageRecord] = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def limit(self, max_records: Optional[int]):
+        """Keep only the latest max_records records from now on (None: keep all)."""
+        with self._lock:
+            self.records = deque(self.records, maxlen=max_records)
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Any = None) -> Iterator[StageRecord]:
+        """
+        Measure the enclosed block as stage `name`. rows_in may be a row count
+        or an object with a length; set rows_out (or use record.output) inside.
+        """
+        modes = profile_modes()
+        record = StageRecord(self.owner, name, datetime.now(timezone.utc).isoformat(),
+                             rows_in=row_count(rows_in))
+
+        traced_before = None
+        if "tracemalloc" in modes:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # Nested stages share the tracer, so an inner stage resets the outer peak
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+
+        profiler = None
+        if "cprofile" in modes:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is active (nested stage): the outer stage covers this one
+                profiler = None
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - start
+            record.rss_delta_mb = (_rss_bytes() - rss_before) / 1024 ** 2
+            if profiler is not None:
+                profiler.disable()
+                record.profile = _profile_summary(profiler)
+            if traced_before is not None:
+                record.traced_peak_mb = (tracemalloc.get_traced_memory()[1] - traced_before) / 1024 ** 2
+            with self._lock:
+                self.records.append(record)
+            _append_to_log(record)
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        """All records of this analyzer as a JSON array."""
+        with self._lock:
+            return json.dumps([record.to_dict() for record in self.records], indent=indent, default=str)
+
+    def write_json(self, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+        return path
+
+    def print_summary(self):
+        """Print one line per recorded stage."""
+        print(f"⏱️ Stages of {self.owner}:")
+        for record in self.records:
+            rows = f"{record.rows_in if record.rows_in is not None else '-'} → " \
+                   f"{record.rows_out if record.rows_out is not None else '-'}"
+            print(f"  {record.stage:<20} {record.wall_seconds:8.3f}s  rows {rows:<25} "
+                  f"RSS {record.rss_delta_mb:+.1f} MB")
+
+
+def _append_to_log(record: StageRecord):
+    """Append the record as one JSON line to MIMIC_INSTRUMENT_LOG, if set."""
+    path = os.environ.get(LOG_ENV)
+    if not path:
+        return
+    line = json.dumps(record.to_dict(), default=str)
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+class Instrumented:
+    """
+    Mixin giving an analyzer an Instrumentation (named after its class) and a stage() shortcut.
+    """
+
+    @property
+    def instrumentation(self) -> Instrumentation:
+        instrumentation = self.__dict__.get("_instrumentation")
+        if instrumentation is None:
+            instrumentation = self.__dict__.setdefault("_instrumentation", Instrumentation(type(self).__name__))
+        return instrumentation
+
+    def stage(self, name: str, rows_in: Any = None):
+        return self.instrumentation.stage(name, rows_in)
@@ -0,0 +1,412 @@
+"""
+Lab value time-series store built from labevents.csv.
+
+LabStatsAnalyzer answers one global question, the mean value per lab test.
+Clinical questions such as "the last 72h of creatinine for subject X" need the
+measurements of one patient and one item in time order. This store sorts the
+labevents rows once by (subject_id, itemid, charttime) into contiguous numeric
+arrays saved as .npy files and opened memory-mapped:
+
+    subjects.npy         sorted unique subject_ids
+    subject_offsets.npy  rows of subjects[i] are [subject_offsets[i], subject_offsets[i + 1])
+    itemid.npy           itemid per row (sorted within a subject)
+    charttime.npy        charttime per row as int64 ns (sorted within a subject and item)
+    value.npy            numeric value per row (NaN when missing or not numeric)
+    missing.npy          1 when the raw value is missing
+    items.npy, item_offsets.npy, item_order.npy, item_charttime.npy
+                         secondary index: rows sorted by (itemid, charttime)
+
+Per-patient and per-item range queries are binary searches over the
+memory-mapped arrays, and window_statistics computes compute_statistics-style
+aggregates over any time window without re-reading labevents.
+
+The build is out of core: chunks are spilled to disk, scattered into the
+memory-mapped arrays by subject (and item) bucket and sorted window by window,
+so memory is bounded by the chunk size, not by the size of labevents.
+
+ Requirments: file formats of labevents.csv (and d_labitems.csv for labels).
+ Demo files are in the README link
+"""
+
+import json
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from mimic_cache import iter_table_chunks, read_table
+from timestamps import parse_timestamps
+
+
+ARRAYS = ("subjects", "subject_offsets", "itemid", "charttime", "value", "missing",
+          "items", "item_offsets", "item_order", "item_charttime")
+# Per-row arrays of the primary (subject_id, itemid, charttime) order
+PRIMARY_DTYPES = {"itemid": np.int32, "charttime": np.int64, "value": np.float64, "missing": np.uint8}
+
+
+def _to_ns(value) -> Optional[int]:
+    """Convert a time bound (str, Timestamp, datetime64) to int64 ns; None stays None."""
+    return None if value is None else pd.Timestamp(value).value
+
+
+def _add_counts(counts: Optional[pd.Series], ids: np.ndarray) -> pd.Series:
+    """Add the number of rows per id in ids to counts (id -> rows)."""
+    unique, chunk_counts = np.unique(ids, return_counts=True)
+    chunk = pd.Series(chunk_counts, index=unique)
+    return chunk if counts is None else counts.add(chunk, fill_value=0).astype(np.int64)
+
+
+def _offsets(counts: Optional[pd.Series]) -> tuple[np.ndarray, np.ndarray]:
+    """Sorted ids and their row offsets (ids[i] owns rows [offsets[i], offsets[i + 1]))."""
+    if counts is None:
+        return np.array([], dtype=np.int32), np.zeros(1, dtype=np.int64)
+    counts = counts.sort_index()
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts.to_numpy(), out=offsets[1:])
+    return counts.index.to_numpy(dtype=np.int32), offsets
+
+
+def _open_output(path: str, dtype, rows: int) -> np.ndarray:
+    """A writable .npy array of rows elements, memory-mapped (an empty file cannot be)."""
+    if rows == 0:
+        array = np.zeros(0, dtype=dtype)
+        np.save(path, array)
+        return array
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(rows,))
+
+
+def _bucket_destinations(buckets: np.ndarray, next_row: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Stable scatter of rows into buckets: returns (order, destination) so that
+    row order[k] goes to destination[k], and advances next_row (next free row
+    per bucket) past the rows written.
+    """
+    order = np.argsort(buckets, kind="stable")
+    sorted_buckets = buckets[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_buckets, sorted_buckets, side="left")
+    destination = next_row[sorted_buckets] + rank
+    next_row += np.bincount(buckets, minlength=len(next_row))
+    return order, destination
+
+
+def _windows(offsets: np.ndarray, window_rows: int):
+    """Yield (first, last) bucket ranges of about window_rows rows; a larger bucket is a window alone."""
+    first, buckets = 0, len(offsets) - 1
+    while first < buckets:
+        last = int(np.searchsorted(offsets, offsets[first] + window_rows, side="right")) - 1
+        last = min(max(last, first + 1), buckets)
+        yield first, last
+        first = last
+
+
+class LabTimeSeriesStore:
+    """
+    Memory-mapped lab time series indexed by (subject_id, itemid, charttime).
+    """
+
+    def __init__(self, store_dir: str):
+        """
+        Open an existing store. The arrays are memory-mapped on first use.
+        """
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._arrays = {}
+
+    def __getattr__(self, name: str):
+        if name in ARRAYS:
+            if name not in self._arrays:
+                self._arrays[name] = np.load(os.path.join(self.store_dir, f"{name}.npy"), mmap_mode="r")
+            return self._arrays[name]
+        raise AttributeError(name)
+
+    @staticmethod
+    def _source_version(labevents_path: str) -> dict:
+        stat = os.stat(labevents_path)
+        return {"source": os.path.abspath(labevents_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @classmethod
+    def build(cls, labevents_path: str, store_dir: str, chunksize: int = 5_000_000,
+              window_rows: Optional[int] = None) -> "LabTimeSeriesStore":
+        """
+        Build the store from labevents.csv with memory bounded by chunksize and
+        window_rows (default: chunksize) rows, not by the file size.
+
+        1. Every chunk is parsed once and spilled to a run of .npy files, while
+           the rows per subject and per item are counted.
+        2. The counts give every subject's final row range; the runs are
+           scattered into the memory-mapped arrays by subject bucket, in file
+           order, and deleted.
+        3. Windows of whole subjects (about window_rows rows) are sorted in
+           memory by (itemid, charttime) and written back.
+        The secondary (itemid, charttime) index is built the same way from the
+        primary arrays. Rows with equal keys keep their file order, as with a
+        stable sort of the whole table.
+        """
+        window_rows = window_rows or chunksize
+        run_dir = os.path.join(store_dir, "runs")
+        os.makedirs(run_dir, exist_ok=True)
+
+        # 1. Spill runs and count rows per subject and per item
+        run_rows, subject_counts, item_counts = [], None, None
+        columns = ["subject_id", "itemid", "charttime", "value"]
+        for run, chunk in enumerate(iter_table_chunks(labevents_path, columns, chunksize)):
+            arrays = {
+                "subject_id": chunk["subject_id"].to_numpy(dtype=np.int32),
+                "itemid": chunk["itemid"].to_numpy(dtype=np.int32),
+                "charttime": parse_timestamps(chunk["charttime"]),
+                "value": pd.to_numeric(chunk["value"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan),
+                "missing": chunk["value"].isnull().to_numpy(dtype=np.uint8),
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(run_dir, f"{run}.{name}.npy"), array)
+            run_rows.append(len(chunk))
+            subject_counts = _add_counts(subject_counts, arrays["subject_id"])
+            item_counts = _add_counts(item_counts, arrays["itemid"])
+        rows = sum(run_rows)
+
+        subjects, subject_offsets = _offsets(subject_counts)
+        items, item_offsets = _offsets(item_counts)
+
+        def path(name: str) -> str:
+            return os.path.join(store_dir, f"{name}.npy")
+
+        def run_path(run: int, name: str) -> str:
+            return os.path.join(run_dir, f"{run}.{name}.npy")
+
+        np.save(path("subjects"), subjects)
+        np.save(path("subject_offsets"), subject_offsets)
+        np.save(path("items"), items)
+        np.save(path("item_offsets"), item_offsets)
+        primary = {name: _open_output(path(name), dtype, rows) for name, dtype in PRIMARY_DTYPES.items()}
+
+        # 2. Scatter the runs into their subjects' row ranges
+        next_row = subject_offsets[:-1].copy()
+        for run in range(len(run_rows)):
+            buckets = np.searchsorted(subjects, np.load(run_path(run, "subject_id")))
+            order, destination = _bucket_destinations(buckets, next_row)
+            for name, out in primary.items():
+                out[destination] = np.load(run_path(run, name))[order]
+            for name in ("subject_id", *PRIMARY_DTYPES):
+                os.remove(run_path(run, name))
+        os.rmdir(run_dir)
+
+        # 3. Sort windows of whole subjects by (itemid, charttime)
+        for first, last in _windows(subject_offsets, window_rows):
+            lo, hi = subject_offsets[first], subject_offsets[last]
+            subject = np.repeat(np.arange(first, last), np.diff(subject_offsets[first:last + 1]))
+            order = np.lexsort((primary["charttime"][lo:hi], primary["itemid"][lo:hi], subject))
+            for out in primary.values():
+                out[lo:hi] = out[lo:hi][order]
+
+        # Secondary index: primary rows scattered by item, then windows of whole items sorted by charttime
+        item_order = _open_output(path("item_order"), np.int64, rows)
+        item_charttime = _open_output(path("item_charttime"), np.int64, rows)
+        next_row = item_offsets[:-1].copy()
+        for lo in range(0, rows, window_rows):
+            hi = min(lo + window_rows, rows)
+            order, destination = _bucket_destinations(np.searchsorted(items, primary["itemid"][lo:hi]), next_row)
+            item_order[destination] = lo + order
+            item_charttime[destination] = primary["charttime"][lo:hi][order]
+        for first, last in _windows(item_offsets, window_rows):
+            lo, hi = item_offsets[first], item_offsets[last]
+            item = np.repeat(np.arange(first, last), np.diff(item_offsets[first:last + 1]))
+            order = np.lexsort((item_charttime[lo:hi], item))
+            item_order[lo:hi] = item_order[lo:hi][order]
+            item_charttime[lo:hi] = item_charttime[lo:hi][order]
+
+        for array in (*primary.values(), item_order, item_charttime):
+            if isinstance(array, np.memmap):
+                array.flush()
+        del primary, item_order, item_charttime
+
+        meta = dict(cls._source_version(labevents_path), rows=int(rows))
+        with open(os.path.join(store_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return cls(store_dir)
+
+    @classmethod
+    def open_or_build(cls, labevents_path: str, store_dir: str) -> "LabTimeSeriesStore":
+        """
+        Open the store, rebuilding it first if it is missing or labevents.csv changed.
+        """
+        if os.path.exists(os.path.join(store_dir, "meta.json")):
+            store = cls(store_dir)
+            current = cls._source_version(labevents_path)
+            if all(store.meta.get(key) == current[key] for key in current):
+                return store
+        return cls.build(labevents_path, store_dir)
+
+    def _subject_rows(self, subject_id: int) -> tuple[int, int]:
+        """Row range of one subject, empty if the subject has no lab events."""
+        i = int(np.searchsorted(self.subjects, subject_id))
+        if i == len(self.subjects) or self.subjects[i] != subject_id:
+            return 0, 0
+        return int(self.subject_offsets[i]), int(self.subject_offsets[i + 1])
+
+    def _item_rows(self, itemid: int) -> tuple[int, int]:
+        """Range of one item in the secondary (item_order) index."""
+        i = int(np.searchsorted(self.items, itemid))
+        if i == len(self.items) or self.items[i] != itemid:
+            return 0, 0
+        return int(self.item_offsets[i]), int(self.item_offsets[i + 1])
+
+    @staticmethod
+    def _time_range(times: np.ndarray, start: Optional[int], end: Optional[int]) -> tuple[int, int]:
+        """Positions [lo, hi) of sorted times within [start, end]."""
+        lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side="right"))
+        return lo, hi
+
+    def patient_series(self, subject_id: int, itemid: Optional[int] = None,
+                       start=None, end=None) -> pd.DataFrame:
+        """
+        Lab measurements of one patient in time order, optionally for one item
+        and within [start, end].
+
+        Returns
+        -------
+        pd.DataFrame
+            itemid, charttime, value
+        """
+        first, last = self._subject_rows(subject_id)
+        start_ns, end_ns = _to_ns(start), _to_ns(end)
+
+        if itemid is not None:
+            items = self.itemid[first:last]
+            item_lo = first + int(np.searchsorted(items, itemid, side="left"))
+            item_hi = first + int(np.searchsorted(items, itemid, side="right"))
+            lo, hi = self._time_range(self.charttime[item_lo:item_hi], start_ns, end_ns)
+            rows = slice(item_lo + lo, item_lo + hi)
+            frame = pd.DataFrame({
+                "itemid": self.itemid[rows],
+                "charttime": self.charttime[rows].astype("datetime64[ns]"),
+                "value": self.value[rows],
+            })
+        else:
+            times = self.charttime[first:last]
+            mask = np.ones(len(times), dtype=bool)
+            if start_ns is not None:
+                mask &= times >= start_ns
+            if end_ns is not None:
+                mask &= times <= end_ns
+            frame = pd.DataFrame({
+                "itemid": self.itemid[first:last][mask],
+                "charttime": times[mask].astype("datetime64[ns]"),
+                "value": self.value[first:last][mask],
+            }).sort_values("charttime", kind="stable")
+        return frame.reset_index(drop=True)
+
+    def item_series(self, itemid: int, start=None, end=None) -> pd.DataFrame:
+        """
+        Measurements of one lab item for all patients within [start, end], in time order.
+
+        Returns
+        -------
+        pd.DataFrame
+            subject_id, charttime, value
+        """
+        first, last = self._item_rows(itemid)
+        lo, hi = self._time_range(self.item_charttime[first:last], _to_ns(start), _to_ns(end))
+        rows = np.asarray(self.item_order[first + lo:first + hi])
+        # The subject of a primary row is found from the subject offsets
+        subject_index = np.searchsorted(self.subject_offsets, rows, side="right") - 1
+        return pd.DataFrame({
+            "subject_id": np.asarray(self.subjects)[subject_index],
+            "charttime": np.asarray(self.item_charttime[first + lo:first + hi]).astype("datetime64[ns]"),
+            "value": np.asarray(self.value)[rows],
+        })
+
+    def window_statistics(self, start=None, end=None, itemids: Optional[Iterable[int]] = None,
+                          labitems_path: Optional[str] = None) -> pd.DataFrame:
+        """
+        compute_statistics-style aggregates over the measurements within [start, end].
+
+        Returns one row per itemid (or per label when labitems_path is given) with
+        mean_value, std_value, min_value, max_value and missing_percent.
+
+        The rows of all selected items are gathered once and reduced per item
+        with np.add/minimum/maximum.reduceat over the item offsets. Items are
+        combined per label with Chan et al.'s parallel variance formula.
+        """
+        start_ns, end_ns = _to_ns(start), _to_ns(end)
+        selected = self.items if itemids is None else np.intersect1d(self.items, np.asarray(list(itemids)))
+
+        # Secondary-index range [lo, hi) of every selected item within the window
+        bounds = np.array([self._item_rows(int(itemid)) for itemid in selected], dtype=np.int64).reshape(-1, 2)
+        lows, highs = bounds[:, 0].copy(), bounds[:, 1].copy()
+        for i, (first, last) in enumerate(bounds):
+            lo, hi = self._time_range(self.item_charttime[first:last], start_ns, end_ns)
+            lows[i], highs[i] = first + lo, first + hi
+        lengths = highs - lows
+        keep = lengths > 0
+        selected, lows, lengths = np.asarray(selected)[keep], lows[keep], lengths[keep]
+
+        # All rows of the kept items, item after item; segment i starts at offsets[i]
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        positions = np.repeat(lows - offsets, lengths) + np.arange(int(lengths.sum()))
+        rows = np.asarray(self.item_order)[positions]
+        values = np.asarray(self.value)[rows]
+        numeric = ~np.isnan(values)
+
+        if len(offsets):
+            count = np.add.reduceat(numeric, offsets)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.add.reduceat(np.where(numeric, values, 0.0), offsets) / count
+            deviation = np.where(numeric, values - np.repeat(mean, lengths), 0.0)
+            partials = pd.DataFrame({
+                "itemid": selected.astype(np.int64),
+                "value_count": count,
+                "value_mean": mean,
+                "value_m2": np.add.reduceat(np.square(deviation), offsets),
+                "value_min": np.minimum.reduceat(np.where(numeric, values, np.inf), offsets),
+                "value_max": np.maximum.reduceat(np.where(numeric, values, -np.inf), offsets),
+                "null_count": np.add.reduceat(np.asarray(self.missing)[rows].astype(np.int64), offsets),
+                "row_count": lengths,
+            })
+            # Items without a numeric value in the window
+            partials.loc[partials["value_count"] == 0, ["value_min", "value_max"]] = np.nan
+        else:
+            partials = pd.DataFrame(columns=["itemid", "value_count", "value_mean", "value_m2", "value_min",
+                                             "value_max", "null_count", "row_count"])
+
+        key = "itemid"
+        if labitems_path is not None:
+            labels = read_table(labitems_path, columns=["itemid", "label"])
+            partials = partials.merge(labels, on="itemid", how="left")
+            key = "label"
+
+        # Chan et al.: M2 = sum(M2_i) + sum(n_i * (mean_i - mean)^2)
+        partials["value_weighted"] = partials["value_count"] * partials["value_mean"].fillna(0.0)
+        grouped = partials.groupby(key, observed=True)
+        total = grouped["value_count"].transform("sum")
+        mean = grouped["value_weighted"].transform("sum") / total.where(total > 0)
+        deviation = (partials["value_count"] * (partials["value_mean"] - mean) ** 2).fillna(0.0)
+        partials = partials.assign(value_mean=mean, value_m2=partials["value_m2"] + deviation)
+        per_key = partials.groupby(key, observed=True).agg({
+            "value_count": "sum", "value_mean": "first", "value_m2": "sum", "value_min": "min",
+            "value_max": "max", "null_count": "sum", "row_count": "sum",
+        })
+
+        count = per_key["value_count"]
+        return pd.DataFrame({
+            "mean_value": per_key["value_mean"].where(count > 0),
+            "std_value": (per_key["value_m2"] / (count - 1).where(count > 1)) ** 0.5,
+            "min_value": per_key["value_min"],
+            "max_value": per_key["value_max"],
+            "missing_percent": per_key["null_count"] / per_key["row_count"] * 100,
+        }).reset_index().round(2)
+
+
+# Example usage
+if __name__ == "__main__":
+    store = LabTimeSeriesStore.open_or_build("enter full path for labevents.csv", "labevents_timeseries")
+
+    # Last 72h of one lab item for one patient
+    series = store.patient_series(10000032, itemid=50912, start="2180-05-04 00:00:00", end="2180-05-07 00:00:00")
+    print(series.to_string(index=False))
+
+    # Mean values per lab test within a time window
+    print(store.window_statistics(start="2180-01-01", end="2180-12-31", labitems_path="enter full path for d_labitems.csv"))
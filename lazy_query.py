@@ -0,0 +1,462 @@
+"""
+Lazy, query-planned access to the MIMIC tables.
+
+Each analyzer method reads whole columns of the whole table, so a metric
+over a date range still reads every row, and two metrics read the same
+table twice. Here, metrics are described first and computed later:
+
+    queries = LazyMIMIC({"admissions": "admissions.csv", "diagnoses_icd": "diagnoses_icd.csv"})
+    top10 = queries.top_icd(10, icd_version=10)                  # nothing is read yet
+    peaks = queries.peak_admission_times(start="2180-01-01", end="2181-01-01")
+    discharge = queries.discharge_destinations(start="2180-01-01", end="2181-01-01")
+    print(queries.plan.explain())
+    print(top10.result())                                        # one scan per table runs here
+
+Every metric is a Deferred: a function of a frame with the columns it
+needs, plus predicates on the rows. QueryPlan.collect, called by the first
+result(), plans all pending metrics together. Metrics on the same table
+share one scan. The scan reads the union of their columns, and the
+predicates common to all of them are pushed into the Parquet read of the
+mimic_cache file as pyarrow filters, which also skip row groups by their
+statistics. Predicates of only some metrics are applied to the scanned
+frame for those metrics. A metric may also take the results of metrics on
+other tables (lab_means takes the d_labitems labels); their scans run first.
+
+Timestamps are kept as text in MIMIC's fixed-width format, where text order is
+time order. Datetime bounds are written in that format, and string bounds are
+compared as text, so "2180-01-01" <= admittime < "2181-01-01" selects the year 2180.
+
+ Requirments: pyarrow for the pushdown; without it the columns are read
+ through read_table and the predicates are applied in memory.
+"""
+
+import operator
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import analyzers
+from admissions_engine import AdmissionsEngine
+from instrumentation import Instrumented
+from mimic_cache import read_table, table_columns, try_build_cache
+from timestamps import MIMIC_TIME_FORMAT
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pq = None
+
+
+_COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _normalize(value: Any) -> Any:
+    """Datetimes as MIMIC timestamp text, sequences as tuples (hashable)."""
+    if isinstance(value, (datetime, date, pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).strftime(MIMIC_TIME_FORMAT)
+    if isinstance(value, (list, tuple, set, np.ndarray, pd.Index, pd.Series)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """A row condition `column op value`, op one of == != < <= > >= in, not in."""
+    column: str
+    op: str
+    value: Any
+
+    def to_filter(self) -> tuple:
+        """The condition as a pyarrow filter tuple."""
+        return (self.column, self.op, list(self.value) if self.op in ("in", "not in") else self.value)
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        """Rows of df meeting the condition; missing values never do."""
+        values = df[self.column]
+        if self.op in ("in", "not in"):
+            matched = values.isin(self.value)
+            return ((matched if self.op == "in" else ~matched) & values.notna()).to_numpy(dtype=bool)
+        if isinstance(self.value, str):
+            # Unordered categoricals and object columns with missing values do not compare as text
+            values = values.astype("string")
+        result = _COMPARISONS[self.op](values, self.value)
+        return pd.Series(result).fillna(False).to_numpy(dtype=bool)
+
+    def __str__(self) -> str:
+        return f"{self.column} {self.op} {self.value!r}"
+
+
+class Column:
+    """Builds predicates on a column: col("icd_version") == 10, col("admittime").between(a, b)."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def _predicate(self, op: str, value: Any) -> Predicate:
+        return Predicate(self.name, op, _normalize(value))
+
+    def __eq__(self, value):
+        return self._predicate("==", value)
+
+    def __ne__(self, value):
+        return self._predicate("!=", value)
+
+    def __lt__(self, value):
+        return self._predicate("<", value)
+
+    def __le__(self, value):
+        return self._predicate("<=", value)
+
+    def __gt__(self, value):
+        return self._predicate(">", value)
+
+    def __ge__(self, value):
+        return self._predicate(">=", value)
+
+    __hash__ = None
+
+    def isin(self, values) -> Predicate:
+        return self._predicate("in", values)
+
+    def between(self, low, high) -> Tuple[Predicate, Predicate]:
+        """low <= column < high (both predicates; pass them to filter)."""
+        return self._predicate(">=", low), self._predicate("<", high)
+
+
+def col(name: str) -> Column:
+    return Column(name)
+
+
+def scan(source_path: str, columns: Sequence[str], predicates: Sequence[Predicate] = ()) -> pd.DataFrame:
+    """
+    Read columns of the rows meeting all predicates, with the predicates pushed into the Parquet read.
+    """
+    columns = list(dict.fromkeys(columns))
+    needed = list(dict.fromkeys(columns + [p.column for p in predicates]))
+    available = table_columns(source_path)
+    missing = [c for c in needed if c not in available]
+    if missing:
+        raise ValueError(f"Missing required columns in {source_path}: {missing}")
+
+    cached = try_build_cache(source_path) if pq is not None else None
+    if cached is None:
+        df = read_table(source_path, columns=needed)
+        mask = np.ones(len(df), dtype=bool)
+        for predicate in predicates:
+            mask &= predicate.mask(df)
+        return df.loc[mask, columns].reset_index(drop=True)
+
+    filters = [p.to_filter() for p in predicates] or None
+    return pq.read_table(cached, columns=columns, filters=filters, memory_map=True).to_pandas()
+
+
+@dataclass
+class _Query:
+    source_path: str
+    columns: Tuple[str, ...]
+    predicates: Tuple[Predicate, ...]
+    function: Callable[[pd.DataFrame], Any]
+    name: str
+    # Results of other metrics passed to function after the frame
+    inputs: Tuple["Deferred", ...] = ()
+    deferred: "Deferred" = field(default=None, repr=False)
+
+
+class Deferred:
+    """The result of a planned metric; result() runs the plan the first time it is needed."""
+
+    _PENDING = object()
+
+    def __init__(self, plan: "QueryPlan", name: str):
+        self.plan = plan
+        self.name = name
+        self._value = self._PENDING
+
+    @property
+    def done(self) -> bool:
+        return self._value is not self._PENDING
+
+    def result(self) -> Any:
+        if not self.done:
+            self.plan.collect()
+        return self._value
+
+    def __repr__(self) -> str:
+        return f"Deferred({self.name!r}, {'done' if self.done else 'pending'})"
+
+
+class LazyTable:
+    """A table with predicates; agg adds a metric over it to the plan."""
+
+    def __init__(self, plan: "QueryPlan", source_path: str, predicates: Tuple[Predicate, ...] = ()):
+        self.plan = plan
+        self.source_path = source_path
+        self.predicates = predicates
+
+    def filter(self, *predicates: Union[Predicate, Tuple[Predicate, ...]]) -> "LazyTable":
+        """A new LazyTable with the rows that also meet predicates (tuples from between are flattened)."""
+        flat = []
+        for predicate in predicates:
+            flat.extend(predicate if isinstance(predicate, tuple) else [predicate])
+        return LazyTable(self.plan, self.source_path, self.predicates + tuple(flat))
+
+    def agg(self, columns: Sequence[str], function: Callable[..., Any],
+            name: Optional[str] = None, inputs: Sequence[Deferred] = ()) -> Deferred:
+        """
+        Plan function(frame of columns, *results of inputs); the frame has only
+        the rows of this table's predicates. The scans of the inputs run first.
+        """
+        return self.plan.add(_Query(self.source_path, tuple(columns), self.predicates, function,
+                                    name or getattr(function, "__name__", "query"), tuple(inputs)))
+
+
+class QueryPlan(Instrumented):
+    """
+    Pending metrics, executed together with one scan per table.
+    """
+
+    def __init__(self):
+        self._pending: List[_Query] = []
+
+    def table(self, source_path: str) -> LazyTable:
+        return LazyTable(self, source_path)
+
+    def add(self, query: _Query) -> Deferred:
+        query.deferred = Deferred(self, query.name)
+        self._pending.append(query)
+        return query.deferred
+
+    def _scans(self) -> Dict[str, dict]:
+        """
+        source path -> columns, pushed-down predicates and queries with their
+        residual predicates, ordered so a scan runs after the scans of its inputs.
+        """
+        scans = {}
+        for query in self._pending:
+            scans.setdefault(query.source_path, []).append(query)
+        sources = {id(query.deferred): query.source_path for query in self._pending}
+        ordered: Dict[str, List[_Query]] = {}
+
+        def visit(source_path: str, visiting: Tuple[str, ...] = ()):
+            if source_path in ordered:
+                return
+            if source_path in visiting:
+                raise ValueError(f"Cyclic inputs between the scans of: {', '.join(visiting)}")
+            for query in scans[source_path]:
+                for deferred in query.inputs:
+                    input_source = sources.get(id(deferred))
+                    if input_source is not None and input_source != source_path:
+                        visit(input_source, visiting + (source_path,))
+            ordered[source_path] = scans[source_path]
+
+        for source_path in scans:
+            visit(source_path)
+        planned = {}
+        for source_path, queries in ordered.items():
+            common = set(queries[0].predicates).intersection(*(q.predicates for q in queries[1:]))
+            pushed = [p for p in queries[0].predicates if p in common]
+            residual = [[p for p in q.predicates if p not in common] for q in queries]
+            columns = [c for q, r in zip(queries, residual) for c in list(q.columns) + [p.column for p in r]]
+            planned[source_path] = {
+                "columns": list(dict.fromkeys(columns)),
+                "pushed": pushed,
+                "queries": list(zip(queries, residual)),
+            }
+        return planned
+
+    def explain(self) -> str:
+        """The scans collect would run for the pending metrics."""
+        lines = []
+        for source_path, planned in self._scans().items():
+            lines.append(f"scan {source_path}")
+            lines.append(f"  columns: {', '.join(planned['columns'])}")
+            lines.append(f"  pushed filters: {' AND '.join(map(str, planned['pushed'])) or '-'}")
+            for query, residual in planned["queries"]:
+                where = f" where {' AND '.join(map(str, residual))}" if residual else ""
+                using = f" using {', '.join(d.name for d in query.inputs)}" if query.inputs else ""
+                lines.append(f"  -> {query.name}({', '.join(query.columns)}){where}{using}")
+        return "\n".join(lines) or "(nothing pending)"
+
+    def collect(self) -> List[Any]:
+        """Run every pending metric and return their results in the order they were added."""
+        planned, queries = self._scans(), list(self._pending)
+        try:
+            self._run(planned)
+        finally:
+            # A failed scan leaves its metrics pending for the next collect
+            self._pending = [query for query in self._pending if not query.deferred.done]
+        return [query.deferred._value for query in queries]
+
+    def _run(self, planned: Dict[str, dict]):
+        for source_path, scan_plan in planned.items():
+            with self.stage("scan") as stage:
+                df = stage.output(scan(source_path, scan_plan["columns"], scan_plan["pushed"]))
+                stage.extra["source"] = source_path
+            for query, residual in scan_plan["queries"]:
+                with self.stage(query.name, rows_in=df) as stage:
+                    frame = df
+                    if residual:
+                        mask = np.ones(len(df), dtype=bool)
+                        for predicate in residual:
+                            mask &= predicate.mask(df)
+                        frame = df[mask]
+                    inputs = [deferred.result() for deferred in query.inputs]
+                    query.deferred._value = stage.output(query.function(frame[list(query.columns)], *inputs))
+
+
+# Analyzer metrics as deferred queries
+
+def _top_icd_codes(top_n: int) -> Callable[[pd.DataFrame], pd.DataFrame]:
+    def top_icd_codes(df: pd.DataFrame) -> pd.DataFrame:
+        icd_counts = df['icd_code'].value_counts()
+        icd_counts = icd_counts[icd_counts > 0].head(top_n).reset_index()
+        icd_counts.columns = ['icd_code', 'count']
+        icd_counts['percentage'] = (icd_counts['count'] / df['icd_code'].count() * 100).round(2)
+        return icd_counts
+    return top_icd_codes
+
+
+def _top_icd(top_n: int) -> Callable[[pd.DataFrame], pd.DataFrame]:
+    def top_icd(df: pd.DataFrame) -> pd.DataFrame:
+        analyzer = analyzers.TopICDAnalyzer(None, top_n=top_n)
+        return analyzer.compute_top_icd(analyzer._clean_diagnoses(df.copy()))
+    return top_icd
+
+
+def _mean_unique_icd(df: pd.DataFrame) -> float:
+    pairs = df.dropna(subset=["subject_id", "icd_code"]).drop_duplicates(["subject_id", "icd_code"])
+    return float(pairs.groupby("subject_id", observed=True).size().mean())
+
+
+def _gender_distribution(df: pd.DataFrame) -> pd.Series:
+    distribution = df['gender'].value_counts()
+    return distribution[distribution > 0]
+
+
+def _peak_admission_times(df: pd.DataFrame) -> dict:
+    hourly, daily = AdmissionsEngine(df).peak_admission_times()
+    return {"hourly": hourly, "daily": daily}
+
+
+def _discharge_destinations(df: pd.DataFrame) -> pd.DataFrame:
+    return AdmissionsEngine(df).discharge_destination_summary()
+
+
+def _los_statistics(df: pd.DataFrame) -> dict:
+    los = AdmissionsEngine(df).length_of_stay()
+    return {
+        "average": float(los.mean()) if len(los) else float("nan"),
+        "median": float(np.median(los)) if len(los) else float("nan"),
+        "count_used": len(los),
+    }
+
+
+def _lab_items(df: pd.DataFrame) -> pd.DataFrame:
+    return df
+
+
+def _lab_means(df: pd.DataFrame, labitems: pd.DataFrame) -> pd.DataFrame:
+    values = pd.DataFrame({"itemid": df["itemid"], "value_num": pd.to_numeric(df["value"], errors="coerce")})
+    merged = values.merge(labitems, on="itemid", how="left")
+    return merged.groupby("label", observed=True)["value_num"].mean().round(2).rename("mean_value").reset_index()
+
+
+class LazyMIMIC:
+    """
+    Deferred analyzer metrics over a set of MIMIC tables, all in one QueryPlan.
+
+    paths : table name (patients, admissions, diagnoses_icd, labevents, d_labitems) -> source file.
+    """
+
+    def __init__(self, paths: Dict[str, str]):
+        self.paths = dict(paths)
+        self.plan = QueryPlan()
+
+    def _table(self, table: str) -> LazyTable:
+        if table not in self.paths:
+            raise KeyError(f"No source file configured for table: {table}")
+        return self.plan.table(self.paths[table])
+
+    def _admissions(self, start=None, end=None) -> LazyTable:
+        admissions = self._table("admissions")
+        if start is not None:
+            admissions = admissions.filter(col("admittime") >= start)
+        if end is not None:
+            admissions = admissions.filter(col("admittime") < end)
+        return admissions
+
+    def _diagnoses(self, icd_version: Optional[int] = None) -> LazyTable:
+        diagnoses = self._table("diagnoses_icd")
+        return diagnoses if icd_version is None else diagnoses.filter(col("icd_version") == icd_version)
+
+    def gender_distribution(self) -> Deferred:
+        return self._table("patients").agg(["gender"], _gender_distribution, "gender_distribution")
+
+    def top_icd_codes(self, top_n: int = 10, icd_version: Optional[int] = None) -> Deferred:
+        """As UniqueICDAnalyzer.get_top_icd_codes."""
+        return self._diagnoses(icd_version).agg(["icd_code"], _top_icd_codes(top_n), "top_icd_codes")
+
+    def top_icd(self, top_n: int = 10, icd_version: Optional[int] = None) -> Deferred:
+        """As TopICDAnalyzer.compute_top_icd: top (icd_code, icd_version) pairs."""
+        return self._diagnoses(icd_version).agg(["icd_code", "icd_version"], _top_icd(top_n), "top_icd")
+
+    def mean_unique_icd(self, icd_version: Optional[int] = None) -> Deferred:
+        """Average number of unique ICD codes per patient."""
+        return self._diagnoses(icd_version).agg(["subject_id", "icd_code"], _mean_unique_icd, "mean_unique_icd")
+
+    def peak_admission_times(self, start=None, end=None) -> Deferred:
+        """Hourly and daily admission counts of admissions with start <= admittime < end."""
+        return self._admissions(start, end).agg(["admittime"], _peak_admission_times, "peak_admission_times")
+
+    def discharge_destinations(self, start=None, end=None) -> Deferred:
+        return self._admissions(start, end).agg(["admittime", "discharge_location"],
+                                                _discharge_destinations, "discharge_destinations")
+
+    def los_statistics(self, start=None, end=None) -> Deferred:
+        """Average and median Length of Stay, as LOSAdmissionsAnalyzer.average_and_median_los."""
+        return self._admissions(start, end).agg(["admittime", "dischtime"], _los_statistics, "los_statistics")
+
+    def lab_means(self, start=None, end=None) -> Deferred:
+        """Mean numeric value per lab label for lab events with start <= charttime < end."""
+        labevents = self._table("labevents")
+        if start is not None:
+            labevents = labevents.filter(col("charttime") >= start)
+        if end is not None:
+            labevents = labevents.filter(col("charttime") < end)
+        labitems = self._table("d_labitems").agg(["itemid", "label"], _lab_items, "lab_items")
+        return labevents.agg(["itemid", "value"], _lab_means, "lab_means", inputs=[labitems])
+
+    def collect(self) -> List[Any]:
+        """Compute every pending metric now (one scan per table)."""
+        return self.plan.collect()
+
+
+# Example usage
+if __name__ == "__main__":
+    queries = LazyMIMIC({
+        "admissions": "enter full path for, admissions.csv",
+        "diagnoses_icd": "enter full path for, diagnoses_icd.csv",
+    })
+    top10 = queries.top_icd(10, icd_version=10)
+    mean_codes = queries.mean_unique_icd(icd_version=10)
+    peaks = queries.peak_admission_times(start="2180-01-01", end="2181-01-01")
+    discharge = queries.discharge_destinations(start="2180-01-01", end="2181-01-01")
+
+    print("🧭 Query plan:\n" + queries.plan.explain())
+    print("\n🔥 Top 10 ICD-10 codes:\n", top10.result())
+    print(f"\n📊 ICD-10 codes per patient on average: {mean_codes.result():.2f}")
+    print("\n📈 Admissions by Hour (2180):\n", peaks.result()["hourly"].to_string(index=False))
+    print("\n🏥 Discharge Destination Summary (2180):\n", discharge.result())
+    queries.plan.instrumentation.print_summary()
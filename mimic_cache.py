@@ -0,0 +1,238 @@
+"""
+Shared loader with a columnar cache for the MIMIC CSV tables.
+
+The first time a CSV file is read through read_table it is parsed once and
+written as a typed Parquet file into a cache directory: the cache_dir argument,
+else the MIMIC_CACHE_DIR environment variable, else ".mimic_cache" next to the
+source. When that directory cannot be written (e.g. a read-only data mount)
+tables are read directly from the CSV instead. The cache file is keyed on the source path, size and mtime,
+so a replaced or appended CSV is converted again and the stale cache file is
+removed. Later reads are memory-mapped Parquet reads of only the columns the
+analyzer asks for, instead of a full CSV parse.
+
+Tables are cast to the compact dtypes of mimic_schema (categoricals, int32 ids,
+Int8 icd_version) when they are parsed, and the Parquet cache keeps those dtypes.
+
+Analyzers that need several tables start their loads with load_async and get
+futures back, so independent tables are parsed concurrently on a shared thread
+pool. The CSV parse uses pyarrow's multithreaded reader, which releases the GIL.
+
+Requirments: pyarrow for the Parquet cache. Without it read_table falls back
+to pd.read_csv with usecols.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+import pandas as pd
+
+from mimic_schema import SCHEMA_VERSION, apply_schema, parse_dtypes, table_name
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pq = None
+
+
+CACHE_DIR_NAME = ".mimic_cache"
+# Environment variable overriding the cache directory of every table
+CACHE_DIR_ENV = "MIMIC_CACHE_DIR"
+LOADER_THREADS = min(4, os.cpu_count() or 1)
+
+_loader_pool: Optional[ThreadPoolExecutor] = None
+_loader_pool_lock = threading.Lock()
+# Cache directories already reported as not writable
+_unwritable_dirs = set()
+
+
+def _source_key(source_path: str) -> tuple[str, str]:
+    """
+    Return (path digest, version digest) of a source file.
+    The version digest changes whenever the file size or mtime changes.
+    """
+    stat = os.stat(source_path)
+    path_digest = hashlib.sha1(source_path.encode("utf-8")).hexdigest()[:10]
+    version = f"{stat.st_size}:{stat.st_mtime_ns}:{SCHEMA_VERSION}"
+    version_digest = hashlib.sha1(version.encode("utf-8")).hexdigest()[:10]
+    return path_digest, version_digest
+
+
+def cache_directory(source_path: str, cache_dir: Optional[str] = None) -> str:
+    """
+    Cache directory of source_path: cache_dir, else $MIMIC_CACHE_DIR, else
+    .mimic_cache next to the source.
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV)
+    if cache_dir:
+        return os.path.abspath(os.path.expanduser(cache_dir))
+    return os.path.join(os.path.dirname(os.path.abspath(source_path)), CACHE_DIR_NAME)
+
+
+def cache_writable(directory: str) -> bool:
+    """
+    Create directory if needed and return whether cache files can be written into it.
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return False
+    return os.access(directory, os.W_OK)
+
+
+def cache_path(source_path: str, cache_dir: Optional[str] = None) -> str:
+    """
+    Return the Parquet cache path for the current version of source_path.
+    """
+    source_path = os.path.abspath(source_path)
+    path_digest, version_digest = _source_key(source_path)
+    stem = os.path.basename(source_path).split(".")[0]
+    cache_dir = cache_directory(source_path, cache_dir)
+    return os.path.join(cache_dir, f"{stem}-{path_digest}-{version_digest}.parquet")
+
+
+def build_cache(source_path: str, cache_dir: Optional[str] = None) -> str:
+    """
+    Convert source_path to its Parquet cache file if it is missing or stale.
+    Returns the cache file path.
+
+    Raises PermissionError when the cache directory cannot be written.
+    """
+    target = cache_path(source_path, cache_dir)
+    if os.path.exists(target):
+        return target
+
+    directory = os.path.dirname(target)
+    if not cache_writable(directory):
+        raise PermissionError(f"Cache directory is not writable: {directory}")
+
+    table = table_name(source_path)
+    try:
+        # pyarrow's CSV reader is multithreaded and releases the GIL, so concurrent loads overlap
+        df = pd.read_csv(source_path, dtype=parse_dtypes(table), engine="pyarrow")
+    except Exception:
+        # pyarrow infers column types from the first block; fall back to the C parser
+        # for files where a later block does not fit the inferred type
+        df = pd.read_csv(source_path, dtype=parse_dtypes(table), low_memory=False)
+    df = apply_schema(df, table)
+
+    # Write to a temporary file first so concurrent readers never see a partial cache
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, target)
+
+    # Remove cache files of older versions of the same source
+    prefix = os.path.basename(target).rsplit("-", 1)[0] + "-"
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(".parquet") and name != os.path.basename(target):
+            os.remove(os.path.join(directory, name))
+
+    return target
+
+
+def try_build_cache(source_path: str, cache_dir: Optional[str] = None) -> Optional[str]:
+    """
+    build_cache, or None (with a warning per directory) when the cache
+    directory cannot be written and the source has to be read directly.
+    """
+    try:
+        return build_cache(source_path, cache_dir)
+    except PermissionError as e:
+        directory = cache_directory(source_path, cache_dir)
+        if directory not in _unwritable_dirs:
+            _unwritable_dirs.add(directory)
+            print(f"[WARN] {e}; reading the CSV files directly (set {CACHE_DIR_ENV} to cache elsewhere)")
+        return None
+
+
+def table_columns(source_path: str, use_cache: bool = True, cache_dir: Optional[str] = None) -> List[str]:
+    """
+    Return the column names of a source table without loading its rows.
+    """
+    cached = try_build_cache(source_path, cache_dir) if pq is not None and use_cache else None
+    if cached is not None:
+        return list(pq.read_schema(cached).names)
+    return list(pd.read_csv(source_path, nrows=0).columns)
+
+
+def _check_columns(source_path: str, columns: Optional[List[str]], use_cache: bool,
+                   cache_dir: Optional[str] = None):
+    if columns is None:
+        return
+    missing = [col for col in columns if col not in table_columns(source_path, use_cache, cache_dir)]
+    if missing:
+        raise ValueError(f"Missing required columns in {os.path.basename(source_path)}: {missing}")
+
+
+def read_table(source_path: str, columns: Optional[List[str]] = None, use_cache: bool = True,
+               cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """
+    Load a MIMIC table through the columnar cache.
+
+    Parameters
+    ----------
+    source_path : str
+        Path to the MIMIC CSV file (e.g. admissions.csv).
+    columns : list of str, optional
+        Columns to load. Only these columns are read from the cache, with
+        the compact dtypes of mimic_schema.
+    use_cache : bool
+        Set to False to parse the CSV directly.
+    cache_dir : str, optional
+        Cache directory (default: $MIMIC_CACHE_DIR, else .mimic_cache next to
+        the source). The CSV is parsed directly when it is not writable.
+
+    Raises
+    ------
+    ValueError
+        If one of the requested columns does not exist in the table.
+    """
+    _check_columns(source_path, columns, use_cache, cache_dir)
+    cached = try_build_cache(source_path, cache_dir) if pq is not None and use_cache else None
+    if cached is None:
+        table = table_name(source_path)
+        return apply_schema(pd.read_csv(source_path, usecols=columns, dtype=parse_dtypes(table, columns)), table)
+    return pd.read_parquet(cached, columns=columns, memory_map=True)
+
+
+def load_async(loader: Callable, *args, **kwargs) -> Future:
+    """
+    Run a table loader (read_table or an analyzer's _load_* method) on the shared
+    loader thread pool and return its future. Call .result() when the table is needed.
+    """
+    global _loader_pool
+    with _loader_pool_lock:
+        if _loader_pool is None:
+            _loader_pool = ThreadPoolExecutor(max_workers=LOADER_THREADS, thread_name_prefix="mimic-loader")
+    return _loader_pool.submit(loader, *args, **kwargs)
+
+
+def read_table_async(source_path: str, columns: Optional[List[str]] = None, use_cache: bool = True,
+                     cache_dir: Optional[str] = None) -> Future:
+    """
+    read_table on the loader thread pool; returns a future of the DataFrame.
+    """
+    return load_async(read_table, source_path, columns=columns, use_cache=use_cache, cache_dir=cache_dir)
+
+
+def iter_table_chunks(source_path: str, columns: List[str], chunksize: int,
+                      use_cache: bool = True, cache_dir: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Yield a table in chunks of at most chunksize rows.
+
+    Reads record batches from the cache when it already exists; otherwise the
+    CSV is streamed directly, so the cache is never built for a file that is
+    too large to load at once.
+    """
+    _check_columns(source_path, columns, use_cache=False)
+    if pq is not None and use_cache and os.path.exists(cache_path(source_path, cache_dir)):
+        parquet_file = pq.ParquetFile(cache_path(source_path, cache_dir), memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    table = table_name(source_path)
+    for chunk in pd.read_csv(source_path, usecols=columns, chunksize=chunksize,
+                             dtype=parse_dtypes(table, columns)):
+        yield apply_schema(chunk, table)
@@ -0,0 +1,140 @@
+"""
+Compact dtype schema of the MIMIC tables.
+
+Default pd.read_csv dtypes make every code, label and location column an
+object column and every id an int64, which costs several times the memory
+the data needs. TABLE_SCHEMAS maps each MIMIC table to compact dtypes:
+categoricals for code, label and location columns, int32 ids, small ints
+for ages, hours and flags and Int8 for icd_version. mimic_cache applies the
+schema when it parses a CSV, so every analyzer loading through read_table
+gets compact columns.
+
+Groupbys on the categorical columns should pass observed=True, so categories
+without rows are not reported.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+
+TABLE_SCHEMAS: Dict[str, Dict[str, object]] = {
+    "patients": {
+        "subject_id": "int32",
+        "gender": "category",
+        "anchor_age": "int16",
+        "anchor_year": "int16",
+        "anchor_year_group": "category",
+        "dod": str,
+    },
+    "admissions": {
+        "subject_id": "int32",
+        "hadm_id": "int32",
+        "admittime": str,
+        "dischtime": str,
+        "deathtime": str,
+        "admission_type": "category",
+        "admit_provider_id": "category",
+        "admission_location": "category",
+        "discharge_location": "category",
+        "insurance": "category",
+        "language": "category",
+        "marital_status": "category",
+        "race": "category",
+        "ethnicity": "category",
+        "edregtime": str,
+        "edouttime": str,
+        "hospital_expire_flag": "int8",
+    },
+    "diagnoses_icd": {
+        "subject_id": "int32",
+        "hadm_id": "int32",
+        "seq_num": "int16",
+        "icd_code": "category",
+        "icd_version": "Int8",
+    },
+    "d_icd_diagnoses": {
+        # One row per code, so a categorical would not save memory here
+        "icd_code": str,
+        "icd_version": "Int8",
+        "long_title": str,
+    },
+    "labevents": {
+        "labevent_id": "int64",
+        "subject_id": "int32",
+        "hadm_id": "Int32",
+        "specimen_id": "int32",
+        "itemid": "int32",
+        "order_provider_id": "category",
+        "charttime": str,
+        "storetime": str,
+        "value": str,
+        "valuenum": "float32",
+        "valueuom": "category",
+        "ref_range_lower": "float32",
+        "ref_range_upper": "float32",
+        "flag": "category",
+        "priority": "category",
+        "comments": str,
+    },
+    "d_labitems": {
+        "itemid": "int32",
+        "label": "category",
+        "fluid": "category",
+        "category": "category",
+    },
+}
+
+# Text columns of tables without a schema, which must not be parsed as numbers
+# (e.g. ICD-9 codes with leading zeros or lab values such as "___" mixed with numbers)
+DEFAULT_TEXT_COLUMNS = ("icd_code", "value", "valueuom", "label", "long_title", "comments", "flag")
+
+# Bump when TABLE_SCHEMAS changes, so cached tables are converted again
+SCHEMA_VERSION = 1
+
+
+def table_name(source_path: str) -> Optional[str]:
+    """
+    Return the MIMIC table of a source file by its name (admissions.csv, labevents.csv.gz, ...).
+    """
+    name = os.path.basename(source_path).split(".")[0].lower()
+    return name if name in TABLE_SCHEMAS else None
+
+
+def parse_dtypes(table: Optional[str], columns: Optional[List[str]] = None) -> Dict[str, object]:
+    """
+    dtypes that are safe to pass to pd.read_csv: text and categorical columns.
+    Numeric columns are cast afterwards by apply_schema, which tolerates missing values.
+    """
+    if table is None:
+        dtypes = {col: str for col in DEFAULT_TEXT_COLUMNS}
+    else:
+        dtypes = {col: dtype for col, dtype in TABLE_SCHEMAS[table].items() if dtype in (str, "category")}
+    if columns is not None:
+        dtypes = {col: dtype for col, dtype in dtypes.items() if col in columns}
+    return dtypes
+
+
+def apply_schema(df: pd.DataFrame, table: Optional[str]) -> pd.DataFrame:
+    """
+    Cast the columns of df to the compact dtypes of its table, in place.
+
+    A column declared as a plain integer that contains missing values is cast to
+    the nullable integer of the same width (int32 -> Int32) instead.
+    """
+    if table is None:
+        return df
+    for col, dtype in TABLE_SCHEMAS[table].items():
+        if col not in df.columns or dtype is str or df[col].dtype == dtype:
+            continue
+        try:
+            df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError):
+            if isinstance(dtype, str) and dtype.startswith("int"):
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype.capitalize())
+            elif isinstance(dtype, str) and dtype.startswith("Int"):
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+            else:
+                raise
+    return df
@@ -1,79 +1,458 @@
-import pandas as pd
-from typing import Optional
-
-
-class ICDAnalyzer:
-    """
-    Analyzes ICD codes from a diagnoses CSV file and computes the top N codes/ diseases
-    appear on patients diagnosis, along with their percentage of total diagnoses and descriptions.
-
-    requirements: csv files of, d_icd_diagnoses.csv and d_icd_diagnoses.csv. 
-    A link to demo of these files can be found in README. 
-         
-    """
-    
-    def __init__(self, diagnoses_path: str, dictionary_path: Optional[str] = None, top_n: int = 10) -> None:
-        
-        
-        self.diagnoses_path =  "enter path to diagnoses_path.csv"
-        self.dictionary_path = "enter path to d_icd_diagnoses.csv" 
-        self.top_n = top_n
-
-    def load_diagnoses(self) -> pd.DataFrame:
-        """Loads and cleans the diagnoses data."""
-        df = pd.read_csv(self.diagnoses_path, usecols=["icd_code", "icd_version"])
-        df["icd_code"] = df["icd_code"].astype(str).str.strip()
-        df["icd_version"] = pd.to_numeric(df["icd_version"], errors="coerce").astype("Int64")
-        df = df.dropna(subset=["icd_code", "icd_version"])
-        return df
-
-    def load_dictionary(self) -> Optional[pd.DataFrame]:
-        """Loads ICD dictionary with long titles if available."""
-        if not self.dictionary_path:
-            return None
-        try:
-            df = pd.read_csv(self.dictionary_path, usecols=["icd_code", "icd_version", "long_title"])
-            df["icd_code"] = df["icd_code"].astype(str).str.strip()
-            df["long_title"] = df["long_title"].astype(str).str.strip()
-            df["icd_version"] = pd.to_numeric(df["icd_version"], errors="coerce").astype("Int64")
-            df = df.dropna(subset=["icd_code", "icd_version"])
-            return df.drop_duplicates(subset=["icd_code", "icd_version"])
-        except Exception as e:
-            print(f"[WARN] Could not load dictionary: {e}")
-            return None
-
-    def compute_top_icd(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Computes top N ICD codes and their percentage of total."""
-        total = len(df)
-        grouped = (
-            df.groupby(["icd_code", "icd_version"])
-            .size()
-            .reset_index(name="count")
-            .sort_values("count", ascending=False)
-            .head(self.top_n)
-        )
-        grouped["percent"] = (grouped["count"] / total).round(4)
-        return grouped.reset_index(drop=True)
-
-    def enrich_with_descriptions(self, top_df: pd.DataFrame, dict_df: Optional[pd.DataFrame]) -> pd.DataFrame:
-        """Adds long_title descriptions to the top ICD codes."""
-        if dict_df is None:
-            top_df["long_title"] = None
-            return top_df
-        merged = top_df.merge(dict_df, on=["icd_code", "icd_version"], how="left")
-        return merged[["icd_code", "icd_version", "long_title", "count", "percent"]]
-
-    def run(self) -> pd.DataFrame:
-        """Runs the full analysis pipeline."""
-        diagnoses_df = self.load_diagnoses()
-        dictionary_df = self.load_dictionary()
-        top_icd_df = self.compute_top_icd(diagnoses_df)
-        final_df = self.enrich_with_descriptions(top_icd_df, dictionary_df)
-        return final_df
-
-
-# Example usage:
-if __name__ == "__main__":
-    analyzer = ICDAnalyzer("diagnoses_icd.csv", "d_icd_diagnoses.csv", top_n=10)
-    result = analyzer.run()
-    print(result.to_string(index=False))
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+from instrumentation import Instrumented
+from mimic_cache import cache_path, cache_writable, load_async, read_table
+import sql_backend
+from sketches import ICDSketchSummary, load_or_build
+
+# Bytes at the start of diagnoses_icd.csv hashed to detect a rewritten (not appended) file
+STATE_HEAD_BYTES = 64 * 1024
+STATE_CHUNKSIZE = 1_000_000
+
+
+class _BoundedReader(io.RawIOBase):
+    """Read at most `limit` bytes from an open binary file."""
+
+    def __init__(self, raw, limit: int):
+        self.raw = raw
+        self.remaining = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        data = self.raw.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+class ICDTitleIndex:
+    """
+    Persistent, memory-mapped (icd_version, icd_code) -> long_title index of d_icd_diagnoses.csv.
+
+    Built once per dictionary file version into the mimic_cache directory:
+    keys.npy holds the sorted fixed-width keys "version|code", offsets.npy the
+    start of each title in titles.bin. The files are opened lazily with memory
+    mapping on the first lookup, and every lookup is a binary search, so the
+    dictionary is never re-parsed or merged for a handful of codes.
+
+    Indexes of older versions of the dictionary are removed when a new one is
+    built. Concurrent builds (threads or processes) each write a private
+    directory and the first one published wins. When the cache directory
+    cannot be written, the same arrays are kept in memory for the process.
+    """
+
+    # Opened indexes shared by all analyzers in the process, by index directory
+    _open_indexes: Dict[str, tuple] = {}
+    _open_indexes_lock = threading.Lock()
+
+    def __init__(self, dictionary_path: str):
+        self.dictionary_path = dictionary_path
+        self.index_dir = cache_path(dictionary_path)[:-len(".parquet")] + ".titles"
+
+    @staticmethod
+    def _key(code: str, version) -> bytes:
+        return f"{int(version)}|{code}".encode("utf-8")
+
+    def _arrays(self) -> tuple:
+        """(sorted keys, title offsets, titles as uint8) of the dictionary."""
+        df = read_table(self.dictionary_path, columns=["icd_code", "icd_version", "long_title"])
+        df["icd_code"] = df["icd_code"].astype(str).str.strip()
+        df["long_title"] = df["long_title"].astype(str).str.strip()
+        df["icd_version"] = pd.to_numeric(df["icd_version"], errors="coerce").astype("Int64")
+        df = df.dropna(subset=["icd_code", "icd_version"]).drop_duplicates(subset=["icd_code", "icd_version"])
+
+        keys = np.array([self._key(c, v) for c, v in zip(df["icd_code"], df["icd_version"])], dtype=bytes)
+        order = np.argsort(keys, kind="stable")
+        titles = [df["long_title"].iat[i].encode("utf-8") for i in order]
+        offsets = np.zeros(len(titles) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in titles], out=offsets[1:])
+        return keys[order], offsets, np.frombuffer(b"".join(titles), dtype=np.uint8)
+
+    def build(self) -> bool:
+        """
+        Builds the index files from the dictionary if they do not exist yet.
+        Returns False, without building, when the cache directory is not writable.
+        """
+        if os.path.exists(os.path.join(self.index_dir, "keys.npy")):
+            return True
+        if not cache_writable(os.path.dirname(self.index_dir)):
+            return False
+        keys, offsets, titles = self._arrays()
+
+        tmp_dir = f"{self.index_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        np.save(os.path.join(tmp_dir, "keys.npy"), keys)
+        np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+        with open(os.path.join(tmp_dir, "titles.bin"), "wb") as f:
+            f.write(titles.tobytes())
+        try:
+            os.replace(tmp_dir, self.index_dir)
+        except OSError:
+            # Another process published the same version first; its index is identical
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.exists(os.path.join(self.index_dir, "keys.npy")):
+                raise
+        self._remove_stale_versions()
+        return True
+
+    def _remove_stale_versions(self) -> None:
+        """Removes the indexes of older versions of the same dictionary file."""
+        directory, name = os.path.split(self.index_dir)
+        prefix = name.rsplit("-", 1)[0] + "-"
+        for entry in os.listdir(directory):
+            if entry.startswith(prefix) and entry.endswith(".titles") and entry != name:
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+    def load(self) -> tuple:
+        """Builds the index if needed and opens it; safe to call from a loader thread."""
+        # One lock for all indexes: threads of the process build and open each index once
+        with self._open_indexes_lock:
+            if self.index_dir not in self._open_indexes:
+                if self.build():
+                    keys = np.load(os.path.join(self.index_dir, "keys.npy"), mmap_mode="r")
+                    offsets = np.load(os.path.join(self.index_dir, "offsets.npy"), mmap_mode="r")
+                    titles_path = os.path.join(self.index_dir, "titles.bin")
+                    titles = np.memmap(titles_path, dtype=np.uint8, mode="r") if os.path.getsize(titles_path) else np.zeros(0, np.uint8)
+                    self._open_indexes[self.index_dir] = (keys, offsets, titles)
+                else:
+                    # Unwritable cache directory: the index lives in memory for this process
+                    self._open_indexes[self.index_dir] = self._arrays()
+            return self._open_indexes[self.index_dir]
+
+    def lookup(self, codes, versions) -> list:
+        """Returns the long_title of each (code, version) pair, None when unknown."""
+        keys, offsets, titles = self.load()
+        result = []
+        for code, version in zip(codes, versions):
+            key = self._key(code, version)
+            position = int(np.searchsorted(keys, key))
+            if len(key) <= keys.dtype.itemsize and position < len(keys) and keys[position] == key:
+                result.append(bytes(titles[offsets[position]:offsets[position + 1]]).decode("utf-8"))
+            else:
+                result.append(None)
+        return result
+
+
+class ICDAnalyzer(Instrumented):
+    """
+    Analyzes ICD codes from a diagnoses CSV file and computes the top N codes/ diseases
+    appear on patients diagnosis, along with their percentage of total diagnoses and descriptions.
+
+    requirements: csv files of, d_icd_diagnoses.csv and d_icd_diagnoses.csv. 
+    A link to demo of these files can be found in README. 
+
+    Incremental mode: with a state_path, the (icd_code, icd_version) -> count table, the total
+    and the byte offset read so far are persisted as JSON. Later runs read only the rows
+    appended to diagnoses_icd.csv since then; a rewritten file triggers a full rebuild.
+
+    Load, parse, aggregate and join stages are recorded in self.instrumentation.
+
+    backend="duckdb" computes the top N codes with a DuckDB query over the file
+    (see sql_backend) instead of loading the diagnoses into pandas.
+
+    approximate=True answers run() from mergeable sketches of the diagnoses
+    (see sketches.ICDSketchSummary): counts are upper bounds, with lower_bound
+    and guaranteed columns, and sketch_path keeps the sketches between runs.
+         
+    """
+    
+    def __init__(self, diagnoses_path: str, dictionary_path: Optional[str] = None, top_n: int = 10,
+                 state_path: Optional[str] = None, backend: str = "pandas",
+                 approximate: bool = False, sketch_path: Optional[str] = None) -> None:
+        self.diagnoses_path = diagnoses_path
+        self.backend = sql_backend.check_backend(backend)
+        self.approximate = approximate
+        self.sketch_path = sketch_path
+        self._sketch: Optional[ICDSketchSummary] = None
+        self.dictionary_path = dictionary_path
+        self.top_n = top_n
+        self.state_path = state_path
+        self._title_index: Optional[ICDTitleIndex] = None
+        self._title_index_future = None
+
+    @property
+    def title_index(self) -> Optional[ICDTitleIndex]:
+        """Lazily created description index of the dictionary file."""
+        if self._title_index is None and self.dictionary_path:
+            self._title_index = ICDTitleIndex(self.dictionary_path)
+        return self._title_index
+
+    @staticmethod
+    def _strip_codes(codes: pd.Series) -> pd.Series:
+        """
+        Strips whitespace from ICD codes. Categorical codes stay categorical: only
+        the categories are stripped, and categories that become equal are merged.
+        """
+        if not isinstance(codes.dtype, pd.CategoricalDtype):
+            return codes.astype(str).str.strip()
+        if len(codes.cat.categories) == 0:
+            return codes
+        categories, inverse = np.unique(codes.cat.categories.astype(str).str.strip(), return_inverse=True)
+        old_codes = codes.cat.codes.to_numpy()
+        new_codes = np.where(old_codes >= 0, inverse[old_codes], -1)
+        return pd.Series(pd.Categorical.from_codes(new_codes, categories=categories), index=codes.index, name=codes.name)
+
+    @classmethod
+    def _clean_diagnoses(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """Normalizes icd_code/icd_version and drops incomplete rows."""
+        df["icd_code"] = cls._strip_codes(df["icd_code"])
+        df["icd_version"] = pd.to_numeric(df["icd_version"], errors="coerce").astype("Int8")
+        return df.dropna(subset=["icd_code", "icd_version"])
+
+    def load_diagnoses(self) -> pd.DataFrame:
+        """Loads and cleans the diagnoses data."""
+        with self.stage("load") as stage:
+            df = stage.output(read_table(self.diagnoses_path, columns=["icd_code", "icd_version"]))
+        with self.stage("parse", rows_in=df) as stage:
+            return stage.output(self._clean_diagnoses(df))
+
+    def _load_state(self) -> Optional[dict]:
+        """Loads the persisted count state, if any."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state: dict) -> None:
+        """Atomically writes the count state."""
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def _head_digest(path: str, length: int) -> str:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read(length)).hexdigest()
+
+    @staticmethod
+    def _complete_lines_end(path: str, size: int) -> int:
+        """Returns the offset just after the last newline, so a partially written row is never read."""
+        with open(path, "rb") as f:
+            position = size
+            while position > 0:
+                block_start = max(0, position - 64 * 1024)
+                f.seek(block_start)
+                block = f.read(position - block_start)
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    return block_start + newline + 1
+                position = block_start
+        return 0
+
+    def _count_rows(self, start: int, end: int, columns: list) -> pd.Series:
+        """Counts (icd_code, icd_version) pairs in the byte range [start, end) of the diagnoses file."""
+        counts = pd.Series(dtype="int64")
+        with open(self.diagnoses_path, "rb") as raw:
+            raw.seek(start)
+            reader = pd.read_csv(
+                io.BufferedReader(_BoundedReader(raw, end - start)),
+                header=0 if start == 0 else None,
+                names=None if start == 0 else columns,
+                usecols=["icd_code", "icd_version"],
+                dtype={"icd_code": str},
+                chunksize=STATE_CHUNKSIZE
+            )
+            for chunk in reader:
+                chunk_counts = self._clean_diagnoses(chunk).groupby(["icd_code", "icd_version"]).size()
+                counts = chunk_counts if counts.empty else counts.add(chunk_counts, fill_value=0)
+        return counts.astype("int64")
+
+    def update_counts(self) -> pd.DataFrame:
+        """
+        Brings the persisted (icd_code, icd_version) counts up to date and returns them.
+
+        Only rows appended since the last run are read. If the file shrank or its first
+        bytes changed, the file was rewritten and the counts are rebuilt from scratch.
+        """
+        source = os.path.abspath(self.diagnoses_path)
+        end = self._complete_lines_end(source, os.path.getsize(source))
+        state = self._load_state()
+
+        rebuild = (
+            state is None
+            or state["source"] != source
+            or end < state["offset"]
+            or self._head_digest(source, min(STATE_HEAD_BYTES, state["offset"])) != state["head_digest"]
+        )
+        if rebuild:
+            with open(source, "rb") as f:
+                columns = pd.read_csv(f, nrows=0).columns.tolist()
+            counts, start = pd.Series(dtype="int64"), 0
+        else:
+            columns = state["columns"]
+            counts = pd.Series(
+                [count for _, _, count in state["counts"]],
+                index=pd.MultiIndex.from_tuples(
+                    [(code, version) for code, version, _ in state["counts"]],
+                    names=["icd_code", "icd_version"]
+                ),
+                dtype="int64"
+            )
+            start = state["offset"]
+
+        if end > start:
+            with self.stage("aggregate_appended") as stage:
+                new_counts = stage.output(self._count_rows(start, end, columns))
+                stage.extra["bytes_read"] = end - start
+            counts = new_counts if counts.empty else counts.add(new_counts, fill_value=0).astype("int64")
+
+        if self.state_path:
+            self._save_state({
+                "source": source,
+                "offset": end,
+                "head_digest": self._head_digest(source, min(STATE_HEAD_BYTES, end)),
+                "columns": columns,
+                "total": int(counts.sum()),
+                "counts": [[code, int(version), int(count)] for (code, version), count in counts.items()],
+            })
+
+        return counts.rename("count").reset_index()
+
+    def compute_top_icd_incremental(self) -> pd.DataFrame:
+        """Computes top N ICD codes and their percentage of total from the persisted counts."""
+        return self.top_from_counts(self.update_counts(), self.top_n)
+
+    @staticmethod
+    def top_from_counts(counts: pd.DataFrame, top_n: int) -> pd.DataFrame:
+        """
+        Top N rows of an (icd_code, icd_version, count) table, as update_counts returns,
+        and their percentage of total. Count tables of several files can be added
+        up first (e.g. one per site).
+        """
+        total = counts["count"].sum()
+        top = counts.nlargest(top_n, "count").reset_index(drop=True)
+        top["icd_version"] = top["icd_version"].astype("Int64")
+        top["percent"] = (top["count"] / total).round(4)
+        return top
+
+    def load_dictionary(self) -> Optional[pd.DataFrame]:
+        """Loads ICD dictionary with long titles if available."""
+        if not self.dictionary_path:
+            return None
+        try:
+            df = read_table(self.dictionary_path, columns=["icd_code", "icd_version", "long_title"])
+            df["icd_code"] = df["icd_code"].astype(str).str.strip()
+            df["long_title"] = df["long_title"].astype(str).str.strip()
+            df["icd_version"] = pd.to_numeric(df["icd_version"], errors="coerce").astype("Int64")
+            df = df.dropna(subset=["icd_code", "icd_version"])
+            return df.drop_duplicates(subset=["icd_code", "icd_version"])
+        except Exception as e:
+            print(f"[WARN] Could not load dictionary: {e}")
+            return None
+
+    def compute_top_icd(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Computes top N ICD codes and their percentage of total.
+
+        (icd_code, icd_version) pairs are factorized into one integer key, counted with
+        bincount, and only the N largest counts are selected with argpartition and sorted.
+        """
+        with self.stage("aggregate", rows_in=df) as stage:
+            total = len(df)
+            code_ids, codes = pd.factorize(df["icd_code"])
+            version_ids, versions = pd.factorize(df["icd_version"])
+            counts = np.bincount(code_ids.astype(np.int64) * len(versions) + version_ids,
+                                 minlength=len(codes) * len(versions))
+
+            top_n = min(self.top_n, np.count_nonzero(counts))
+            top_keys = np.argpartition(counts, len(counts) - top_n)[len(counts) - top_n:] if top_n else np.array([], dtype=np.int64)
+            top_keys = top_keys[np.argsort(counts[top_keys], kind="stable")[::-1]]
+
+            top = pd.DataFrame({
+                "icd_code": np.asarray(codes)[top_keys // len(versions)],
+                "icd_version": pd.array(np.asarray(versions)[top_keys % len(versions)], dtype="Int64"),
+                "count": counts[top_keys],
+            })
+            top["percent"] = (top["count"] / total).round(4)
+            return stage.output(top)
+
+    def sketch(self) -> ICDSketchSummary:
+        """Sketches of the diagnoses, built once per analyzer."""
+        if self._sketch is None:
+            with self.stage("sketch") as stage:
+                self._sketch = load_or_build(ICDSketchSummary, self.diagnoses_path, self.sketch_path)
+                stage.rows_in = self._sketch.rows
+        return self._sketch
+
+    def compute_top_icd_approximate(self) -> pd.DataFrame:
+        """compute_top_icd from the sketches: icd_code, icd_version, count, lower_bound, percent, guaranteed."""
+        with self.stage("aggregate_sketch") as stage:
+            return stage.output(self.sketch().top_icd(self.top_n))
+
+    def enrich_with_descriptions(self, top_df: pd.DataFrame, dict_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        Adds long_title descriptions to the top ICD codes.
+
+        Uses the memory-mapped title index of the dictionary; an explicitly passed
+        dictionary DataFrame is merged instead.
+        """
+        columns = ["icd_code", "icd_version", "long_title", "count", "percent"]
+        with self.stage("join", rows_in=top_df) as stage:
+            if dict_df is not None:
+                merged = top_df.merge(dict_df, on=["icd_code", "icd_version"], how="left")
+                return stage.output(merged[columns])
+
+            top_df = top_df.copy()
+            top_df["long_title"] = None
+            if self.title_index is not None:
+                try:
+                    if self._title_index_future is not None:
+                        self._title_index_future.result()
+                    top_df["long_title"] = self.title_index.lookup(top_df["icd_code"], top_df["icd_version"])
+                except Exception as e:
+                    print(f"[WARN] Could not load dictionary: {e}")
+            return stage.output(top_df[columns])
+
+    def run(self) -> pd.DataFrame:
+        """Runs the full analysis pipeline."""
+        # Load the small dictionary index in the background while the diagnoses are parsed
+        if self.title_index is not None:
+            self._title_index_future = load_async(self.title_index.load)
+
+        if self.approximate:
+            top_icd_df = self.compute_top_icd_approximate()
+            final_df = self.enrich_with_descriptions(top_icd_df)
+            final_df["lower_bound"] = top_icd_df["lower_bound"].to_numpy()
+            final_df["guaranteed"] = top_icd_df["guaranteed"].to_numpy()
+            return final_df
+        if self.state_path:
+            top_icd_df = self.compute_top_icd_incremental()
+        elif self.backend == "duckdb":
+            with self.stage("aggregate_duckdb") as stage:
+                top_icd_df = stage.output(sql_backend.top_icd_by_version(self.diagnoses_path, self.top_n))
+        else:
+            top_icd_df = self.compute_top_icd(self.load_diagnoses())
+        final_df = self.enrich_with_descriptions(top_icd_df)
+        return final_df
+
+
+# Example usage:
+if __name__ == "__main__":
+    analyzer = ICDAnalyzer("diagnoses_icd.csv", "d_icd_diagnoses.csv", top_n=10)
+    result = analyzer.run()
+    print(result.to_string(index=False))
+
+    # Daily appended feed: keep the counts in a state file and read only new rows
+    # analyzer = ICDAnalyzer("diagnoses_icd.csv", "d_icd_diagnoses.csv", top_n=10, state_path="icd_counts_state.json")
+
+    # Count in DuckDB directly over the file (pip install duckdb)
+    # analyzer = ICDAnalyzer("diagnoses_icd.csv", "d_icd_diagnoses.csv", top_n=10, backend="duckdb")
+
+    # Approximate top N from sketches in one pass, kept in sketch_path for later runs
+    # analyzer = ICDAnalyzer("diagnoses_icd.csv", "d_icd_diagnoses.csv", top_n=10, approximate=True,
+    #                        sketch_path="diagnoses_icd.sketch.npz")
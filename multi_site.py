@@ -0,0 +1,228 @@
+"""
+Sharded execution of the analyses over many MIMIC-format site extracts.
+
+Each hospital's export lives in its own directory (site root) with the MIMIC
+file names (patients.csv, admissions.csv, ...), either directly in the root or
+in its hosp/ subdirectory. MultiSiteRunner runs every analysis's per-site
+partial aggregation in a process pool, one task per (site, analysis), and
+merges the partials into per-site and global results. Raw tables are never
+concatenated; only the small partials travel between processes:
+
+    icd     (icd_code, icd_version) -> count table      -> top N codes and percent
+    labs    per-(label, value bucket) count / mean / M2  -> mean, std, min, max, missing %, percentiles
+    los     StreamingLOS histogram accumulator           -> average, median, percentiles
+    peaks   admission counts by hour and weekday         -> hourly and daily admissions
+
+The workers are spawned, not forked: the parent may already run loader
+and pyarrow threads (e.g. in a service), and a forked child can inherit
+their locks held and hang.
+
+Every partial merges exactly, so the global results equal a run over the
+concatenated tables (lab percentiles are approximate, as in LabStatsAnalyzer).
+
+ Requirments: file formats of diagnoses_icd.csv, d_labitems.csv, labevents.csv
+ and admissions.csv in every site root. Demo files are in the README link
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import analyzers
+from admissions_engine import AdmissionsEngine, StreamingLOS
+from instrumentation import Instrumented
+
+
+SITE_CHUNKSIZE = 1_000_000
+LOS_PERCENTILES = (25, 50, 75, 90, 95)
+
+# Table name -> file name in a site root
+SITE_FILES = {
+    "admissions": "admissions.csv",
+    "diagnoses_icd": "diagnoses_icd.csv",
+    "d_labitems": "d_labitems.csv",
+    "labevents": "labevents.csv",
+}
+
+
+def site_paths(site_root: str) -> Dict[str, str]:
+    """Table name -> path of the tables found in a site root (or its hosp/ subdirectory)."""
+    paths = {}
+    for table, file_name in SITE_FILES.items():
+        for directory in (site_root, os.path.join(site_root, "hosp")):
+            path = os.path.join(directory, file_name)
+            if os.path.exists(path):
+                paths[table] = path
+                break
+    return paths
+
+
+# Per-site partials; module-level functions so the process pool can pickle them
+
+def _icd_partial(paths: Dict[str, str], chunksize: int) -> pd.DataFrame:
+    return analyzers.TopICDAnalyzer(paths["diagnoses_icd"]).update_counts()
+
+
+def _labs_partial(paths: Dict[str, str], chunksize: int) -> Optional[pd.DataFrame]:
+    analyzer = analyzers.LabStatsAnalyzer(paths["d_labitems"], paths["labevents"],
+                                          streaming=True, chunksize=chunksize)
+    return analyzer.accumulate_by_label()
+
+
+def _los_partial(paths: Dict[str, str], chunksize: int) -> StreamingLOS:
+    return AdmissionsEngine.stream_los(paths["admissions"], chunksize=chunksize)
+
+
+def _peaks_partial(paths: Dict[str, str], chunksize: int) -> Tuple[np.ndarray, np.ndarray]:
+    return AdmissionsEngine.stream_peak_counts(paths["admissions"], chunksize=chunksize)
+
+
+# Merges of several partials of the same analysis
+
+def _merge_icd(partials: List[pd.DataFrame]) -> pd.DataFrame:
+    counts = pd.concat(partials, ignore_index=True)
+    counts["icd_version"] = counts["icd_version"].astype("Int64")
+    return counts.groupby(["icd_code", "icd_version"], observed=True)["count"].sum().reset_index()
+
+
+def _merge_los(partials: List[StreamingLOS]) -> StreamingLOS:
+    merged = StreamingLOS(partials[0].resolution_ns, partials[0].max_days)
+    for partial in partials:
+        merged.merge(partial)
+    return merged
+
+
+def _merge_peaks(partials: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    return sum(p[0] for p in partials), sum(p[1] for p in partials)
+
+
+# Results of merged partials
+
+def _los_result(los: StreamingLOS) -> dict:
+    result = {"average": los.mean, "median": los.median, "count_used": los.count}
+    result.update({f"p{q}": los.percentile(q) for q in LOS_PERCENTILES})
+    return result
+
+
+def _peaks_result(counts: Tuple[np.ndarray, np.ndarray]) -> dict:
+    hourly, daily = AdmissionsEngine.peak_frames(*counts)
+    return {"hourly": hourly, "daily": daily}
+
+
+@dataclass
+class Analysis:
+    """An analysis as tables + per-site partial + merge of partials + result of a merged partial."""
+    tables: Tuple[str, ...]
+    partial: Callable[[Dict[str, str], int], Any]
+    merge: Callable[[List[Any]], Any]
+    result: Callable[[Any, int], Any]
+
+
+ANALYSES: Dict[str, Analysis] = {
+    "icd": Analysis(("diagnoses_icd",), _icd_partial, _merge_icd,
+                    lambda counts, top_n: analyzers.TopICDAnalyzer.top_from_counts(counts, top_n)),
+    "labs": Analysis(("d_labitems", "labevents"), _labs_partial,
+                     lambda partials: analyzers.LabStatsAnalyzer.merge_accumulators(partials),
+                     lambda per_label, top_n: analyzers.LabStatsAnalyzer.statistics_from_accumulators(per_label)),
+    "los": Analysis(("admissions",), _los_partial, _merge_los, lambda los, top_n: _los_result(los)),
+    "peaks": Analysis(("admissions",), _peaks_partial, _merge_peaks, lambda counts, top_n: _peaks_result(counts)),
+}
+
+
+def _run_partial(analysis: str, paths: Dict[str, str], chunksize: int):
+    """Worker: one analysis's partial aggregation of one site."""
+    return ANALYSES[analysis].partial(paths, chunksize)
+
+
+@dataclass
+class MultiSiteResults:
+    """Per-site and global results, by analysis name."""
+    sites: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    overall: Dict[str, Any] = field(default_factory=dict)
+    # site -> analyses skipped because the site lacks one of their tables
+    skipped: Dict[str, List[str]] = field(default_factory=dict)
+
+
+class MultiSiteRunner(Instrumented):
+    """
+    Runs the analyses over many site roots in a process pool and merges the partials.
+    """
+
+    def __init__(self, site_roots: Sequence[str], processes: Optional[int] = None,
+                 chunksize: int = SITE_CHUNKSIZE):
+        """
+        Parameters
+        ----------
+        site_roots : list of str
+            One directory per site. Sites are named after the directory; when
+            two directories have the same name, by their full path.
+        processes : int, optional
+            Worker processes (default: one per CPU).
+        chunksize : int
+            Rows per chunk of the streaming partials.
+        """
+        names = [os.path.basename(os.path.normpath(root)) for root in site_roots]
+        self.sites = {
+            (name if names.count(name) == 1 else os.path.normpath(root)): root
+            for name, root in zip(names, site_roots)
+        }
+        self.processes = processes
+        self.chunksize = chunksize
+
+    def run(self, analyses: Sequence[str] = tuple(ANALYSES), top_n: int = 10) -> MultiSiteResults:
+        """
+        Compute the analyses per site and over all sites.
+
+        top_n : number of ICD codes in the icd results.
+        """
+        unknown = [name for name in analyses if name not in ANALYSES]
+        if unknown:
+            raise ValueError(f"Unknown analyses: {unknown}. Available: {list(ANALYSES)}")
+
+        results = MultiSiteResults()
+        partials: Dict[str, Dict[str, Any]] = {name: {} for name in analyses}
+        with self.stage("site_partials") as stage:
+            with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {}
+                for site, root in self.sites.items():
+                    paths = site_paths(root)
+                    for name in analyses:
+                        missing = [table for table in ANALYSES[name].tables if table not in paths]
+                        if missing:
+                            print(f"[WARN] {site}: skipping {name}, missing {', '.join(missing)}")
+                            results.skipped.setdefault(site, []).append(name)
+                            continue
+                        futures[site, name] = pool.submit(_run_partial, name, paths, self.chunksize)
+                for (site, name), future in futures.items():
+                    partials[name][site] = future.result()
+            stage.extra["tasks"] = len(futures)
+
+        with self.stage("merge") as stage:
+            for name in analyses:
+                analysis = ANALYSES[name]
+                for site, partial in partials[name].items():
+                    results.sites.setdefault(site, {})[name] = analysis.result(analysis.merge([partial]), top_n)
+                if partials[name]:
+                    results.overall[name] = analysis.result(analysis.merge(list(partials[name].values())), top_n)
+            stage.rows_out = len(results.sites)
+        return results
+
+
+# Example usage
+if __name__ == "__main__":
+    site_roots = ["enter full path for, site_a", "enter full path for, site_b"]
+    results = MultiSiteRunner(site_roots, processes=8).run(top_n=10)
+
+    print("🔥 Top 10 ICD codes over all sites:")
+    print(results.overall["icd"].to_string(index=False))
+    print("\n🛏️ Length of Stay over all sites:", results.overall["los"])
+    for site, site_results in results.sites.items():
+        if "los" in site_results:
+            print(f"\n🏥 {site}: LOS {site_results['los']['average']:.2f} days on average")
+    results.overall["labs"].to_csv("lab_statistics_all_sites.csv", index=False)
+    print("\n✅ Lab statistics over all sites exported to: lab_statistics_all_sites.csv")
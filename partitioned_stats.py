@@ -0,0 +1,108 @@
+"""
+Mergeable partial aggregates for partitioned, parallel statistics.
+
+Each partition of a numeric column is reduced to (count, mean, M2), M2 being
+the sum of squared deviations from the partition mean. These partials can be
+computed independently, in any order and in separate processes, and
+combine_aggregates turns any set of them into global count, mean, variance and
+standard deviation with Chan et al.'s parallel formula, which unlike a sum of
+squares does not lose precision to cancellation.
+
+parallel_aggregates copies the column once into shared memory and lets a
+process pool reduce contiguous row ranges of it, so no partition is written
+to disk or pickled to the workers. The pool has at most one process per CPU,
+and columns shorter than PARALLEL_MIN_ROWS are reduced in the calling process,
+where starting the pool would cost more than the reduction.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Columns shorter than this are reduced without a process pool
+PARALLEL_MIN_ROWS = 1_000_000
+
+
+def partial_aggregates(values: np.ndarray) -> Dict[str, float]:
+    """
+    Reduce one partition to its mergeable partial aggregates, ignoring NaN.
+    """
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {"count": 0, "mean": float("nan"), "m2": 0.0}
+    mean = values.mean()
+    return {
+        "count": int(len(values)),
+        "mean": float(mean),
+        "m2": float(np.square(values - mean).sum()),
+    }
+
+
+def combine_aggregates(partials: Sequence[Dict[str, float]]) -> Dict[str, float]:
+    """
+    Combine partial aggregates into global statistics (Chan et al.):
+    M2 = sum(M2_i) + sum(n_i * (mean_i - mean)^2).
+
+    Returns
+    -------
+    dict
+        count, mean, variance (sample, ddof=1) and std.
+    """
+    partials = [p for p in partials if p["count"]]
+    count = sum(p["count"] for p in partials)
+    mean = sum(p["count"] * p["mean"] for p in partials) / count if count else float("nan")
+    m2 = sum(p["m2"] + p["count"] * (p["mean"] - mean) ** 2 for p in partials)
+
+    variance = m2 / (count - 1) if count > 1 else float("nan")
+    return {"count": count, "mean": mean, "variance": variance, "std": variance ** 0.5}
+
+
+def _shared_partition_aggregates(shm_name: str, length: int, start: int, stop: int) -> Dict[str, float]:
+    """
+    Worker: attach to the shared column and reduce rows [start, stop).
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        column = np.ndarray((length,), dtype=np.float64, buffer=shm.buf)
+        result = partial_aggregates(column[start:stop])
+        # Drop the view on the shared buffer before closing it
+        del column
+        return result
+    finally:
+        shm.close()
+
+
+def parallel_aggregates(values: np.ndarray, bounds: Sequence[Tuple[int, int]],
+                        max_workers: Optional[int] = None) -> List[Dict[str, float]]:
+    """
+    Compute partial aggregates of values[start:stop] for every (start, stop)
+    in bounds, one partition per task in a process pool of at most
+    min(max_workers, CPU count, partitions) processes. Columns shorter than
+    PARALLEL_MIN_ROWS, or a single worker, are reduced in this process.
+    """
+    if not bounds:
+        return []
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    workers = min(max_workers or os.cpu_count() or 1, os.cpu_count() or 1, len(bounds))
+    if len(values) < PARALLEL_MIN_ROWS or workers == 1:
+        return [partial_aggregates(values[int(start):int(stop)]) for start, stop in bounds]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        shared = np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)
+        shared[:] = values
+        del shared
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_shared_partition_aggregates, shm.name, len(values), int(start), int(stop))
+                for start, stop in bounds
+            ]
+            return [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,642 @@
+"""
+Approximate query mode: mergeable sketches for heavy-hitter and distinct-count analytics.
+
+The exact analyzers load diagnoses_icd (or admissions) and count every value.
+The summaries of this module read a table once, in chunks, into fixed-size
+sketches instead. Memory does not grow with the table, and every answer
+comes with an error bound:
+
+    CountMinSketch   point counts of any value; overestimates by at most
+                     eps * N with probability 1 - delta (eps = e / width,
+                     delta = exp(-depth)).
+    SpaceSaving      top-N heavy hitters; each reported count is an upper
+                     bound, count - error a lower bound, and no value with a
+                     true count above N / capacity is missed.
+    HyperLogLog      distinct counts; relative standard error 1.04 / sqrt(2^p).
+    KeyedHyperLogLog one HyperLogLog per key (distinct patients per ICD code).
+
+Every sketch, and the ICDSketchSummary / AdmissionsSketchSummary built from
+them, can be merged with another one of the same parameters. Summaries of
+single days or sites are built where the data is and combined later with
+merge, and save / load write them as one .npz file. A summary sketched from
+a file records the file's path, size and mtime, and load_or_build rebuilds a
+saved summary whose source has changed since:
+
+    summary = ICDSketchSummary.from_file("diagnoses_icd.csv")
+    summary.save("site_a.icd_sketch.npz")
+    total = ICDSketchSummary.load("site_a.icd_sketch.npz").merge(ICDSketchSummary.load("site_b.icd_sketch.npz"))
+    print(total.top_icd_codes(10))
+
+ Requirments: file formats of diagnoses_icd.csv and admissions.csv. Demo files are in the README link
+"""
+
+import io
+import math
+import os
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from mimic_cache import iter_table_chunks
+
+
+SKETCH_CHUNKSIZE = 1_000_000
+_UINT64 = 2 ** 64
+_GOLDEN = 0x9E3779B97F4A7C15
+_HASH_KEY = "mimicsketch00000"
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer on uint64 values (wrapping arithmetic)."""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _base_hash(values) -> np.ndarray:
+    """64-bit hashes of values; text is hashed as str, numbers as int64."""
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        array = values.to_numpy(dtype=np.int64)
+    else:
+        array = values.astype(str).to_numpy(dtype=object)
+    return pd.util.hash_array(array, hash_key=_HASH_KEY, categorize=False)
+
+
+def _salted(base: np.ndarray, salt: int) -> np.ndarray:
+    """An independent hash function per salt, derived from the base hashes."""
+    return _mix(base + np.uint64((salt * _GOLDEN) % _UINT64))
+
+
+def _check_same(kind: str, mine: tuple, theirs: tuple):
+    if mine != theirs:
+        raise ValueError(f"Cannot merge {kind} sketches with different parameters: {mine} != {theirs}")
+
+
+def _to_bytes(state: Dict[str, np.ndarray]) -> bytes:
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **state)
+    return buffer.getvalue()
+
+
+def _from_bytes(data: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        return {name: archive[name] for name in archive.files}
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch: a depth x width table of counters, one hash function per row.
+    """
+
+    def __init__(self, width: int = 2 ** 16, depth: int = 5):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, base: np.ndarray) -> np.ndarray:
+        return np.stack([_salted(base, row + 1) % np.uint64(self.width) for row in range(self.depth)]).astype(np.int64)
+
+    def add(self, values, counts=None):
+        """Add values (each once, or counts[i] times)."""
+        if counts is None:
+            counts = pd.Series(values).value_counts(sort=False)
+            values, counts = counts.index, counts.to_numpy(dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        if len(counts) == 0:
+            return self
+        for row, columns in enumerate(self._columns(_base_hash(pd.Series(values)))):
+            self.table[row] += np.bincount(columns, weights=counts, minlength=self.width).astype(np.int64)
+        self.total += int(counts.sum())
+        return self
+
+    def estimate(self, values) -> np.ndarray:
+        """Estimated counts of values: never below the true count."""
+        values = pd.Series(values)
+        if len(values) == 0:
+            return np.array([], dtype=np.int64)
+        columns = self._columns(_base_hash(values))
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def error_bound(self) -> dict:
+        """Additive overestimate bound: at most `additive` with probability `confidence`."""
+        epsilon = math.e / self.width
+        return {"epsilon": epsilon, "additive": epsilon * self.total, "confidence": 1 - math.exp(-self.depth)}
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        _check_same("Count-Min", (self.width, self.depth), (other.width, other.depth))
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"table": self.table, "total": np.array(self.total)}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray]) -> "CountMinSketch":
+        sketch = cls(width=state["table"].shape[1], depth=state["table"].shape[0])
+        sketch.table = state["table"].astype(np.int64)
+        sketch.total = int(state["total"])
+        return sketch
+
+    def to_bytes(self) -> bytes:
+        return _to_bytes(self.state())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CountMinSketch":
+        return cls.from_state(_from_bytes(data))
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters: at most `capacity` monitored values, each with
+    an upper-bound count and the error by which it may overestimate.
+
+    Chunks are counted exactly and merged into the summary with the mergeable
+    Space-Saving rule, so the summary of a table equals the merge of the
+    summaries of its parts.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.errors = pd.Series(dtype=np.int64)
+        self.total = 0
+
+    @property
+    def min_count(self) -> int:
+        """Count every unmonitored value may have had (0 while the summary is not full)."""
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def _merge(self, counts: pd.Series, errors: pd.Series, other_min: int):
+        own_min = self.min_count
+        keys = self.counts.index.union(counts.index)
+        merged = self.counts.reindex(keys, fill_value=own_min) + counts.reindex(keys, fill_value=other_min)
+        merged_errors = self.errors.reindex(keys, fill_value=own_min) + errors.reindex(keys, fill_value=other_min)
+        keep = merged.sort_values(ascending=False, kind="stable").index[:self.capacity]
+        self.counts = merged[keep].astype(np.int64)
+        self.errors = merged_errors[keep].astype(np.int64)
+
+    def add(self, values):
+        """Add one occurrence of each value (missing values are skipped)."""
+        counts = pd.Series(values).dropna().astype(str).value_counts(sort=False)
+        if len(counts):
+            self._merge(counts.astype(np.int64), pd.Series(0, index=counts.index, dtype=np.int64), 0)
+            self.total += int(counts.sum())
+        return self
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        _check_same("Space-Saving", (self.capacity,), (other.capacity,))
+        self._merge(other.counts, other.errors, other.min_count)
+        self.total += other.total
+        return self
+
+    def top(self, top_n: int = 10) -> pd.DataFrame:
+        """
+        The top_n values: count (upper bound), lower_bound and error.
+        `guaranteed` is True when the value is certainly in the true top_n.
+        """
+        ordered = self.counts.sort_values(ascending=False, kind="stable")
+        top = pd.DataFrame({
+            "value": ordered.index[:top_n],
+            "count": ordered.to_numpy()[:top_n],
+            "error": self.errors[ordered.index[:top_n]].to_numpy(),
+        })
+        top["lower_bound"] = top["count"] - top["error"]
+        # Any value outside the list can have at most this count
+        outside = max(int(ordered.iloc[top_n]) if len(ordered) > top_n else 0, self.min_count)
+        top["guaranteed"] = top["lower_bound"] >= outside
+        return top
+
+    def error_bound(self) -> dict:
+        """Largest possible overestimate of any reported count."""
+        return {"additive": self.total / self.capacity, "max_error": int(self.errors.max()) if len(self.errors) else 0}
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {
+            "keys": self.counts.index.to_numpy(dtype=str),
+            "counts": self.counts.to_numpy(dtype=np.int64),
+            "errors": self.errors.to_numpy(dtype=np.int64),
+            "capacity": np.array(self.capacity),
+            "total": np.array(self.total),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray]) -> "SpaceSaving":
+        sketch = cls(capacity=int(state["capacity"]))
+        keys = pd.Index(state["keys"].astype(object))
+        sketch.counts = pd.Series(state["counts"], index=keys, dtype=np.int64)
+        sketch.errors = pd.Series(state["errors"], index=keys, dtype=np.int64)
+        sketch.total = int(state["total"])
+        return sketch
+
+    def to_bytes(self) -> bytes:
+        return _to_bytes(self.state())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SpaceSaving":
+        return cls.from_state(_from_bytes(data))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Bit length of uint64 values, exact (frexp of 32-bit halves)."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def _register_updates(base: np.ndarray, p: int):
+    """(register index, rank) of each hash for 2^p registers."""
+    hashes = _salted(base, 0)
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    rank = (64 - p) - _bit_length(rest) + 1
+    return index, rank.astype(np.uint8)
+
+
+def _hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """HyperLogLog estimates of the last axis of registers, with the small-range correction."""
+    m = registers.shape[-1]
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2^p one-byte registers.
+    """
+
+    def __init__(self, p: int = 14):
+        if not 4 <= p <= 18:
+            raise ValueError("p must be between 4 and 18")
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, values):
+        values = pd.Series(values).dropna()
+        if len(values):
+            self.add_hashes(_base_hash(values))
+        return self
+
+    def add_hashes(self, base: np.ndarray):
+        """Add values by their _base_hash (lets callers hash composite keys themselves)."""
+        index, rank = _register_updates(base, self.p)
+        best = pd.Series(rank).groupby(index).max()
+        positions = best.index.to_numpy()
+        self.registers[positions] = np.maximum(self.registers[positions], best.to_numpy(dtype=np.uint8))
+        return self
+
+    def estimate(self) -> float:
+        return float(_hll_estimate(self.registers))
+
+    def error_bound(self) -> dict:
+        """Relative standard error; about 95% of estimates are within two of it."""
+        return {"relative_std_error": 1.04 / math.sqrt(1 << self.p)}
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        _check_same("HyperLogLog", (self.p,), (other.p,))
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"registers": self.registers}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray]) -> "HyperLogLog":
+        registers = state["registers"].astype(np.uint8)
+        sketch = cls(p=int(registers.size).bit_length() - 1)
+        sketch.registers = registers
+        return sketch
+
+    def to_bytes(self) -> bytes:
+        return _to_bytes(self.state())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls.from_state(_from_bytes(data))
+
+
+class KeyedHyperLogLog:
+    """
+    One HyperLogLog per key, stored as a [keys, 2^p] register matrix
+    (e.g. distinct patients per ICD code). Use a small p: 20,000 codes with
+    p=10 take 20 MB at 3.3% relative standard error.
+    """
+
+    def __init__(self, p: int = 10):
+        if not 4 <= p <= 18:
+            raise ValueError("p must be between 4 and 18")
+        self.p = p
+        self.keys = pd.Index([], dtype=object)
+        self.registers = np.zeros((0, 1 << p), dtype=np.uint8)
+
+    def _rows(self, keys: pd.Index) -> np.ndarray:
+        """Register rows of keys, adding rows for new keys."""
+        new_keys = keys.unique().difference(self.keys)
+        if len(new_keys):
+            self.keys = self.keys.append(new_keys)
+            self.registers = np.vstack([self.registers, np.zeros((len(new_keys), 1 << self.p), dtype=np.uint8)])
+        return self.keys.get_indexer(keys)
+
+    def add(self, keys, values):
+        """Add values[i] to the counter of keys[i]; pairs missing either are skipped."""
+        pairs = pd.DataFrame({"key": pd.Series(keys).to_numpy(), "value": pd.Series(values).to_numpy()}).dropna()
+        if pairs.empty:
+            return self
+        rows = self._rows(pd.Index(pairs["key"].astype(str).to_numpy(dtype=object)))
+        index, rank = _register_updates(_base_hash(pairs["value"].reset_index(drop=True)), self.p)
+        flat = rows.astype(np.int64) * (1 << self.p) + index
+        best = pd.Series(rank).groupby(flat).max()
+        registers = self.registers.reshape(-1)
+        positions = best.index.to_numpy()
+        registers[positions] = np.maximum(registers[positions], best.to_numpy(dtype=np.uint8))
+        return self
+
+    def estimate(self, keys=None) -> pd.Series:
+        """Distinct-count estimates per key (0 for unknown keys)."""
+        estimates = pd.Series(_hll_estimate(self.registers), index=self.keys, dtype=np.float64)
+        if keys is None:
+            return estimates
+        return estimates.reindex(pd.Index(pd.Series(keys).astype(str)), fill_value=0.0)
+
+    def error_bound(self) -> dict:
+        return {"relative_std_error": 1.04 / math.sqrt(1 << self.p)}
+
+    def merge(self, other: "KeyedHyperLogLog") -> "KeyedHyperLogLog":
+        _check_same("keyed HyperLogLog", (self.p,), (other.p,))
+        rows = self._rows(other.keys)
+        self.registers[rows] = np.maximum(self.registers[rows], other.registers)
+        return self
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"keys": self.keys.to_numpy(dtype=str), "registers": self.registers}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray]) -> "KeyedHyperLogLog":
+        registers = state["registers"].astype(np.uint8)
+        sketch = cls(p=int(registers.shape[1]).bit_length() - 1)
+        sketch.keys = pd.Index(state["keys"].astype(object))
+        sketch.registers = registers
+        return sketch
+
+    def to_bytes(self) -> bytes:
+        return _to_bytes(self.state())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KeyedHyperLogLog":
+        return cls.from_state(_from_bytes(data))
+
+
+def source_fingerprint(source_path: str) -> dict:
+    """Path, size and mtime of a source file; changes whenever the file is replaced or appended to."""
+    stat = os.stat(source_path)
+    return {"path": os.path.abspath(source_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class _SketchSummary:
+    """Merge, save and load for summaries made of named sketches."""
+
+    SKETCHES: Dict[str, type] = {}
+    # source_fingerprint of the file sketched by from_file; None for merged or hand-fed summaries
+    source: Optional[dict] = None
+
+    def merge(self, other: "_SketchSummary") -> "_SketchSummary":
+        """Add the sketches of another summary (another day or site) into this one."""
+        for name in self.SKETCHES:
+            getattr(self, name).merge(getattr(other, name))
+        self.rows += other.rows
+        # The merged summary no longer describes one file
+        self.source = None
+        return self
+
+    @classmethod
+    def merge_all(cls, summaries: Iterable["_SketchSummary"]) -> "_SketchSummary":
+        summaries = iter(summaries)
+        total = next(summaries)
+        for summary in summaries:
+            total.merge(summary)
+        return total
+
+    def save(self, path: str):
+        """Write all sketches as one .npz file."""
+        state = {"rows": np.array(self.rows)}
+        if self.source is not None:
+            state.update({f"source.{key}": np.array(value) for key, value in self.source.items()})
+        for name in self.SKETCHES:
+            for key, value in getattr(self, name).state().items():
+                state[f"{name}.{key}"] = value
+        np.savez_compressed(path, **state)
+
+    @classmethod
+    def load(cls, path: str) -> "_SketchSummary":
+        with np.load(path, allow_pickle=False) as archive:
+            state = {name: archive[name] for name in archive.files}
+        summary = cls.__new__(cls)
+        for name, sketch_type in cls.SKETCHES.items():
+            prefix = f"{name}."
+            setattr(summary, name, sketch_type.from_state(
+                {key[len(prefix):]: value for key, value in state.items() if key.startswith(prefix)}
+            ))
+        summary.rows = int(state["rows"])
+        if "source.path" in state:
+            summary.source = {"path": str(state["source.path"]), "size": int(state["source.size"]),
+                              "mtime_ns": int(state["source.mtime_ns"])}
+        return summary
+
+
+class ICDSketchSummary(_SketchSummary):
+    """
+    Approximate ICD analytics of diagnoses_icd in a few tens of MB:
+    top-N codes, top-N (code, version) pairs, distinct patients per code and
+    the mean number of unique codes per patient, each with error bounds.
+    """
+
+    SKETCHES = {
+        "codes": SpaceSaving,
+        "code_versions": SpaceSaving,
+        "code_counts": CountMinSketch,
+        "patients": HyperLogLog,
+        "patient_codes": HyperLogLog,
+        "patients_per_code": KeyedHyperLogLog,
+    }
+
+    def __init__(self, capacity: int = 1000, cms_width: int = 2 ** 16, cms_depth: int = 5,
+                 hll_p: int = 14, per_code_p: int = 10):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Values monitored by the Space-Saving summaries (must exceed the largest top_n asked for).
+        cms_width, cms_depth : int
+            Count-Min table size.
+        hll_p : int
+            Precision of the distinct patient and (patient, code) counters.
+        per_code_p : int
+            Precision of the distinct patients counter of every code.
+        """
+        self.codes = SpaceSaving(capacity)
+        self.code_versions = SpaceSaving(capacity)
+        self.code_counts = CountMinSketch(cms_width, cms_depth)
+        self.patients = HyperLogLog(hll_p)
+        self.patient_codes = HyperLogLog(hll_p)
+        self.patients_per_code = KeyedHyperLogLog(per_code_p)
+        self.rows = 0
+
+    def update(self, chunk: pd.DataFrame) -> "ICDSketchSummary":
+        """Add a chunk of diagnoses rows (subject_id, icd_code and optionally icd_version)."""
+        chunk = chunk.dropna(subset=["subject_id", "icd_code"])
+        self.rows += len(chunk)
+        codes = chunk["icd_code"].astype(str).reset_index(drop=True)
+        subjects = chunk["subject_id"].astype(np.int64).reset_index(drop=True)
+        self.codes.add(codes)
+        self.code_counts.add(codes)
+        if "icd_version" in chunk.columns:
+            versions = chunk["icd_version"].astype("Int64").astype(str).reset_index(drop=True)
+            self.code_versions.add(codes + "|" + versions)
+        subject_hashes = _base_hash(subjects)
+        self.patients.add_hashes(subject_hashes)
+        # Distinct (patient, code) pairs: combine the hashes of both columns
+        self.patient_codes.add_hashes(_mix(subject_hashes ^ _salted(_base_hash(codes), 1)))
+        self.patients_per_code.add(codes, subjects)
+        return self
+
+    @classmethod
+    def from_file(cls, diagnoses_path: str, chunksize: int = SKETCH_CHUNKSIZE, **params) -> "ICDSketchSummary":
+        """Sketch diagnoses_icd.csv in one chunked pass."""
+        summary = cls(**params)
+        summary.source = source_fingerprint(diagnoses_path)
+        columns = ["subject_id", "icd_code", "icd_version"]
+        for chunk in iter_table_chunks(diagnoses_path, columns, chunksize):
+            summary.update(chunk)
+        return summary
+
+    def top_icd_codes(self, top_n: int = 10) -> pd.DataFrame:
+        """
+        Approximate get_top_icd_codes: icd_code, count, lower_bound, percentage,
+        distinct_patients and guaranteed (the code is certainly in the true top_n).
+        """
+        top = self.codes.top(top_n).rename(columns={"value": "icd_code"})
+        # Both counts are upper bounds; the smaller one is the tighter
+        top["count"] = np.minimum(top["count"], self.code_counts.estimate(top["icd_code"]))
+        top["percentage"] = (top["count"] / max(self.rows, 1) * 100).round(2)
+        top["distinct_patients"] = self.patients_per_code.estimate(top["icd_code"]).round().astype(np.int64).to_numpy()
+        return top[["icd_code", "count", "lower_bound", "percentage", "distinct_patients", "guaranteed"]]
+
+    def top_icd(self, top_n: int = 10) -> pd.DataFrame:
+        """Approximate compute_top_icd: icd_code, icd_version, count, lower_bound, percent, guaranteed."""
+        top = self.code_versions.top(top_n)
+        split = top["value"].str.rsplit("|", n=1, expand=True)
+        top["icd_code"] = split[0] if len(top) else pd.Series(dtype=object)
+        top["icd_version"] = pd.to_numeric(split[1], errors="coerce").astype("Int64") if len(top) else pd.Series(dtype="Int64")
+        # A fraction, like compute_top_icd
+        top["percent"] = (top["count"] / max(self.code_versions.total, 1)).round(4)
+        return top[["icd_code", "icd_version", "count", "lower_bound", "percent", "guaranteed"]]
+
+    def code_count(self, codes) -> pd.Series:
+        """Count-Min estimate of the rows of any codes (upper bounds)."""
+        codes = pd.Series(codes).astype(str)
+        return pd.Series(self.code_counts.estimate(codes), index=codes.to_numpy(), name="count")
+
+    def mean_unique_icd_per_patient(self) -> float:
+        """Approximate mean of unique_icd_count over patients."""
+        patients = self.patients.estimate()
+        return self.patient_codes.estimate() / patients if patients else float("nan")
+
+    def error_bounds(self) -> dict:
+        """Error bounds of every reported figure."""
+        distinct_error = self.patients.error_bound()["relative_std_error"]
+        return {
+            "rows": self.rows,
+            "top_codes": self.codes.error_bound(),
+            "top_code_versions": self.code_versions.error_bound(),
+            "code_counts": self.code_counts.error_bound(),
+            "distinct_patients": self.patients.error_bound(),
+            "distinct_patients_per_code": self.patients_per_code.error_bound(),
+            # Ratio of two estimates: the relative errors add up at most
+            "mean_unique_icd_per_patient": {"relative_std_error": 2 * distinct_error},
+        }
+
+
+class AdmissionsSketchSummary(_SketchSummary):
+    """
+    Approximate discharge destination summary of admissions, with error bounds.
+    """
+
+    SKETCHES = {"destinations": SpaceSaving, "patients": HyperLogLog}
+
+    def __init__(self, capacity: int = 256, hll_p: int = 14):
+        self.destinations = SpaceSaving(capacity)
+        self.patients = HyperLogLog(hll_p)
+        self.rows = 0
+
+    def update(self, chunk: pd.DataFrame) -> "AdmissionsSketchSummary":
+        """Add a chunk of admissions rows (subject_id and discharge_location)."""
+        self.rows += len(chunk)
+        locations = chunk["discharge_location"].astype(object).where(chunk["discharge_location"].notna(), "UNKNOWN")
+        self.destinations.add(locations)
+        self.patients.add(chunk["subject_id"])
+        return self
+
+    @classmethod
+    def from_file(cls, admissions_path: str, chunksize: int = SKETCH_CHUNKSIZE, **params) -> "AdmissionsSketchSummary":
+        """Sketch admissions.csv in one chunked pass."""
+        summary = cls(**params)
+        summary.source = source_fingerprint(admissions_path)
+        for chunk in iter_table_chunks(admissions_path, ["subject_id", "discharge_location"], chunksize):
+            summary.update(chunk)
+        return summary
+
+    def discharge_destination_summary(self, top_n: Optional[int] = None) -> pd.DataFrame:
+        """
+        Approximate discharge_destination_summary: discharge_location, count,
+        lower_bound, percent. Exact while there are fewer locations than the capacity.
+        """
+        top = self.destinations.top(top_n or self.destinations.capacity)
+        top = top.rename(columns={"value": "discharge_location"})
+        top["percent"] = (top["count"] / max(self.destinations.total, 1) * 100).round(2)
+        return top[["discharge_location", "count", "lower_bound", "percent", "guaranteed"]]
+
+    def error_bounds(self) -> dict:
+        return {
+            "rows": self.rows,
+            "destinations": self.destinations.error_bound(),
+            "distinct_patients": self.patients.error_bound(),
+        }
+
+
+def load_or_build(summary_type: type, source_path: str, sketch_path: Optional[str] = None,
+                  chunksize: int = SKETCH_CHUNKSIZE) -> _SketchSummary:
+    """
+    The summary saved at sketch_path, or a new one sketched from source_path
+    (and saved to sketch_path when given). A saved summary is rebuilt when it
+    was sketched from another file, or from an older version of source_path
+    (different size or mtime).
+    """
+    if sketch_path and os.path.exists(sketch_path):
+        saved = summary_type.load(sketch_path)
+        if saved.source == source_fingerprint(source_path):
+            return saved
+    summary = summary_type.from_file(source_path, chunksize)
+    if sketch_path:
+        summary.save(sketch_path)
+    return summary
+
+
+# Example usage
+if __name__ == "__main__":
+    icd = ICDSketchSummary.from_file("diagnoses_icd.csv")
+    print("📊 Approximate top 10 ICD codes:")
+    print(icd.top_icd_codes(10))
+    print(f"\n📊 Approximate mean unique ICD codes per patient: {icd.mean_unique_icd_per_patient():.2f}")
+    print(f"📏 Error bounds: {icd.error_bounds()}")
+    icd.save("diagnoses_icd.sketch.npz")
+    print("✅ Sketches saved to: diagnoses_icd.sketch.npz")
+
+    admissions = AdmissionsSketchSummary.from_file("admissions.csv")
+    print("\n🏥 Approximate discharge destinations:")
+    print(admissions.discharge_destination_summary())
@@ -1,88 +1,143 @@
-import os
-import pandas as pd
-
-class PatientDataProcessor:
-    """
-    Handles splitting file and age analysis for the MIMIC-III patients dataset,
-    finding mean age in each parts of the split database file.
-     
-    Requirments:file forma of, patients.csv.
-    The demo files is in the README link
-    """
-
-    def __init__(self, filepath: str):
-        """
-        Initialize with the path to the patients.csv file.
-        """
-        self.filepath = "eneter file path for patients.csv"
-        self.df = self._load_data()
-        self.split_dir = os.path.join(os.path.dirname(filepath), "split")
-        os.makedirs(self.split_dir, exist_ok=True)
-
-    def _load_data(self) -> pd.DataFrame:
-        """
-        Load the patients dataset and validate required columns.
-        """
-        try:
-            df = pd.read_csv(self.filepath)
-            required_cols = {'subject_id', 'anchor_age'}
-            if not required_cols.issubset(df.columns):
-                raise ValueError("Missing required columns: 'subject_id', 'anchor_age'")
-            return df
-        except Exception as e:
-            raise RuntimeError(f"Error loading patients data: {e}")
-
-    def split_dataset(self) -> tuple[str, str]:
-        """
-        Split the dataset into two equal parts and save them as CSV files.
-        Returns paths to the split files.
-        """
-        midpoint = len(self.df) // 2
-        df1 = self.df.iloc[:midpoint].copy()
-        df2 = self.df.iloc[midpoint:].copy()
-        """
-        This module Split the dataset into two equal parts, generate two new files\patient_1 and \patient_2
-        and save them as CSV files.
-        
-        """
-        path1 = os.path.join(self.split_dir, "enter path to the file, pathpatient_1.csv")
-        path2 = os.path.join(self.split_dir, "enter path to the file, pathpatient_2.csv")
-
-        df1.to_csv(path1, index=False)
-        df2.to_csv(path2, index=False)
-
-        print(f"✅ Split files saved to:\n→ {path1}\n→ {path2}")
-        return path1, path2
-
-    def calculate_mean_age(self, file_path: str) -> float:
-        """
-        Calculate the mean age from a given split file.
-        """
-        try:
-            df = pd.read_csv(file_path)
-            mean_age = df['anchor_age'].mean()
-            return round(mean_age, 2)
-        except Exception as e:
-            raise RuntimeError(f"Error calculating mean age from {file_path}: {e}")
-
-    def run_analysis(self):
-        """
-        Run the full pipeline: split, analyze, and print results.
-        """
-        print("📁 Splitting dataset and saving files...")
-        file1, file2 = self.split_dataset()
-
-        print("\n📊 Calculating mean age for each split:")
-        mean1 = self.calculate_mean_age(file1)
-        mean2 = self.calculate_mean_age(file2)
-        print(f"→ Mean age in patient_1.csv: {mean1} years")
-        print(f"→ Mean age in patient_2.csv: {mean2} years")
-
-        overall_mean = round((mean1 + mean2) / 2, 2)
-        print(f"\n🧮 Overall mean age across both splits: {overall_mean} years")
-
-
-# Example usage
-if __name__ == "__main__":
-    processor = PatientDataProcessor("patients.csv")
-    processor.run_analysis()
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Instrumented
+from mimic_cache import read_table
+from partitioned_stats import combine_aggregates, parallel_aggregates
+
+class PatientDataProcessor(Instrumented):
+    """
+    Handles splitting file and age analysis for the MIMIC-III patients dataset,
+    finding mean age in each parts of the split database file.
+
+    The patients are split into num_partitions partitions, by row ranges or by a
+    hash of subject_id. Each partition is reduced in a process pool, straight from
+    shared memory, to mergeable partial aggregates (count, mean, M2), which are
+    combined into global statistics (see partitioned_stats). Small files are
+    reduced without the pool. Writing the partitions to
+    CSV files is optional. Load, aggregate and export stages are recorded in
+    self.instrumentation.
+     
+    Requirments:file forma of, patients.csv.
+    The demo files is in the README link
+    """
+
+    def __init__(self, filepath: str, num_partitions: int = 2, partition_by: str = "rows",
+                 write_partitions: bool = False):
+        """
+        Initialize with the path to the patients.csv file.
+
+        num_partitions   : number of partitions (and worker processes, at most one per CPU).
+        partition_by     : "rows" for contiguous row ranges or "subject_id" for a subject_id hash.
+        write_partitions : also save every partition as a CSV file in run_analysis.
+        """
+        if partition_by not in ("rows", "subject_id"):
+            raise ValueError("partition_by must be 'rows' or 'subject_id'")
+        self.filepath = filepath
+        self.num_partitions = num_partitions
+        self.partition_by = partition_by
+        self.write_partitions = write_partitions
+        self.df = self._load_data()
+        self.split_dir = os.path.join(os.path.dirname(filepath), "split")
+
+    def _load_data(self) -> pd.DataFrame:
+        """
+        Load the patients dataset and validate required columns.
+        """
+        try:
+            with self.stage("load") as stage:
+                df = stage.output(read_table(self.filepath))
+            required_cols = {'subject_id', 'anchor_age'}
+            if not required_cols.issubset(df.columns):
+                raise ValueError("Missing required columns: 'subject_id', 'anchor_age'")
+            return df
+        except Exception as e:
+            raise RuntimeError(f"Error loading patients data: {e}")
+
+    def partition(self) -> tuple[np.ndarray, list[tuple[int, int]]]:
+        """
+        Assign rows to partitions.
+
+        Returns
+        -------
+        tuple
+            (order, bounds): rows self.df.iloc[order[start:stop]] form one
+            partition for every (start, stop) in bounds.
+        """
+        n_rows = len(self.df)
+        if self.partition_by == "rows":
+            order = np.arange(n_rows)
+            edges = np.linspace(0, n_rows, self.num_partitions + 1).astype(np.int64)
+        else:
+            partition_ids = (pd.util.hash_array(self.df['subject_id'].to_numpy()) % self.num_partitions).astype(np.int64)
+            # A stable sort by partition id makes every partition a contiguous row range
+            order = np.argsort(partition_ids, kind="stable")
+            edges = np.concatenate([[0], np.cumsum(np.bincount(partition_ids, minlength=self.num_partitions))])
+        return order, list(zip(edges[:-1], edges[1:]))
+
+    def compute_partition_aggregates(self) -> list[dict]:
+        """
+        Compute (count, mean, m2) of anchor_age for every partition in a process pool.
+        """
+        with self.stage("aggregate_partitions", rows_in=self.df) as stage:
+            order, bounds = self.partition()
+            ages = pd.to_numeric(self.df['anchor_age'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            if self.partition_by != "rows":
+                ages = ages[order]
+            return stage.output(parallel_aggregates(ages, bounds, max_workers=self.num_partitions))
+
+    def split_dataset(self) -> list[str]:
+        """
+        Save every partition as a CSV file, patient_1.csv ... patient_N.csv.
+        Returns paths to the split files.
+        """
+        os.makedirs(self.split_dir, exist_ok=True)
+        order, bounds = self.partition()
+
+        paths = []
+        with self.stage("export", rows_in=self.df) as stage:
+            for i, (start, stop) in enumerate(bounds, start=1):
+                path = os.path.join(self.split_dir, f"patient_{i}.csv")
+                self.df.iloc[order[start:stop]].to_csv(path, index=False)
+                paths.append(path)
+            stage.rows_out = len(order)
+
+        print("✅ Split files saved to:\n" + "\n".join(f"→ {path}" for path in paths))
+        return paths
+
+    def calculate_mean_age(self, file_path: str) -> float:
+        """
+        Calculate the mean age from a given split file.
+        """
+        try:
+            df = pd.read_csv(file_path)
+            mean_age = df['anchor_age'].mean()
+            return round(mean_age, 2)
+        except Exception as e:
+            raise RuntimeError(f"Error calculating mean age from {file_path}: {e}")
+
+    def run_analysis(self):
+        """
+        Run the full pipeline: partition, analyze in parallel, combine and print results.
+        """
+        if self.write_partitions:
+            print("📁 Splitting dataset and saving files...")
+            self.split_dataset()
+
+        print(f"\n📊 Calculating age statistics for {self.num_partitions} partitions by {self.partition_by}:")
+        partials = self.compute_partition_aggregates()
+        for i, partial in enumerate(partials, start=1):
+            mean = round(partial['mean'], 2)
+            print(f"→ Partition {i}: {partial['count']} patients, mean age {mean} years")
+
+        overall = combine_aggregates(partials)
+        print(f"\n🧮 Overall mean age: {overall['mean']:.2f} years "
+              f"(std {overall['std']:.2f}, {overall['count']} patients)")
+
+
+# Example usage
+if __name__ == "__main__":
+    processor = PatientDataProcessor("patients.csv", num_partitions=4, partition_by="subject_id")
+    processor.run_analysis()
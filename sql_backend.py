@@ -0,0 +1,185 @@
+"""
+DuckDB backend for the ICD and lab aggregations.
+
+The ICD and lab analyzers take backend="pandas" (default, the reference
+implementation) or backend="duckdb". With DuckDB the group/count/mean
+queries run in-process directly over the source files: the Parquet cache of
+mimic_cache when it already exists, otherwise the CSV itself. Only the
+columns a query uses are read, filters are pushed into the scan, execution
+is multi-threaded, and only the small result frame is returned to pandas.
+
+Every function returns the same columns as the pandas method it replaces,
+rounded the same way. Row order within equal counts may differ, and
+unique_icd_per_patient lists each patient's codes sorted instead of in
+order of first appearance. benchmarks/check_backend_parity.py compares
+both backends.
+
+Requirments: duckdb (pip install duckdb), only when backend="duckdb" is used.
+"""
+
+import os
+import threading
+from typing import Optional, Sequence
+
+import pandas as pd
+
+from mimic_cache import cache_path, table_columns
+from mimic_schema import parse_dtypes, table_name
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - depends on the environment
+    duckdb = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pq = None
+
+
+BACKENDS = ("pandas", "duckdb")
+# DuckDB threads per connection; None uses all cores
+DUCKDB_THREADS: Optional[int] = None
+
+_local = threading.local()
+
+
+def check_backend(backend: str) -> str:
+    """
+    Validate an analyzer backend name.
+
+    Raises
+    ------
+    ValueError
+        If backend is not one of BACKENDS.
+    ImportError
+        If backend is "duckdb" and duckdb is not installed.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
+    if backend == "duckdb" and duckdb is None:
+        raise ImportError("backend='duckdb' requires the duckdb package (pip install duckdb)")
+    return backend
+
+
+def connection():
+    """In-memory DuckDB connection of the calling thread."""
+    con = getattr(_local, "connection", None)
+    if con is None:
+        check_backend("duckdb")
+        con = duckdb.connect()
+        if DUCKDB_THREADS:
+            con.execute(f"SET threads TO {int(DUCKDB_THREADS)}")
+        _local.connection = con
+    return con
+
+
+def _literal(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def scan(source_path: str) -> str:
+    """
+    SQL table expression reading a MIMIC table: its Parquet cache if it is
+    already built, otherwise the CSV with the text columns of mimic_schema
+    kept as VARCHAR (ICD codes with leading zeros, lab values such as "___").
+    """
+    if pq is not None and os.path.exists(cache_path(source_path)):
+        return f"read_parquet({_literal(cache_path(source_path))})"
+    columns = set(table_columns(source_path, use_cache=False))
+    text_columns = [col for col in parse_dtypes(table_name(source_path)) if col in columns]
+    types = ", ".join(f"{_literal(col)}: 'VARCHAR'" for col in text_columns)
+    return f"read_csv({_literal(os.path.abspath(source_path))}, header=true, types={{{types}}})"
+
+
+def query(sql: str) -> pd.DataFrame:
+    """Run a query on the thread's connection and return the result as a DataFrame."""
+    return connection().execute(sql).df()
+
+
+def top_icd_codes(diagnoses_path: str, top_n: int = 10) -> pd.DataFrame:
+    """
+    ICDAnalyzer.get_top_icd_codes (unique codes per patient script):
+    icd_code, count and percentage of all non-missing codes.
+    """
+    return query(f"""
+        SELECT icd_code,
+               count(*) AS count,
+               round(count(*) * 100.0 / sum(count(*)) OVER (), 2) AS percentage
+        FROM {scan(diagnoses_path)}
+        WHERE icd_code IS NOT NULL
+        GROUP BY icd_code
+        ORDER BY count DESC, icd_code
+        LIMIT {int(top_n)}
+    """)
+
+
+def top_icd_by_version(diagnoses_path: str, top_n: int = 10) -> pd.DataFrame:
+    """
+    ICDAnalyzer.compute_top_icd (most frequent diagnoses script):
+    icd_code, icd_version, count and fraction of all complete rows.
+    """
+    top = query(f"""
+        WITH diagnoses AS (
+            SELECT trim(CAST(icd_code AS VARCHAR)) AS icd_code,
+                   TRY_CAST(icd_version AS INTEGER) AS icd_version
+            FROM {scan(diagnoses_path)}
+            WHERE icd_code IS NOT NULL
+        )
+        SELECT icd_code, icd_version,
+               count(*) AS count,
+               round(count(*) / sum(count(*)) OVER (), 4) AS percent
+        FROM diagnoses
+        WHERE icd_version IS NOT NULL
+        GROUP BY icd_code, icd_version
+        ORDER BY count DESC, icd_code, icd_version
+        LIMIT {int(top_n)}
+    """)
+    top["icd_version"] = top["icd_version"].astype("Int64")
+    return top
+
+
+def unique_icd_per_patient(diagnoses_path: str) -> pd.DataFrame:
+    """
+    ICDAnalyzer.get_unique_icd_per_patient: subject_id, the sorted distinct
+    icd_codes of the patient and their number.
+    """
+    return query(f"""
+        SELECT subject_id,
+               list_sort(list(DISTINCT icd_code)) AS icd_code,
+               count(DISTINCT icd_code) AS unique_icd_count
+        FROM {scan(diagnoses_path)}
+        WHERE subject_id IS NOT NULL AND icd_code IS NOT NULL
+        GROUP BY subject_id
+        ORDER BY subject_id
+    """)
+
+
+def lab_statistics(labitems_path: str, labevents_path: str, percentiles: Sequence[float]) -> pd.DataFrame:
+    """
+    LabStatsAnalyzer.compute_statistics: mean, std, min, max, missing
+    percentage and percentiles of the numeric lab values per label.
+    """
+    percentile_columns = "".join(
+        f",\n               quantile_cont(value_num, {q}) AS p{round(q * 100)}" for q in percentiles
+    )
+    stats = query(f"""
+        WITH events AS (
+            SELECT e.value IS NULL AS value_missing,
+                   TRY_CAST(e.value AS DOUBLE) AS value_num,
+                   CAST(i.label AS VARCHAR) AS label
+            FROM (SELECT itemid, value FROM {scan(labevents_path)}) AS e
+            JOIN (SELECT itemid, label FROM {scan(labitems_path)}) AS i USING (itemid)
+            WHERE i.label IS NOT NULL
+        )
+        SELECT label,
+               avg(value_num) AS mean_value,
+               stddev_samp(value_num) AS std_value,
+               min(value_num) AS min_value,
+               max(value_num) AS max_value,
+               avg(CAST(value_missing AS DOUBLE)) * 100 AS missing_percent{percentile_columns}
+        FROM events
+        GROUP BY label
+        ORDER BY label
+    """)
+    return stats.round(2)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live in the repository root, next to the analysis scripts;
+# the synthetic MIMIC generator lives in benchmarks/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
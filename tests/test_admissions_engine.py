@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mimic_cache
+from admissions_engine import (DAY_ORDER, DEFAULT_LOS_BINS, NS_PER_DAY, AdmissionCountCube, AdmissionsEngine,
+                              StreamingLOS)
+from analyzers import LOSAdmissionsAnalyzer, PeakAdmissionsAnalyzer
+
+
+def test_streaming_los_bounds_corrupt_stays():
+    los = StreamingLOS(max_days=30)
+    # One corrupt stay of ~270 years must not grow the histogram past max_days
+    los.update(np.array([1, 2, 3, 100_000], dtype=np.int64) * NS_PER_DAY)
+    assert len(los.counts) <= los.max_bins
+    assert los.overflow == 1
+    assert los.count == 4
+    assert los.mean == (1 + 2 + 3 + 100_000) / 4
+    assert los.median == 2.5
+    assert los.percentile(100) == 30
+
+
+def test_streaming_los_merge_keeps_overflow():
+    left, right = StreamingLOS(max_days=30), StreamingLOS(max_days=30)
+    left.update(np.array([1, 40], dtype=np.int64) * NS_PER_DAY)
+    right.update(np.array([2, 50], dtype=np.int64) * NS_PER_DAY)
+    merged = left.merge(right)
+    assert merged.count == 4
+    assert merged.overflow == 2
+    assert merged.median == (2 + 30) / 2
+
+
+@pytest.fixture
+def admissions(tmp_path, monkeypatch):
+    monkeypatch.setenv(mimic_cache.CACHE_DIR_ENV, str(tmp_path / "cache"))
+    rng = np.random.default_rng(11)
+    n = 500
+    admit = pd.Timestamp("2150-01-01") + pd.to_timedelta(rng.integers(0, 5 * 365 * 24 * 60, n), unit="min")
+    disch = admit + pd.to_timedelta(rng.integers(-600, 20 * 24 * 60, n), unit="min")
+    df = pd.DataFrame({
+        "subject_id": rng.integers(1, 100, n),
+        "hadm_id": np.arange(n),
+        "admittime": admit.strftime("%Y-%m-%d %H:%M:%S"),
+        "dischtime": disch.strftime("%Y-%m-%d %H:%M:%S"),
+        "admission_type": rng.choice(["EW EMER.", "ELECTIVE", "URGENT"], n),
+        "discharge_location": rng.choice(["HOME", "SKILLED NURSING FACILITY", "DIED", None], n),
+    })
+    df.loc[::37, "admittime"] = None
+    df.loc[::41, "dischtime"] = None
+    path = tmp_path / "admissions.csv"
+    df.to_csv(path, index=False)
+    return str(path), df
+
+
+def _baseline(df):
+    """The pandas computations of the analyses before the engine."""
+    df = df.copy()
+    df["admittime"] = pd.to_datetime(df["admittime"], errors="coerce")
+    df["dischtime"] = pd.to_datetime(df["dischtime"], errors="coerce")
+    los = (df["dischtime"] - df["admittime"]).dt.total_seconds() / (24 * 3600)
+    los = los[los > 0]
+    df = df.dropna(subset=["admittime"])
+    hourly = df.groupby(df["admittime"].dt.hour).size()
+    daily = df.groupby(df["admittime"].dt.day_name()).size()
+    discharge = df["discharge_location"].fillna("UNKNOWN").value_counts()
+    return hourly, daily, discharge, los
+
+
+def _assert_baseline(results, df):
+    hourly, daily, discharge, los = _baseline(df)
+    assert dict(zip(results.hourly["hour"], results.hourly["admissions"])) == hourly.to_dict()
+    assert dict(zip(results.daily["day_of_week"].astype(str), results.daily["admissions"])) == daily.to_dict()
+    assert list(results.daily["day_of_week"]) == [day for day in DAY_ORDER if day in daily.index]
+    assert dict(zip(results.discharge["discharge_location"].astype(str), results.discharge["count"])) == discharge.to_dict()
+    np.testing.assert_allclose(results.discharge["percent"].sum(), 100, atol=0.05)
+    assert results.los_count == len(los)
+    np.testing.assert_allclose([results.los_average, results.los_median], [los.mean(), los.median()])
+    assert results.los_histogram.sum() == np.histogram(los, bins=DEFAULT_LOS_BINS)[0].sum()
+
+
+def test_engine_matches_the_pandas_baseline(admissions):
+    path, df = admissions
+    _assert_baseline(AdmissionsEngine(df).run(), df)
+    _assert_baseline(AdmissionsEngine.from_csv(path).run(), df)
+
+
+def test_engine_computes_only_the_requested_metrics(admissions):
+    path, df = admissions
+    engine = AdmissionsEngine.from_csv(path)
+    results = engine.run(["peaks", "discharge"])
+    assert results.los_count is None and results.los_histogram is None
+    # dischtime is never parsed for a peaks or discharge query
+    assert engine._disch_ns is None
+    with pytest.raises(ValueError):
+        engine.run(["peaks", "los_p99"])
+
+
+def test_wrappers_match_the_pandas_baseline(admissions):
+    path, df = admissions
+    hourly, daily, discharge, los = _baseline(df)
+
+    peaks = PeakAdmissionsAnalyzer(AdmissionsEngine.read_columns(path, times=False), source_path=path)
+    hourly_frame, daily_frame = peaks.peak_admission_times()
+    assert dict(zip(hourly_frame["hour"], hourly_frame["admissions"])) == hourly.to_dict()
+    assert dict(zip(daily_frame["day_of_week"].astype(str), daily_frame["admissions"])) == daily.to_dict()
+    summary = peaks.discharge_destination_summary()
+    assert dict(zip(summary["discharge_location"].astype(str), summary["count"])) == discharge.to_dict()
+    assert peaks.engine._disch_ns is None
+
+    los_stats = LOSAdmissionsAnalyzer(path).average_and_median_los()
+    assert los_stats["count_used"] == len(los)
+    np.testing.assert_allclose([los_stats["average"], los_stats["median"]], [los.mean(), los.median()])
+
+
+def _cube_rows(rng, n, start, days, categories):
+    admit = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 24 * 60, n), unit="min")
+    return pd.DataFrame({"admittime": admit, "category": rng.choice(categories, n)})
+
+
+def _expected_cube(rows, origin):
+    days = (rows["admittime"].dt.normalize() - origin).dt.days
+    return rows.groupby([days // 7, rows["admittime"].dt.weekday, rows["admittime"].dt.hour, rows["category"]]).size()
+
+
+def test_count_cube_grows_in_both_directions_and_round_trips(tmp_path):
+    rng = np.random.default_rng(5)
+    # Batches in unsorted time order: the middle, then earlier weeks, then later weeks with a new category
+    batches = [
+        _cube_rows(rng, 300, "2180-03-01", 60, ["EW EMER.", "ELECTIVE"]),
+        _cube_rows(rng, 200, "2179-11-15", 40, ["ELECTIVE"]),
+        _cube_rows(rng, 200, "2180-06-20", 90, ["URGENT", "EW EMER."]),
+    ]
+    cube = AdmissionCountCube()
+    for batch in batches:
+        batch = batch.sample(frac=1, random_state=1)
+        cube.add(batch["admittime"].to_numpy(dtype="datetime64[ns]").astype(np.int64), batch["category"])
+        path = str(tmp_path / "cube.npz")
+        cube.save(path)
+        cube = AdmissionCountCube.load(path)
+
+    rows = pd.concat(batches, ignore_index=True)
+    origin = cube.week_starts[0]
+    assert origin.weekday() == 0 and origin <= rows["admittime"].min() < origin + pd.Timedelta(days=7)
+    expected = _expected_cube(rows, origin)
+    actual = {
+        (week, weekday, hour, cube.categories[c]): count
+        for (week, weekday, hour, c), count in np.ndenumerate(cube.counts) if count
+    }
+    assert actual == expected.to_dict()
+    assert sorted(cube.categories) == ["ELECTIVE", "EW EMER.", "URGENT"]
+
+    # Heatmaps and breakdowns are slices of the same counts
+    heatmap = cube.heatmap(start="2180-03-01", end="2180-04-30", category="ELECTIVE")
+    window = rows[(rows["admittime"] >= "2180-03-01") & (rows["admittime"] < "2180-05-01")
+                  & (rows["category"] == "ELECTIVE")]
+    assert heatmap.to_numpy().sum() == len(window)
+    assert heatmap.loc["Monday", 9] == ((window["admittime"].dt.weekday == 0) & (window["admittime"].dt.hour == 9)).sum()
+    assert cube.category_breakdown().to_dict() == rows["category"].value_counts().to_dict()
+
+    weekly = rows.groupby((rows["admittime"].dt.normalize() - origin).dt.days // 7).size()
+    rolling = cube.rolling_heatmaps(window_weeks=4)
+    for i, (start, frame) in enumerate(rolling.items()):
+        assert start == cube.week_starts[i]
+        assert frame.to_numpy().sum() == weekly.reindex(range(i, i + 4), fill_value=0).sum()
+    assert len(rolling) == len(cube.week_starts) - 3
+
+    monthly = cube.monthly_heatmaps(category="URGENT")
+    urgent = rows[rows["category"] == "URGENT"]
+    expected_months = urgent.groupby(urgent["admittime"].dt.to_period("M")).size()
+    assert {month: frame.to_numpy().sum() for month, frame in monthly.items()} == expected_months.to_dict()
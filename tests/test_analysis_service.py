@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+import analysis_service
+from analysis_service import AnalysisService
+
+
+def _touch(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_concurrent_first_requests_share_one_build(tmp_path):
+    source = tmp_path / "patients.csv"
+    _touch(source, "subject_id,gender,anchor_age\n1,F,40\n")
+    service = AnalysisService({"patients": str(source)})
+    builds = []
+
+    def factory():
+        builds.append(threading.get_ident())
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.resident("patients", ("patients",), factory)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_top_icd_follows_the_dictionary_version(tmp_path):
+    diagnoses = tmp_path / "diagnoses_icd.csv"
+    dictionary = tmp_path / "d_icd_diagnoses.csv"
+    pd.DataFrame({"subject_id": [1, 2, 2], "hadm_id": [10, 20, 20], "seq_num": [1, 1, 2],
+                  "icd_code": ["A01", "A01", "B02"], "icd_version": [10, 10, 10]}).to_csv(diagnoses, index=False)
+    _touch(dictionary, "icd_code,icd_version,long_title\nA01,10,Old title\nB02,10,Other\n")
+    service = AnalysisService({"diagnoses_icd": str(diagnoses), "d_icd_diagnoses": str(dictionary)})
+
+    first, cached = service.query("top_icd", {"top_n": "1"})
+    assert not cached
+    assert first["rows"][0]["long_title"] == "Old title"
+
+    _touch(dictionary, "icd_code,icd_version,long_title\nA01,10,New title\nB02,10,Other\n")
+    os.utime(dictionary, ns=(time.time_ns(), time.time_ns() + 10**9))
+    second, cached = service.query("top_icd", {"top_n": "1"})
+    assert not cached
+    assert second["rows"][0]["long_title"] == "New title"
+
+
+def test_top_icd_without_dictionary(tmp_path):
+    diagnoses = tmp_path / "diagnoses_icd.csv"
+    pd.DataFrame({"subject_id": [1], "hadm_id": [10], "seq_num": [1],
+                  "icd_code": ["A01"], "icd_version": [10]}).to_csv(diagnoses, index=False)
+    result, _ = AnalysisService({"diagnoses_icd": str(diagnoses)}).query("top_icd", {})
+    assert result["rows"][0]["icd_code"] == "A01"
+
+
+def test_resident_analyzers_keep_a_bounded_number_of_stage_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_service, "RESIDENT_STAGE_RECORDS", 10)
+    source = tmp_path / "patients.csv"
+    _touch(source, "subject_id,gender,anchor_age\n1,F,40\n2,M,50\n")
+    service = AnalysisService({"patients": str(source)})
+    # Distinct (unused) parameters make every query miss the result cache
+    for i in range(30):
+        result, cached = service.query("gender_distribution", {"run": str(i)})
+        assert not cached and result == {"F": 1, "M": 1}
+    records = service.patients().instrumentation.records
+    assert len(records) == 10
+    assert records[-1].stage == "aggregate_gender"
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+import synthetic_mimic  # noqa: E402
+from analyzers import LabStatsAnalyzer, TopICDAnalyzer, UniqueICDAnalyzer  # noqa: E402
+from check_backend_parity import LAB_PERCENTILE_RTOL, check_parity  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def paths(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("mimic")
+    synthetic_mimic.generate(str(data_dir), 5_000, seed=1)
+    return synthetic_mimic.table_paths(str(data_dir))
+
+
+def _by_count(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """Top-N rows in a backend-independent order (ties at equal counts sorted by key)."""
+    df = df.assign(**{key: df[key].astype(str) for key in keys})
+    return df.sort_values(["count"] + keys, ascending=[False] + [True] * len(keys)).reset_index(drop=True)
+
+
+def test_top_icd_codes(paths):
+    # All codes, so no tie is cut at the top-N boundary
+    pandas_df = UniqueICDAnalyzer(paths["diagnoses_icd"]).get_top_icd_codes(10_000)
+    duckdb_df = UniqueICDAnalyzer(paths["diagnoses_icd"], backend="duckdb").get_top_icd_codes(10_000)
+    pd.testing.assert_frame_equal(_by_count(pandas_df, ["icd_code"]), _by_count(duckdb_df, ["icd_code"]),
+                                  check_dtype=False)
+
+
+def test_unique_icd_per_patient(paths):
+    pandas_df = UniqueICDAnalyzer(paths["diagnoses_icd"]).get_unique_icd_per_patient()
+    duckdb_df = UniqueICDAnalyzer(paths["diagnoses_icd"], backend="duckdb").get_unique_icd_per_patient()
+    for df in (pandas_df, duckdb_df):
+        df["icd_code"] = df["icd_code"].map(lambda codes: sorted(map(str, codes)))
+    pd.testing.assert_frame_equal(pandas_df.sort_values("subject_id").reset_index(drop=True),
+                                  duckdb_df.sort_values("subject_id").reset_index(drop=True),
+                                  check_dtype=False)
+
+
+def test_compute_top_icd(paths):
+    pandas_df = TopICDAnalyzer(paths["diagnoses_icd"], top_n=10_000).run()
+    duckdb_df = TopICDAnalyzer(paths["diagnoses_icd"], top_n=10_000, backend="duckdb").run()
+    keys = ["icd_code", "icd_version"]
+    pd.testing.assert_frame_equal(_by_count(pandas_df, keys), _by_count(duckdb_df, keys), check_dtype=False)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_lab_statistics(paths, streaming):
+    pandas_df = LabStatsAnalyzer(paths["d_labitems"], paths["labevents"], streaming=streaming,
+                                 chunksize=1_000).compute_statistics()
+    duckdb_df = LabStatsAnalyzer(paths["d_labitems"], paths["labevents"], backend="duckdb").compute_statistics()
+    pandas_df, duckdb_df = (df.assign(label=df["label"].astype(str)).sort_values("label").reset_index(drop=True)
+                            for df in (pandas_df, duckdb_df))
+    assert list(pandas_df.columns) == list(duckdb_df.columns)
+    assert pandas_df["label"].tolist() == duckdb_df["label"].tolist()
+
+    percentiles = [column for column in pandas_df.columns if column.startswith("p")]
+    exact = [column for column in pandas_df.columns if column not in percentiles + ["label"]]
+    # Rounded to 2 decimals by both backends: one unit of rounding difference
+    np.testing.assert_allclose(pandas_df[exact].astype(float), duckdb_df[exact].astype(float), atol=0.011)
+    # The pandas percentiles come from a bucketed sketch
+    np.testing.assert_allclose(pandas_df[percentiles].astype(float), duckdb_df[percentiles].astype(float),
+                               rtol=LAB_PERCENTILE_RTOL, atol=0.011)
+
+
+def test_check_parity_reports_no_difference(paths):
+    assert check_parity(paths) == []
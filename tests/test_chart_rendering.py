@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from admissions_engine import AdmissionsEngine
+from chart_rendering import ChartJob, ChartRenderer, render_jobs, render_unit_charts
+
+
+def _jobs(out_dir, fmt):
+    jobs = []
+    for unit in range(3):
+        jobs += [
+            ChartJob("hourly", os.path.join(out_dir, f"unit{unit}", f"hourly.{fmt}"),
+                     {"hour": list(range(24)), "admissions": list(np.arange(24) * (unit + 1))}),
+            ChartJob("daily", os.path.join(out_dir, f"unit{unit}", f"daily.{fmt}"),
+                     {"day_of_week": ["Monday", "Tuesday"], "admissions": [unit + 1, 2]}),
+            ChartJob("los_histogram", os.path.join(out_dir, f"unit{unit}", f"los.{fmt}"),
+                     {"counts": [5, 3, 1], "edges": [0, 1, 2, 3]}, title=f"Unit {unit}"),
+        ]
+    return jobs
+
+
+def _assert_written(paths, jobs):
+    assert paths == [job.path for job in jobs]
+    for path in paths:
+        assert os.path.getsize(path) > 0
+
+
+def test_render_jobs_in_process_and_over_a_pool(tmp_path):
+    for processes, fmt in ((1, "png"), (2, "svg"), (4, "png")):
+        jobs = _jobs(str(tmp_path / f"p{processes}"), fmt)
+        _assert_written(render_jobs(jobs, processes=processes), jobs)
+
+
+def test_one_renderer_reuses_its_figure(tmp_path):
+    renderer = ChartRenderer()
+    figure, ax = renderer.figure, renderer.ax
+    jobs = _jobs(str(tmp_path), "png")
+    _assert_written([renderer.render(job) for job in jobs], jobs)
+    assert renderer.figure is figure and renderer.ax is ax
+    assert renderer.figure.axes == [ax]
+    # The axes are cleared between charts: only the last chart's bars are drawn
+    assert len(ax.patches) == 3
+
+
+def test_render_unit_charts(tmp_path):
+    admissions = pd.DataFrame({
+        "admittime": ["2180-01-01 08:00:00", "2180-01-02 14:30:00", "2180-01-03 08:15:00"],
+        "dischtime": ["2180-01-03 08:00:00", "2180-01-02 20:30:00", "2180-01-09 10:00:00"],
+        "discharge_location": ["HOME", None, "HOME"],
+    })
+    results = AdmissionsEngine(admissions).run()
+    peaks_only = AdmissionsEngine(admissions).run(["peaks"])
+    paths = render_unit_charts({"icu": results, "ward": peaks_only}, str(tmp_path), processes=2)
+    names = sorted(os.path.relpath(path, tmp_path) for path in paths)
+    assert names == sorted([os.path.join("icu", "admissions_by_hour.png"), os.path.join("icu", "admissions_by_day.png"),
+                            os.path.join("icu", "los_histogram.png"), os.path.join("ward", "admissions_by_hour.png"),
+                            os.path.join("ward", "admissions_by_day.png")])
+    assert all(os.path.getsize(path) > 0 for path in paths)
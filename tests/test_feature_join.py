@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import mimic_cache
+from analyzers import load_script
+from feature_join import FeatureJoinEngine
+
+deidentified_age = load_script("gender distribution.py").deidentified_age
+
+
+@pytest.fixture
+def tables(tmp_path, monkeypatch):
+    monkeypatch.setenv(mimic_cache.CACHE_DIR_ENV, str(tmp_path / "cache"))
+    rng = np.random.default_rng(3)
+    subjects = np.arange(1, 31)
+    patients = pd.DataFrame({
+        "subject_id": subjects,
+        "gender": rng.choice(["F", "M"], len(subjects)),
+        "anchor_age": rng.integers(20, 95, len(subjects)),
+        "anchor_year": rng.integers(2150, 2160, len(subjects)),
+    })
+    admit = pd.Timestamp("2155-01-01") + pd.to_timedelta(rng.integers(0, 3000, 60), unit="D")
+    admissions = pd.DataFrame({
+        "subject_id": rng.choice(subjects, 60),
+        "hadm_id": np.arange(100, 160),
+        "admittime": admit.strftime("%Y-%m-%d %H:%M:%S"),
+        "dischtime": (admit + pd.to_timedelta(rng.integers(-1, 20, 60), unit="D")).strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    # Code frequencies 40 > 25 > 10 rows with a hadm_id; "Z999" only appears without one
+    codes = ["I10"] * 40 + ["E119"] * 25 + ["4019"] * 10
+    diagnoses = pd.DataFrame({
+        "subject_id": admissions["subject_id"].to_numpy()[np.arange(len(codes)) % 60],
+        "hadm_id": admissions["hadm_id"].to_numpy()[np.arange(len(codes)) % 60].astype(float),
+        "seq_num": 1,
+        "icd_code": codes,
+        "icd_version": 10,
+    })
+    orphans = pd.DataFrame({"subject_id": 1, "hadm_id": np.nan, "seq_num": 1, "icd_code": "Z999", "icd_version": 10},
+                           index=range(60))
+    diagnoses = pd.concat([diagnoses, orphans], ignore_index=True)
+    rows = rng.integers(0, 60, 300)
+    labevents = pd.DataFrame({
+        "subject_id": admissions["subject_id"].to_numpy()[rows],
+        "hadm_id": np.where(rng.random(300) < 0.1, np.nan, admissions["hadm_id"].to_numpy()[rows]),
+        "itemid": rng.choice([50912, 50912, 50912, 50971, 50971, 51221], 300),
+        "value": np.round(rng.normal(10, 3, 300), 1).astype(str),
+    })
+    labevents.loc[::17, "value"] = "___"
+
+    paths = {}
+    for name, df in [("patients", patients), ("admissions", admissions),
+                     ("diagnoses_icd", diagnoses), ("labevents", labevents)]:
+        paths[name] = str(tmp_path / f"{name}.csv")
+        df.to_csv(paths[name], index=False)
+    return paths, patients, admissions, diagnoses, labevents
+
+
+def _expected(patients, admissions, diagnoses, labevents):
+    expected = admissions.merge(patients, on="subject_id", how="left")
+    admit, disch = pd.to_datetime(expected["admittime"]), pd.to_datetime(expected["dischtime"])
+    expected["age"] = deidentified_age(expected["anchor_age"] + admit.dt.year - expected["anchor_year"]).astype(float)
+    los = (disch - admit).dt.total_seconds() / 86400
+    expected["los_days"] = los.where(los > 0)
+
+    diagnoses = diagnoses.dropna(subset=["hadm_id"]).drop_duplicates(["hadm_id", "icd_code"])
+    expected = expected.merge(diagnoses.groupby("hadm_id").size().rename("icd_count"),
+                              left_on="hadm_id", right_index=True, how="left")
+    for code in ["I10", "E119"]:
+        expected[f"icd_{code}"] = expected["hadm_id"].isin(diagnoses.loc[diagnoses["icd_code"] == code, "hadm_id"])
+
+    labevents = labevents.dropna(subset=["hadm_id"]).assign(value=lambda df: pd.to_numeric(df["value"], errors="coerce"))
+    expected = expected.merge(labevents.groupby("hadm_id").size().rename("lab_count"),
+                              left_on="hadm_id", right_index=True, how="left")
+    for itemid in [50912, 50971]:
+        means = labevents[labevents["itemid"] == itemid].groupby("hadm_id")["value"].mean()
+        expected = expected.merge(means.rename(f"lab_{itemid}_mean"), left_on="hadm_id", right_index=True, how="left")
+    expected[["icd_count", "lab_count"]] = expected[["icd_count", "lab_count"]].fillna(0)
+    return expected
+
+
+def test_features_match_a_direct_merge(tables, tmp_path):
+    paths, *frames = tables
+    engine = FeatureJoinEngine(paths["patients"], paths["admissions"], paths["diagnoses_icd"], paths["labevents"],
+                               partitions=4, chunksize=40, top_k_codes=2, top_k_labs=2)
+    engine.build(str(tmp_path / "features"))
+    result = FeatureJoinEngine.read(str(tmp_path / "features")).sort_values("hadm_id").reset_index(drop=True)
+    expected = _expected(*frames).sort_values("hadm_id").reset_index(drop=True)
+
+    columns = ["subject_id", "hadm_id", "gender", "age", "los_days", "icd_count", "icd_I10", "icd_E119",
+               "lab_count", "lab_50912_mean", "lab_50971_mean"]
+    assert list(result.columns) == columns
+    expected = expected[columns].astype(result.dtypes.to_dict())
+    pd.testing.assert_frame_equal(result.astype({"gender": object}), expected.astype({"gender": object}),
+                                  check_exact=False)
+
+
+def test_rebuild_replaces_the_previous_partitions(tables, tmp_path):
+    paths, *_ = tables
+    output = str(tmp_path / "features")
+    FeatureJoinEngine(paths["patients"], paths["admissions"], partitions=8).build(output)
+    written = FeatureJoinEngine(paths["patients"], paths["admissions"], partitions=2).build(output)
+
+    assert sorted(os.listdir(output)) == sorted(os.path.basename(path) for path in written)
+    assert len(FeatureJoinEngine.read(output)) == 60
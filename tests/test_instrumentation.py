@@ -0,0 +1,76 @@
+import json
+import tracemalloc
+
+import pandas as pd
+
+import instrumentation
+from instrumentation import Instrumented, StageRecord
+
+
+class _Analyzer(Instrumented):
+    def run(self, df):
+        with self.stage("aggregate", rows_in=df) as stage:
+            return stage.output(df.groupby("key").size())
+
+
+def _frame():
+    return pd.DataFrame({"key": ["a", "b", "a", "c"], "value": [1, 2, 3, 4]})
+
+
+def test_stage_records_rows_time_and_memory(monkeypatch):
+    monkeypatch.delenv(instrumentation.LOG_ENV, raising=False)
+    monkeypatch.delenv(instrumentation.PROFILE_ENV, raising=False)
+    analyzer = _Analyzer()
+    analyzer.run(_frame())
+    with analyzer.stage("export") as stage:
+        stage.extra["path"] = "out.csv"
+
+    aggregate, export = analyzer.instrumentation.records
+    assert isinstance(aggregate, StageRecord)
+    assert (aggregate.analyzer, aggregate.stage, aggregate.rows_in, aggregate.rows_out) == ("_Analyzer", "aggregate", 4, 3)
+    assert aggregate.wall_seconds >= 0 and isinstance(aggregate.rss_delta_mb, float)
+    assert aggregate.traced_peak_mb is None and aggregate.profile is None
+    assert (export.rows_in, export.rows_out, export.extra) == (None, None, {"path": "out.csv"})
+    assert [record["stage"] for record in json.loads(analyzer.instrumentation.to_json())] == ["aggregate", "export"]
+
+
+def test_profilers_fill_their_fields(monkeypatch):
+    monkeypatch.setenv(instrumentation.PROFILE_ENV, "cprofile,tracemalloc")
+    analyzer = _Analyzer()
+    try:
+        analyzer.run(_frame())
+    finally:
+        tracemalloc.stop()
+    record = analyzer.instrumentation.records[-1]
+    assert record.traced_peak_mb is not None and record.traced_peak_mb >= 0
+    assert record.profile and {"function", "calls", "total_seconds", "cumulative_seconds"} <= set(record.profile[0])
+
+
+def test_print_summary_lists_every_stage(capsys):
+    analyzer = _Analyzer()
+    analyzer.run(_frame())
+    analyzer.instrumentation.print_summary()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "⏱️ Stages of _Analyzer:"
+    assert len(lines) == 2 and "aggregate" in lines[1] and "rows 4 → 3" in lines[1] and "MB" in lines[1]
+
+
+def test_records_are_appended_to_the_log_as_json_lines(tmp_path, monkeypatch):
+    log = tmp_path / "stages.jsonl"
+    monkeypatch.setenv(instrumentation.LOG_ENV, str(log))
+    first, second = _Analyzer(), _Analyzer()
+    first.run(_frame())
+    second.run(_frame())
+    lines = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+    assert len(lines) == 2
+    assert lines[0] == first.instrumentation.records[0].to_dict()
+    assert {line["rows_out"] for line in lines} == {3}
+
+
+def test_limit_keeps_the_latest_records():
+    analyzer = _Analyzer()
+    for _ in range(3):
+        analyzer.run(_frame())
+    analyzer.instrumentation.limit(2)
+    analyzer.run(_frame().head(2))
+    assert [record.rows_in for record in analyzer.instrumentation.records] == [4, 2]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lab_timeseries import LabTimeSeriesStore
+
+
+@pytest.fixture
+def labevents(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = 500
+    df = pd.DataFrame({
+        "subject_id": rng.integers(1, 40, rows),
+        "itemid": rng.integers(50000, 50010, rows),
+        "charttime": pd.Timestamp("2150-01-01") + pd.to_timedelta(rng.integers(0, 10**6, rows), unit="min"),
+        "value": rng.normal(1e6, 1.0, rows).round(3).astype(str),
+    })
+    df.loc[::17, "value"] = None
+    df.loc[::23, "value"] = "pending"
+    path = tmp_path / "labevents.csv"
+    df.to_csv(path, index=False)
+    return path, df
+
+
+def test_build_in_small_chunks_matches_a_full_sort(labevents, tmp_path):
+    path, df = labevents
+    store = LabTimeSeriesStore.build(str(path), str(tmp_path / "store"), chunksize=64, window_rows=50)
+    charttime = pd.to_datetime(df["charttime"]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    order = np.lexsort((charttime, df["itemid"].to_numpy(), df["subject_id"].to_numpy()))
+    np.testing.assert_array_equal(store.itemid, df["itemid"].to_numpy()[order])
+    np.testing.assert_array_equal(store.charttime, charttime[order])
+    item_order = np.lexsort((store.charttime, store.itemid))
+    np.testing.assert_array_equal(store.item_order, item_order)
+
+
+def test_window_statistics_match_pandas(labevents, tmp_path):
+    path, df = labevents
+    store = LabTimeSeriesStore.build(str(path), str(tmp_path / "store"), chunksize=100)
+    stats = store.window_statistics().set_index("itemid")
+    values = pd.to_numeric(df["value"], errors="coerce")
+    expected = values.groupby(df["itemid"]).agg(["mean", "std"]).round(2)
+    np.testing.assert_allclose(stats["mean_value"], expected["mean"])
+    # Values near 1e6 with a spread of 1: a sum-of-squares variance would cancel here
+    np.testing.assert_allclose(stats["std_value"], expected["std"])
@@ -0,0 +1,44 @@
+import pandas as pd
+
+import lazy_query
+from lazy_query import LazyMIMIC
+
+
+def _lab_tables(tmp_path):
+    labitems = tmp_path / "d_labitems.csv"
+    labevents = tmp_path / "labevents.csv"
+    pd.DataFrame({"itemid": [1, 2], "label": ["Sodium", "Potassium"]}).to_csv(labitems, index=False)
+    pd.DataFrame({
+        "itemid": [1, 1, 2, 2, 1],
+        "charttime": ["2180-01-01 10:00:00", "2180-03-01 10:00:00", "2180-05-01 10:00:00",
+                      "2180-06-01 10:00:00", "2181-01-01 10:00:00"],
+        "value": ["140", "136", "4.1", "x", "150"],
+    }).to_csv(labevents, index=False)
+    return {"d_labitems": str(labitems), "labevents": str(labevents)}
+
+
+def test_lab_means_plans_the_labitems_scan(tmp_path, monkeypatch):
+    monkeypatch.setenv("MIMIC_CACHE_DIR", str(tmp_path / "cache"))
+    queries = LazyMIMIC(_lab_tables(tmp_path))
+    means = queries.lab_means(start="2180-01-01", end="2181-01-01")
+
+    explained = queries.plan.explain()
+    assert explained.index("d_labitems.csv") < explained.index("labevents.csv")
+    assert "lab_means(itemid, value) using lab_items" in explained
+
+    scanned = []
+    scan = lazy_query.scan
+    monkeypatch.setattr(lazy_query, "scan", lambda path, *args: scanned.append(path) or scan(path, *args))
+    result = means.result().set_index("label")["mean_value"]
+    assert result.to_dict() == {"Potassium": 4.1, "Sodium": 138.0}
+    assert scanned == [queries.paths["d_labitems"], queries.paths["labevents"]]
+
+
+def test_inputs_scan_runs_first_whatever_the_order_added(tmp_path, monkeypatch):
+    monkeypatch.setenv("MIMIC_CACHE_DIR", str(tmp_path / "cache"))
+    queries = LazyMIMIC(_lab_tables(tmp_path))
+    rows = queries._table("labevents").agg(["itemid"], len, "rows")
+    means = queries.lab_means()
+    queries.collect()
+    assert rows.result() == 5
+    assert set(means.result()["label"]) == {"Sodium", "Potassium"}
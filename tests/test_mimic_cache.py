@@ -0,0 +1,29 @@
+import os
+
+import pandas as pd
+
+import mimic_cache
+from mimic_cache import read_table
+
+
+def _write_patients(directory):
+    path = os.path.join(directory, "patients.csv")
+    pd.DataFrame({"subject_id": [1, 2], "gender": ["F", "M"], "anchor_age": [40, 95]}).to_csv(path, index=False)
+    return path
+
+
+def test_read_table_uses_cache_dir(tmp_path):
+    source = _write_patients(tmp_path)
+    cache_dir = tmp_path / "elsewhere"
+    df = read_table(source, columns=["subject_id", "anchor_age"], cache_dir=str(cache_dir))
+    assert df["anchor_age"].tolist() == [40, 95]
+    assert [name for name in os.listdir(cache_dir) if name.endswith(".parquet")]
+    assert not os.path.exists(tmp_path / mimic_cache.CACHE_DIR_NAME)
+
+
+def test_read_table_falls_back_when_cache_dir_not_writable(tmp_path, monkeypatch):
+    source = _write_patients(tmp_path)
+    # A directory below a regular file can never be created
+    monkeypatch.setenv(mimic_cache.CACHE_DIR_ENV, os.path.join(source, "cache"))
+    df = read_table(source, columns=["gender"])
+    assert df["gender"].astype(str).tolist() == ["F", "M"]
@@ -0,0 +1,87 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic_mimic
+from analyzers import LabStatsAnalyzer, LOSAdmissionsAnalyzer, PeakAdmissionsAnalyzer, TopICDAnalyzer
+from admissions_engine import AdmissionsEngine
+from multi_site import LOS_PERCENTILES, MultiSiteRunner, site_paths
+
+TABLES = ["admissions", "diagnoses_icd", "d_labitems", "labevents"]
+
+
+@pytest.fixture(scope="module")
+def sites(tmp_path_factory):
+    root = tmp_path_factory.mktemp("sites")
+    # site_a keeps its tables in the root, site_b in hosp/
+    synthetic_mimic.generate(str(root / "site_a"), 3_000, seed=1)
+    synthetic_mimic.generate(str(root / "site_b" / "hosp"), 2_000, seed=2)
+
+    combined = root / "combined"
+    combined.mkdir()
+    for table in TABLES:
+        frames = [pd.read_csv(site_paths(str(root / site))[table]) for site in ("site_a", "site_b")]
+        # Both sites share one lab item dictionary
+        frame = frames[0] if table == "d_labitems" else pd.concat(frames, ignore_index=True)
+        frame.to_csv(combined / f"{table}.csv", index=False)
+    return [str(root / "site_a"), str(root / "site_b")], site_paths(str(combined))
+
+
+def test_site_paths_finds_both_layouts(sites):
+    (site_a, site_b), _ = sites
+    assert os.path.dirname(site_paths(site_a)["admissions"]) == site_a
+    assert os.path.dirname(site_paths(site_b)["admissions"]) == os.path.join(site_b, "hosp")
+
+
+def test_merged_partials_match_one_run_over_the_concatenated_tables(sites):
+    roots, combined = sites
+    results = MultiSiteRunner(roots, processes=2, chunksize=700).run(top_n=10_000)
+    assert sorted(results.sites) == ["site_a", "site_b"]
+    assert not results.skipped
+
+    # icd: all codes, so no tie is cut at the top-N boundary
+    analyzer = TopICDAnalyzer(combined["diagnoses_icd"], top_n=10_000)
+    expected = analyzer.compute_top_icd(analyzer.load_diagnoses())
+    keys = ["icd_code", "icd_version"]
+    icd = results.overall["icd"].sort_values(keys).reset_index(drop=True)
+    expected = expected.sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(icd[keys + ["count", "percent"]], expected[keys + ["count", "percent"]],
+                                  check_dtype=False)
+
+    # labs: the bucket counts of the percentile sketches merge exactly
+    expected = LabStatsAnalyzer(combined["d_labitems"], combined["labevents"]).compute_statistics()
+    labs, expected = (df.assign(label=df["label"].astype(str)).sort_values("label").reset_index(drop=True)
+                      for df in (results.overall["labs"], expected))
+    assert list(labs.columns) == list(expected.columns)
+    assert labs["label"].tolist() == expected["label"].tolist()
+    numeric = [column for column in labs.columns if column != "label"]
+    np.testing.assert_allclose(labs[numeric].to_numpy(dtype=float), expected[numeric].to_numpy(dtype=float),
+                               rtol=1e-9, atol=0.011)  # statistics are rounded to 2 decimals
+
+    # los
+    analyzer = LOSAdmissionsAnalyzer(combined["admissions"])
+    expected = analyzer.average_and_median_los()
+    los = results.overall["los"]
+    assert los["count_used"] == expected["count_used"]
+    np.testing.assert_allclose([los["average"], los["median"]], [expected["average"], expected["median"]])
+    percentiles = analyzer.los_percentiles(LOS_PERCENTILES)
+    np.testing.assert_allclose([los[f"p{q}"] for q in LOS_PERCENTILES], [percentiles[q] for q in LOS_PERCENTILES])
+
+    # peaks
+    peaks = PeakAdmissionsAnalyzer(AdmissionsEngine.read_columns(combined["admissions"]))
+    hourly, daily = peaks.peak_admission_times()
+    pd.testing.assert_frame_equal(results.overall["peaks"]["hourly"], hourly, check_dtype=False)
+    pd.testing.assert_frame_equal(results.overall["peaks"]["daily"], daily, check_dtype=False)
+
+
+def test_sites_missing_a_table_are_skipped(sites, tmp_path):
+    (site_a, _), _ = sites
+    partial_site = tmp_path / "site_c"
+    partial_site.mkdir()
+    shutil.copy(site_paths(site_a)["admissions"], partial_site / "admissions.csv")
+    results = MultiSiteRunner([site_a, str(partial_site)], processes=2).run(["icd", "los"])
+    assert results.skipped == {"site_c": ["icd"]}
+    assert results.sites["site_c"]["los"]["count_used"] == results.sites["site_a"]["los"]["count_used"]
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import partitioned_stats
+from partitioned_stats import combine_aggregates, parallel_aggregates, partial_aggregates
+
+
+def test_combine_matches_numpy_without_cancellation():
+    # A large offset makes sum-of-squares variance lose every significant digit
+    values = 1e9 + np.arange(10, dtype=np.float64)
+    partials = [partial_aggregates(part) for part in np.array_split(values, 3)]
+    combined = combine_aggregates(partials)
+    assert combined["count"] == 10
+    assert combined["mean"] == pytest.approx(values.mean())
+    assert combined["variance"] == pytest.approx(values.var(ddof=1))
+
+
+def test_parallel_aggregates_in_pool_and_in_process(monkeypatch):
+    values = np.array([1.0, np.nan, 3.0, 4.0, 10.0, np.nan])
+    bounds = [(0, 2), (2, 4), (4, 6)]
+    expected = parallel_aggregates(values, bounds)
+    monkeypatch.setattr(partitioned_stats, "PARALLEL_MIN_ROWS", 0)
+    assert parallel_aggregates(values, bounds, max_workers=2) == expected
+    assert combine_aggregates(expected)["mean"] == pytest.approx(np.nanmean(values))
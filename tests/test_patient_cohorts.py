@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mimic_cache
+from analyzers import PatientDataAnalyzer, load_script
+
+deidentified_age = load_script("gender distribution.py").deidentified_age
+
+
+@pytest.fixture
+def patients(tmp_path, monkeypatch):
+    monkeypatch.setenv(mimic_cache.CACHE_DIR_ENV, str(tmp_path / "cache"))
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({
+        "subject_id": np.arange(1, 201),
+        "gender": rng.choice(["F", "M"], 200),
+        "anchor_age": rng.integers(18, 100, 200).astype(float),
+    })
+    df.loc[[4, 17, 60], "anchor_age"] = np.nan
+    path = tmp_path / "patients.csv"
+    df.to_csv(path, index=False)
+    return str(path), df
+
+
+def test_cohorts_match_per_cohort_analyses(patients, tmp_path):
+    path, df = patients
+    cohorts = {
+        "a": [1, 2, 2, 5, 18, 999],
+        "b": list(range(40, 120)) + [61, 61],
+        "empty": [],
+    }
+    stats = PatientDataAnalyzer(path).cohort_statistics(cohorts)
+
+    for name, subject_ids in cohorts.items():
+        cohort = df[df["subject_id"].isin(subject_ids)]
+        cohort_path = tmp_path / f"patients_{name}.csv"
+        cohort.to_csv(cohort_path, index=False)
+        genders = PatientDataAnalyzer(str(cohort_path)).gender_distribution() if len(cohort) else pd.Series(dtype=int)
+        ages = deidentified_age(cohort["anchor_age"])
+
+        row = stats.loc[name]
+        assert row["patients"] == len(cohort)
+        assert row["unmatched_subjects"] == len(set(subject_ids) - set(df["subject_id"]))
+        for gender in ("F", "M"):
+            assert row[gender] == genders.get(gender, 0)
+        np.testing.assert_allclose(row["mean_age"], round(ages.mean(), 2) if ages.notna().any() else np.nan)
+        np.testing.assert_allclose(row["median_age"], ages.median() if ages.notna().any() else np.nan)
+
+
+def test_missing_age_leaves_mean_and_median_defined(patients):
+    path, df = patients
+    stats = PatientDataAnalyzer(path).cohort_statistics({"a": [5, 6]})
+    age = deidentified_age(df.loc[df["subject_id"] == 6, "anchor_age"]).iloc[0]
+    assert stats.loc["a", "mean_age"] == age
+    assert stats.loc["a", "median_age"] == age
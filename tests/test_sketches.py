@@ -0,0 +1,36 @@
+import os
+
+import pandas as pd
+
+from sketches import ICDSketchSummary, load_or_build
+
+
+def _write_diagnoses(path, codes):
+    pd.DataFrame({"subject_id": range(len(codes)), "icd_code": codes,
+                  "icd_version": 10}).to_csv(path, index=False)
+
+
+def test_load_or_build_rebuilds_when_the_source_changes(tmp_path):
+    source = tmp_path / "diagnoses_icd.csv"
+    sketch_path = str(tmp_path / "diagnoses_icd.sketch.npz")
+    _write_diagnoses(source, ["A01", "A01", "B02"])
+
+    first = load_or_build(ICDSketchSummary, str(source), sketch_path)
+    assert first.rows == 3
+    assert load_or_build(ICDSketchSummary, str(source), sketch_path).source == first.source
+
+    _write_diagnoses(source, ["A01", "B02", "B02", "B02", "C03"])
+    os.utime(source, ns=(first.source["mtime_ns"] + 10**9,) * 2)
+    rebuilt = load_or_build(ICDSketchSummary, str(source), sketch_path)
+    assert rebuilt.rows == 5
+    assert rebuilt.top_icd_codes(1)["icd_code"].tolist() == ["B02"]
+    assert ICDSketchSummary.load(sketch_path).rows == 5
+
+
+def test_merged_summary_has_no_source(tmp_path):
+    source = tmp_path / "diagnoses_icd.csv"
+    _write_diagnoses(source, ["A01"])
+    merged = ICDSketchSummary.from_file(str(source)).merge(ICDSketchSummary.from_file(str(source)))
+    assert merged.source is None
+    merged.save(str(tmp_path / "merged.npz"))
+    assert ICDSketchSummary.load(str(tmp_path / "merged.npz")).source is None
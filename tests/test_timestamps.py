@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from timestamps import NAT, parse_timestamps
+
+
+def test_parse_mixed_valid_invalid_and_missing():
+    parsed = parse_timestamps(pd.Series(["2150-01-01 10:00:00", "bad", None]))
+    assert parsed[0] == pd.Timestamp("2150-01-01 10:00:00").value
+    assert parsed[1] == NAT
+    assert parsed[2] == NAT
+
+
+def test_parse_nullable_strings_with_rejected_fast_path_values():
+    # 19 characters but not a date: rejected by the fast path, parsed by the slow path
+    values = pd.Series(["2150-01-01 10:00:00", "2150-02-30 10:00:00", pd.NA], dtype="string")
+    parsed = parse_timestamps(values)
+    assert parsed[0] == pd.Timestamp("2150-01-01 10:00:00").value
+    assert parsed[1] == NAT
+    assert parsed[2] == NAT
+
+
+def test_parse_matches_pandas():
+    values = pd.Series(["2180-07-23 12:35:00", "2110-04-11 15:08:00", "2201-12-31 23:59:59"])
+    expected = pd.to_datetime(values).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    np.testing.assert_array_equal(parse_timestamps(values), expected)
@@ -0,0 +1,100 @@
+import os
+
+import pandas as pd
+
+import mimic_cache
+from analyzers import TopICDAnalyzer
+
+
+def _write_tables(directory):
+    diagnoses = os.path.join(directory, "diagnoses_icd.csv")
+    dictionary = os.path.join(directory, "d_icd_diagnoses.csv")
+    pd.DataFrame({"subject_id": [1, 2, 2, 3], "hadm_id": [10, 20, 20, 30], "seq_num": [1, 1, 2, 1],
+                  "icd_code": ["I10", "I10", "E119", "4019"], "icd_version": [10, 10, 10, 9]}
+                 ).to_csv(diagnoses, index=False)
+    pd.DataFrame({"icd_code": ["I10", "E119", "4019"], "icd_version": [10, 10, 9],
+                  "long_title": ["Essential hypertension", "Type 2 diabetes", "Hypertension NOS"]}
+                 ).to_csv(dictionary, index=False)
+    return diagnoses, dictionary
+
+
+def test_titles_without_a_writable_cache_directory(tmp_path, monkeypatch):
+    diagnoses, dictionary = _write_tables(tmp_path)
+    blocker = tmp_path / "not_a_directory"
+    blocker.write_text("")
+    monkeypatch.setenv(mimic_cache.CACHE_DIR_ENV, str(blocker / "cache"))
+
+    result = TopICDAnalyzer(diagnoses, dictionary, top_n=3).run()
+    titles = dict(zip(result["icd_code"], result["long_title"]))
+    assert titles == {"I10": "Essential hypertension", "E119": "Type 2 diabetes", "4019": "Hypertension NOS"}
+
+
+def test_titles_from_the_persisted_index(tmp_path, monkeypatch):
+    diagnoses, dictionary = _write_tables(tmp_path)
+    monkeypatch.setenv(mimic_cache.CACHE_DIR_ENV, str(tmp_path / "cache"))
+
+    result = TopICDAnalyzer(diagnoses, dictionary, top_n=3).run()
+    assert dict(zip(result["icd_code"], result["long_title"]))["E119"] == "Type 2 diabetes"
+    assert any(name.endswith(".titles") for name in os.listdir(tmp_path / "cache"))
+
+
+def _diagnoses_rows(start, count):
+    codes = ["I10", "E119", "4019", "Z794", "N179"]
+    rows = []
+    for subject_id in range(start, start + count):
+        code = codes[subject_id % 5 if subject_id % 3 else 0]
+        rows.append(f"{subject_id},{subject_id * 10},1,{code},{9 if code == '4019' else 10}\n")
+    return "".join(rows)
+
+
+def _top(path, state_path=None):
+    analyzer = TopICDAnalyzer(path, top_n=5, state_path=state_path)
+    if state_path:
+        return analyzer.compute_top_icd_incremental()
+    return analyzer.compute_top_icd(analyzer.load_diagnoses())
+
+
+def _assert_same_top(incremental, full):
+    key = ["icd_code", "icd_version"]
+    incremental = incremental.sort_values(key).reset_index(drop=True)
+    full = full.sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(incremental[key + ["count", "percent"]], full[key + ["count", "percent"]],
+                                  check_dtype=False)
+
+
+def test_incremental_counts_follow_appended_rows(tmp_path):
+    path, state = tmp_path / "diagnoses_icd.csv", str(tmp_path / "state.json")
+    path.write_text("subject_id,hadm_id,seq_num,icd_code,icd_version\n" + _diagnoses_rows(0, 40))
+    _assert_same_top(_top(str(path), state), _top(str(path)))
+    for start in (40, 70):
+        with open(path, "a") as f:
+            f.write(_diagnoses_rows(start, 30))
+        _assert_same_top(_top(str(path), state), _top(str(path)))
+
+
+def test_incremental_counts_wait_for_a_partial_last_line(tmp_path):
+    path, state = tmp_path / "diagnoses_icd.csv", str(tmp_path / "state.json")
+    rows = _diagnoses_rows(0, 50)
+    last_line = rows.splitlines(keepends=True)[-1]
+    path.write_text("subject_id,hadm_id,seq_num,icd_code,icd_version\n" + rows[:-len(last_line)] + last_line[:6])
+    complete = tmp_path / "complete.csv"
+    complete.write_text("subject_id,hadm_id,seq_num,icd_code,icd_version\n" + rows[:-len(last_line)])
+    _assert_same_top(_top(str(path), state), _top(str(complete)))
+
+    # The writer finishes the row; it is counted once, from its first byte
+    with open(path, "a") as f:
+        f.write(last_line[6:])
+    _assert_same_top(_top(str(path), state), _top(str(path)))
+
+
+def test_incremental_counts_rebuild_a_rewritten_file(tmp_path):
+    path, state = tmp_path / "diagnoses_icd.csv", str(tmp_path / "state.json")
+    path.write_text("subject_id,hadm_id,seq_num,icd_code,icd_version\n" + _diagnoses_rows(0, 60))
+    _top(str(path), state)
+
+    # Same size and longer, but the first rows differ: a rewrite, not an append
+    rewritten = _diagnoses_rows(1000, 60).replace("I10", "K219")
+    path.write_text("subject_id,hadm_id,seq_num,icd_code,icd_version\n" + rewritten + _diagnoses_rows(2000, 5))
+    result = _top(str(path), state)
+    _assert_same_top(result, _top(str(path)))
+    assert "I10" not in set(result["icd_code"])
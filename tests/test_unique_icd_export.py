@@ -0,0 +1,95 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import mimic_cache
+import unique_icd_export
+from analyzers import UniqueICDAnalyzer
+from unique_icd_export import export_unique_icd
+
+
+@pytest.fixture
+def diagnoses(tmp_path, monkeypatch):
+    monkeypatch.setenv(mimic_cache.CACHE_DIR_ENV, str(tmp_path / "cache"))
+    rng = np.random.default_rng(2)
+    n = 400
+    df = pd.DataFrame({
+        "subject_id": np.sort(rng.integers(10000000, 10000060, n)),
+        "hadm_id": rng.integers(20000000, 20000100, n),
+        "seq_num": rng.integers(1, 10, n),
+        "icd_code": rng.choice(["I10", "E119", "4019", "0010", "Z794", "N179", "E785"], n),
+        "icd_version": 10,
+    })
+    # Long runs of one patient span several chunks
+    df.loc[100:140, "subject_id"] = df.loc[100, "subject_id"]
+    return df
+
+
+def _write(df, path):
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+def _reference(path, tmp_path):
+    reference = tmp_path / "reference.csv"
+    UniqueICDAnalyzer(path).export_unique_icd_to_csv(str(reference))
+    return reference.read_bytes()
+
+
+@pytest.mark.parametrize("order", ["sorted", "unsorted"])
+def test_streaming_export_matches_the_in_memory_export(diagnoses, tmp_path, order, capsys):
+    df = diagnoses if order == "sorted" else diagnoses.sample(frac=1, random_state=4)
+    path = _write(df, tmp_path / f"diagnoses_icd_{order}.csv")
+    expected = _reference(path, tmp_path)
+
+    output = tmp_path / "unique.csv"
+    assert export_unique_icd(path, str(output), chunksize=13) == df["subject_id"].nunique()
+    assert output.read_bytes() == expected
+    warned = "not ordered by subject_id" in capsys.readouterr().out
+    assert warned == (order == "unsorted")
+
+    compressed = tmp_path / "unique.csv.gz"
+    export_unique_icd(path, str(compressed), chunksize=13)
+    assert gzip.decompress(compressed.read_bytes()) == expected
+
+
+def test_sorted_export_carries_patients_across_chunks(diagnoses, tmp_path, monkeypatch):
+    path = _write(diagnoses, tmp_path / "diagnoses_icd.csv")
+    # The sorted path must never fall back to the partitions
+    monkeypatch.setattr(unique_icd_export, "_iter_partitioned_groups", None)
+    output = tmp_path / "unique.csv"
+    for chunksize in (1, 13, 1000):
+        export_unique_icd(path, str(output), chunksize=chunksize)
+        assert output.read_bytes() == _reference(path, tmp_path)
+
+
+def test_explicit_partitions_and_parquet_output(diagnoses, tmp_path):
+    pytest.importorskip("pyarrow")
+    path = _write(diagnoses.sample(frac=1, random_state=9), tmp_path / "diagnoses_icd.csv")
+    expected = UniqueICDAnalyzer(path).get_unique_icd_per_patient()
+
+    output = tmp_path / "unique.parquet"
+    export_unique_icd(path, str(output), chunksize=13, partitions=5)
+    result = pd.read_parquet(output)
+    assert result["subject_id"].tolist() == expected["subject_id"].tolist()
+    assert [list(codes) for codes in result["icd_code"]] == [list(codes) for codes in expected["icd_code"]]
+    assert result["unique_icd_count"].tolist() == expected["unique_icd_count"].tolist()
+
+
+def test_incidence_npz_round_trip(diagnoses, tmp_path):
+    path = _write(diagnoses.sample(frac=1, random_state=3), tmp_path / "diagnoses_icd.csv")
+    analyzer = UniqueICDAnalyzer(path)
+    expected = analyzer.get_unique_icd_per_patient()
+    output = str(tmp_path / "icd_incidence.npz")
+    analyzer.export_incidence_npz(output)
+
+    matrix, subject_ids, icd_codes = UniqueICDAnalyzer.load_incidence_npz(output)
+    assert subject_ids.tolist() == expected["subject_id"].tolist()
+    for row, codes in enumerate(expected["icd_code"]):
+        assert sorted(icd_codes[matrix[row].indices]) == sorted(map(str, codes))
+    counts = UniqueICDAnalyzer.load_unique_icd_counts(output)
+    assert counts["subject_id"].tolist() == expected["subject_id"].tolist()
+    assert counts["unique_icd_count"].tolist() == expected["unique_icd_count"].tolist()
+    assert counts["unique_icd_count"].tolist() == np.diff(matrix.indptr).tolist()
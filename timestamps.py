@@ -0,0 +1,173 @@
+"""
+Fast parsing and caching of MIMIC timestamp columns.
+
+MIMIC writes every timestamp (admittime, dischtime, charttime, ...) in the
+fixed-width format "%Y-%m-%d %H:%M:%S". parse_timestamps reads such values
+with a vectorized fixed-width parser: the strings are viewed as a
+[rows, 19] byte matrix and the fields are computed with numpy arithmetic,
+without any per-element format inference. Only values that fail the fast
+path (other lengths, other formats, invalid dates) are sent to
+pd.to_datetime, and values that cannot be parsed become NaT.
+
+Parsed columns are int64 nanoseconds since the epoch, NaT as NAT
+(np.iinfo(np.int64).min), the representation AdmissionsEngine works with.
+
+cached_timestamps stores a parsed column as a .npy file in the mimic_cache
+directory next to the source, keyed like the Parquet cache on the source
+path, size and mtime. Repeated runs memory-map the cached column and skip
+both loading the strings and parsing them.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from mimic_cache import cache_path, cache_writable, read_table
+
+
+MIMIC_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+NAT = np.iinfo(np.int64).min
+
+_WIDTH = 19
+_SEPARATORS = {4: ord("-"), 7: ord("-"), 10: ord(" "), 13: ord(":"), 16: ord(":")}
+_MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+# Years that fit in datetime64[ns] (1677-09-21 .. 2262-04-11) in full
+_MIN_YEAR, _MAX_YEAR = 1678, 2261
+_NS_PER_SECOND = 10 ** 9
+
+
+def _days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    """Days since 1970-01-01 of proleptic Gregorian dates (H. Hinnant's algorithm), vectorized."""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def _parse_fixed_width(text: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parse an "S19" array of "YYYY-MM-DD HH:MM:SS" values.
+    Returns (ns, ok); ns is only meaningful where ok is True.
+    """
+    raw = text.view(np.uint8).reshape(len(text), _WIDTH)
+    ok = np.ones(len(text), dtype=bool)
+    for position, separator in _SEPARATORS.items():
+        ok &= raw[:, position] == separator
+
+    def number(start: int, stop: int) -> np.ndarray:
+        nonlocal ok
+        value = np.zeros(len(text), dtype=np.int64)
+        for position in range(start, stop):
+            digit = raw[:, position].astype(np.int64) - 48
+            ok &= (digit >= 0) & (digit <= 9)
+            value = value * 10 + digit
+        return value
+
+    year, month, day = number(0, 4), number(5, 7), number(8, 10)
+    hour, minute, second = number(11, 13), number(14, 16), number(17, 19)
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = _MONTH_DAYS[np.clip(month, 1, 12) - 1] + ((month == 2) & leap)
+    ok &= (
+        (year >= _MIN_YEAR) & (year <= _MAX_YEAR)
+        & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+        & (hour < 24) & (minute < 60) & (second < 60)
+    )
+
+    seconds = ((_days_from_civil(year, month, day) * 24 + hour) * 60 + minute) * 60 + second
+    return seconds * _NS_PER_SECOND, ok
+
+
+def _parse_slow(values: pd.Series) -> np.ndarray:
+    """Per-element parsing of the values the fast path rejected; failures become NAT."""
+    try:
+        parsed = pd.to_datetime(values, format="mixed", errors="coerce", utc=True)
+    except (TypeError, ValueError):
+        # pandas < 2 has no format="mixed" and infers per element by default
+        parsed = pd.to_datetime(values, errors="coerce", utc=True)
+    return parsed.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def parse_timestamps(values) -> np.ndarray:
+    """
+    Parse timestamps into int64 nanoseconds since the epoch; missing or
+    unparsable values become NAT.
+
+    Values in the MIMIC format are parsed by the vectorized fixed-width parser,
+    everything else by pd.to_datetime (values with a UTC offset are converted to UTC).
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        return values.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    result = np.full(len(values), NAT, dtype=np.int64)
+    try:
+        lengths = values.str.len()
+    except AttributeError:
+        # Not string values: everything goes to the slow path
+        lengths = pd.Series(np.nan, index=values.index)
+    # Nullable string dtypes give NA lengths for missing values. np.array copies:
+    # to_numpy may return a read-only view (pandas copy-on-write) and fast is modified below
+    fast = np.array((lengths == _WIDTH).fillna(False), dtype=bool)
+    if fast.any():
+        positions = np.flatnonzero(fast)
+        try:
+            text = values.to_numpy(dtype=object)[positions].astype(f"S{_WIDTH}")
+        except UnicodeEncodeError:
+            fast[:] = False
+        else:
+            ns, ok = _parse_fixed_width(text)
+            result[positions[ok]] = ns[ok]
+            fast[positions[~ok]] = False
+
+    slow = ~fast & values.notna().to_numpy()
+    if slow.any():
+        result[slow] = _parse_slow(values[slow])
+    return result
+
+
+def timestamp_cache_path(source_path: str, column: str) -> str:
+    """Cache file of the parsed column for the current version of source_path."""
+    return f"{cache_path(source_path)[:-len('.parquet')]}.{column}.ns.npy"
+
+
+def cached_timestamps(source_path: str, column: str, values=None) -> np.ndarray:
+    """
+    The parsed column of source_path as int64 ns, in file row order.
+
+    Loaded memory-mapped (read-only) from the cache when the source file is
+    unchanged. Otherwise the column is parsed (from values, if the caller has
+    already loaded it, else read from the source), cached and returned. When the
+    cache directory is not writable, the parsed array is returned without being
+    cached.
+    """
+    target = timestamp_cache_path(source_path, column)
+    if os.path.exists(target):
+        return np.load(target, mmap_mode="r")
+
+    if values is None:
+        values = read_table(source_path, columns=[column])[column]
+    ns = parse_timestamps(values)
+
+    directory = os.path.dirname(target)
+    if not cache_writable(directory):
+        return ns
+    # Write to a temporary file first so concurrent readers never see a partial cache
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, ns)
+    os.replace(tmp_path, target)
+
+    # Remove the cached column of older versions of the same source
+    prefix = os.path.basename(target).rsplit("-", 1)[0] + "-"
+    suffix = f".{column}.ns.npy"
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix) and name != os.path.basename(target):
+            os.remove(os.path.join(directory, name))
+    return ns
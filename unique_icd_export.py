@@ -0,0 +1,268 @@
+"""
+Streaming export of the unique ICD codes of each patient.
+
+export_unique_icd_to_csv builds the whole per-patient frame and one joined
+Python string per patient before writing. export_unique_icd reads
+diagnoses_icd in chunks instead and writes each patient's row as soon as
+the patient's group is complete, so peak memory depends on the chunk size,
+not on the number of patients.
+
+diagnoses_icd.csv of MIMIC is ordered by subject_id: the rows of the last
+patient of a chunk are carried into the next chunk, and every other patient
+is written right away. If the file turns out not to be ordered by
+subject_id, or partitions is given, the rows are first spilled to
+`partitions` temporary files by subject_id range, and every partition is
+then grouped on its own. The ranges come from one extra read of the
+subject_id column, so the partitions, written in order, still give the
+patients in subject_id order: the output is the same in both modes.
+
+Output formats, chosen by the output path:
+    .csv           - buffered text CSV, the same columns as export_unique_icd_to_csv
+    .csv.gz        - gzip compressed CSV
+    .csv.zst       - zstandard compressed CSV (requires the zstandard package)
+    .parquet       - Parquet with icd_code as a list<string> column (requires pyarrow)
+"""
+
+import csv
+import gzip
+import io
+import os
+import shutil
+import tempfile
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from mimic_cache import iter_table_chunks
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = pq = None
+
+
+EXPORT_CHUNKSIZE = 1_000_000
+WRITE_BUFFER_BYTES = 8 * 1024 * 1024
+# Smaller buffers for the partition spill files, which are all open at once
+SPILL_BUFFER_BYTES = 1024 * 1024
+DEFAULT_PARTITIONS = 16
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COLUMNS = ["subject_id", "icd_code", "unique_icd_count"]
+
+
+class NotSortedError(ValueError):
+    """The diagnoses are not ordered by subject_id."""
+
+
+def _open_text(path: str):
+    """Buffered, optionally compressed text writer for path."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", compresslevel=GZIP_LEVEL, encoding="utf-8", newline="")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("Writing .zst files requires the zstandard package (pip install zstandard)")
+        raw = open(path, "wb", buffering=WRITE_BUFFER_BYTES)
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+    return open(path, "w", buffering=WRITE_BUFFER_BYTES, encoding="utf-8", newline="")
+
+
+class _CSVPatientWriter:
+    """Writes patient groups as CSV rows: subject_id, "code, code, ...", count."""
+
+    def __init__(self, path: str):
+        self.file = _open_text(path)
+        # Line endings of DataFrame.to_csv, so the file is the same as export_unique_icd_to_csv's
+        self.writer = csv.writer(self.file, lineterminator=os.linesep)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, subject_ids: np.ndarray, offsets: np.ndarray, codes: np.ndarray):
+        counts = np.diff(offsets)
+        self.writer.writerows(
+            (subject_id, ", ".join(codes[start:stop]), count)
+            for subject_id, start, stop, count in zip(subject_ids.tolist(), offsets[:-1], offsets[1:], counts.tolist())
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetPatientWriter:
+    """Writes patient groups as Parquet rows with icd_code as a list<string> column."""
+
+    def __init__(self, path: str):
+        if pq is None:
+            raise ImportError("Parquet output requires pyarrow")
+        self.schema = pa.schema([
+            ("subject_id", pa.int64()),
+            ("icd_code", pa.list_(pa.string())),
+            ("unique_icd_count", pa.int32()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, subject_ids: np.ndarray, offsets: np.ndarray, codes: np.ndarray):
+        code_lists = pa.ListArray.from_arrays(pa.array(offsets.astype(np.int32)), pa.array(codes, type=pa.string()))
+        table = pa.Table.from_arrays(
+            [pa.array(subject_ids.astype(np.int64)), code_lists, pa.array(np.diff(offsets).astype(np.int32))],
+            schema=self.schema
+        )
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def _writer_for(path: str):
+    return _ParquetPatientWriter(path) if path.endswith(".parquet") else _CSVPatientWriter(path)
+
+
+def _unique_pairs(subject_ids: np.ndarray, codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Group (subject_id, icd_code) rows that are ordered by subject_id.
+
+    Duplicate codes of a patient are dropped, keeping the order of first appearance.
+    Returns (subject_ids, offsets, codes): the codes of subject_ids[i] are codes[offsets[i]:offsets[i + 1]].
+    """
+    pairs = pd.DataFrame({"subject_id": subject_ids, "icd_code": codes}).drop_duplicates()
+    subjects = pairs["subject_id"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, subjects[1:] != subjects[:-1]]) if len(subjects) else np.array([], dtype=np.int64)
+    offsets = np.r_[starts, len(subjects)].astype(np.int64)
+    return subjects[starts], offsets, pairs["icd_code"].to_numpy(dtype=object)
+
+
+def _clean_chunk(chunk: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """subject_id and icd_code arrays of a chunk, without rows missing either."""
+    chunk = chunk.dropna(subset=["subject_id", "icd_code"])
+    return chunk["subject_id"].to_numpy(dtype=np.int64), chunk["icd_code"].astype(str).to_numpy(dtype=object)
+
+
+def _iter_sorted_groups(chunks: Iterator[pd.DataFrame]) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yield complete patient groups from chunks ordered by subject_id.
+    The rows of the last patient of a chunk are held back until the next chunk.
+
+    Raises NotSortedError as soon as a chunk is not ordered by subject_id.
+    """
+    carry_subjects = np.array([], dtype=np.int64)
+    carry_codes = np.array([], dtype=object)
+    for chunk in chunks:
+        subjects, codes = _clean_chunk(chunk)
+        if len(subjects) == 0:
+            continue
+        if np.any(subjects[1:] < subjects[:-1]) or (len(carry_subjects) and subjects[0] < carry_subjects[0]):
+            raise NotSortedError("diagnoses are not ordered by subject_id")
+        subjects = np.concatenate([carry_subjects, subjects])
+        codes = np.concatenate([carry_codes, codes])
+
+        # Everything before the last patient of the chunk is complete
+        cut = int(np.searchsorted(subjects, subjects[-1], side="left"))
+        if cut:
+            yield _unique_pairs(subjects[:cut], codes[:cut])
+        carry_subjects, carry_codes = subjects[cut:], codes[cut:]
+    if len(carry_subjects):
+        yield _unique_pairs(carry_subjects, carry_codes)
+
+
+def _subject_range(chunks: Iterator[pd.DataFrame]) -> Tuple[int, int]:
+    """Smallest and largest subject_id of the chunks ((0, 0) without rows)."""
+    low, high = None, None
+    for chunk in chunks:
+        subjects = chunk["subject_id"].dropna().to_numpy(dtype=np.int64)
+        if len(subjects):
+            low = int(subjects.min()) if low is None else min(low, int(subjects.min()))
+            high = int(subjects.max()) if high is None else max(high, int(subjects.max()))
+    return (0, 0) if low is None else (low, high)
+
+
+def _iter_partitioned_groups(chunks: Iterator[pd.DataFrame], partitions: int, spill_dir: str,
+                             subject_range: Tuple[int, int]) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yield patient groups of unordered chunks in subject_id order: spill rows to
+    `partitions` CSV files by subject_id range, then group each partition in memory.
+    """
+    low, high = subject_range
+    spill_paths = [os.path.join(spill_dir, f"partition_{i}.csv") for i in range(partitions)]
+    spill_files = [open(path, "w", buffering=SPILL_BUFFER_BYTES, encoding="utf-8", newline="") for path in spill_paths]
+    try:
+        for chunk in chunks:
+            subjects, codes = _clean_chunk(chunk)
+            partition_ids = (subjects - low) * partitions // (high - low + 1)
+            for i in np.unique(partition_ids):
+                mask = partition_ids == i
+                csv.writer(spill_files[i]).writerows(zip(subjects[mask].tolist(), codes[mask]))
+    finally:
+        for f in spill_files:
+            f.close()
+
+    for path in spill_paths:
+        if os.path.getsize(path) == 0:
+            continue
+        part = pd.read_csv(path, header=None, names=["subject_id", "icd_code"], dtype={"icd_code": str},
+                           keep_default_na=False)
+        # A stable sort keeps each patient's codes in order of first appearance
+        part = part.sort_values("subject_id", kind="stable")
+        yield _unique_pairs(part["subject_id"].to_numpy(dtype=np.int64), part["icd_code"].to_numpy(dtype=object))
+        os.remove(path)
+
+
+def export_unique_icd(diagnoses_path: str, output_path: str, chunksize: int = EXPORT_CHUNKSIZE,
+                      partitions: Optional[int] = None) -> int:
+    """
+    Write one row per patient with its unique ICD codes to output_path, streaming.
+
+    Parameters
+    ----------
+    diagnoses_path : str
+        diagnoses_icd.csv.
+    output_path : str
+        .csv, .csv.gz, .csv.zst or .parquet file.
+    chunksize : int
+        diagnoses rows read per chunk.
+    partitions : int, optional
+        Spill to this many subject_id range partitions instead of relying on the
+        file being ordered by subject_id. Used automatically (DEFAULT_PARTITIONS)
+        when the file is found not to be ordered.
+
+    Returns
+    -------
+    int
+        Number of patients written.
+    """
+    columns = ["subject_id", "icd_code"]
+    if partitions is None:
+        writer = _writer_for(output_path)
+        patients = 0
+        try:
+            for subjects, offsets, codes in _iter_sorted_groups(iter_table_chunks(diagnoses_path, columns, chunksize)):
+                writer.write(subjects, offsets, codes)
+                patients += len(subjects)
+        except NotSortedError:
+            print("[WARN] diagnoses are not ordered by subject_id, exporting by subject_id partitions")
+            partitions = DEFAULT_PARTITIONS
+        finally:
+            writer.close()
+        if partitions is None:
+            return patients
+
+    spill_dir = tempfile.mkdtemp(prefix=".unique_icd_spill_", dir=os.path.dirname(os.path.abspath(output_path)))
+    writer = _writer_for(output_path)
+    patients = 0
+    try:
+        subject_range = _subject_range(iter_table_chunks(diagnoses_path, ["subject_id"], chunksize))
+        groups = _iter_partitioned_groups(iter_table_chunks(diagnoses_path, columns, chunksize), partitions,
+                                          spill_dir, subject_range)
+        for subjects, offsets, codes in groups:
+            writer.write(subjects, offsets, codes)
+            patients += len(subjects)
+    finally:
+        writer.close()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return patients